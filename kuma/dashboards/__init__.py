@@ -1 +1,3 @@
 PAGE_SIZE = 50
+# how many matches the user and topic lookups return at most
+LOOKUP_LIMIT = 20
@@ -0,0 +1,34 @@
+"""
+The lookups behind the typeaheads of the dashboard filters, answered from
+indexes and bounded in size, since they're requested on every keystroke.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+
+from kuma.wiki.titles import slugs
+
+from . import LOOKUP_LIMIT
+
+
+def lookup_users(term, limit=LOOKUP_LIMIT):
+    """
+    Return the first usernames starting with the given term, using the
+    index of the unique usernames.
+    """
+    return list(get_user_model().objects
+                                .filter(username__istartswith=term)
+                                .order_by('username')
+                                .values_list('username', flat=True)[:limit])
+
+
+def lookup_topics(term, locale=None, limit=LOOKUP_LIMIT):
+    """
+    Return the first distinct document slugs containing the given term, in
+    the given locale or else in any, using the in-memory slug index.
+    """
+    if locale:
+        locales = [locale] if locale in settings.MDN_LANGUAGES else []
+    else:
+        locales = settings.MDN_LANGUAGES
+    return [slug for pk, title, slug, locale in
+            slugs.search(term, locales, limit=limit, unique=True)]
@@ -1,3 +1,5 @@
+import json
+
 import pytest
 from pyquery import PyQuery as pq
 
@@ -10,6 +12,9 @@ from kuma.dashboards.forms import RevisionDashboardForm
 from kuma.spam.constants import SPAM_SUBMISSIONS_FLAG
 from kuma.users.tests import UserTestCase
 from kuma.users.models import User, UserBan
+from kuma.wiki.titles import slugs
+
+from ..lookups import lookup_topics
 
 
 @pytest.mark.dashboards
@@ -227,3 +232,33 @@ class RevisionsDashTest(UserTestCase):
         revisions = page.find('.dashboard-row')
 
         eq_(5, revisions.length)
+
+
+@pytest.mark.dashboards
+class LookupTests(UserTestCase):
+    fixtures = UserTestCase.fixtures + ['wiki/documents.json']
+
+    def setUp(self):
+        super(LookupTests, self).setUp()
+        # Forget the slugs of the documents rolled back after other tests
+        slugs.locales.clear()
+
+    def lookup(self, name, **params):
+        url = urlparams(reverse('dashboards.%s_lookup' % name,
+                                locale='en-US'), **params)
+        response = self.client.get(url, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        eq_(200, response.status_code)
+        return [match['label'] for match in json.loads(response.content)]
+
+    def test_user_lookup(self):
+        eq_(self.lookup('user', user='TestUser'),
+            ['testuser', 'testuser01', 'testuser2'])
+        eq_(self.lookup('user', user='nobody'), [])
+
+    def test_topic_lookup(self):
+        eq_(self.lookup('topic', topic='TITLE'),
+            ['article-title', 'article-title-2', 'CSS/article-title-3',
+             'le-title'])
+        eq_(self.lookup('topic', topic='title', locale='fr'), ['le-title'])
+        eq_(lookup_topics('title', limit=2),
+            ['article-title', 'article-title-2'])
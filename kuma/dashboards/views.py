@@ -1,7 +1,6 @@
 import datetime
 import json
 
-from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group
 from django.http import HttpResponse
 from django.shortcuts import render
@@ -10,9 +9,10 @@ from django.views.decorators.http import require_GET
 import waffle
 
 from kuma.core.utils import paginate
-from kuma.wiki.models import Document, Revision
+from kuma.wiki.models import Revision
 
 from .forms import RevisionDashboardForm
+from .lookups import lookup_topics, lookup_users
 from . import PAGE_SIZE
 
 
@@ -124,9 +124,8 @@ def user_lookup(request):
     if request.is_ajax():
         user = request.GET.get('user', '')
         if user:
-            matches = get_user_model().objects.filter(username__istartswith=user)
-            for match in matches:
-                userlist.append({'label': match.username})
+            userlist = [{'label': username}
+                        for username in lookup_users(user)]
 
     data = json.dumps(userlist)
     return HttpResponse(data, content_type='application/json; charset=utf-8')
@@ -140,9 +139,8 @@ def topic_lookup(request):
     if request.is_ajax():
         topic = request.GET.get('topic', '')
         if topic:
-            matches = Document.objects.filter(slug__icontains=topic)
-            for match in matches:
-                topiclist.append({'label': match.slug})
+            topiclist = [{'label': slug} for slug in
+                         lookup_topics(topic, request.GET.get('locale'))]
 
     data = json.dumps(topiclist)
     return HttpResponse(data,
@@ -12,7 +12,7 @@ def promote(modeladmin, request, queryset):
         return
     index = queryset[0]
     index.promote()
-    messages.info(request, _("Promoted search index %s.") % index)
+    messages.info(request, _("Promotion of search index %s started.") % index)
 promote.short_description = _("Promote selected search index to current index")
 
 
@@ -48,7 +48,7 @@ class IndexAdmin(admin.ModelAdmin):
                     'created_at')
     ordering = ('-created_at',)
     actions = [populate, promote, demote]
-    readonly_fields = ['promoted', 'populated']
+    readonly_fields = ['promoted', 'populated', 'reindex_checkpoint']
     list_filter = ('promoted', 'populated', 'created_at')
     form = IndexModelForm
 
@@ -6,10 +6,11 @@ from rest_framework.filters import BaseFilterBackend
 
 from kuma.wiki.search import WikiDocumentType
 
-from .models import Filter, FilterGroup
+from .jobs import AvailableFiltersJob
+from .models import Filter
 
 
-def get_filters(getter_func):
+def get_filters(getter_func, config=None):
     """
     Returns the values of all filter groups, intended to pull key/value pairs
     from requests.
@@ -20,9 +21,13 @@ def get_filters(getter_func):
 
     this will return `['css', 'html']`.
 
+    The slugs of the filter groups and the default filters are taken from
+    the given, or the cached, filter configuration.
     """
+    if config is None:
+        config = AvailableFiltersJob().get()
     filters = collections.OrderedDict()
-    for slug in FilterGroup.objects.values_list('slug', flat=True):
+    for slug in config['group_slugs']:
         for filters_slug in getter_func(slug, []):
             filters[filters_slug] = None
     if filters:
@@ -30,7 +35,24 @@ def get_filters(getter_func):
     else:
         # Given a list of [<group_slug>, <tag_slug>, <shortcut>] we only want
         # the tags.
-        return [x[1] for x in Filter.objects.default_filters()]
+        return [x[1] for x in config['default_filters']]
+
+
+def filter_clauses(serialized_filter):
+    """
+    Return the Elasticsearch filter selecting the documents of the given
+    serialized filter, which has tags, along with the one counting them.
+    """
+    filter_tags = serialized_filter['tags']
+    if len(filter_tags) > 1:
+        filter_operator = Filter.OPERATORS[serialized_filter['operator']]
+        tag_filters = [F('term', tags=filter_tag)
+                       for filter_tag in filter_tags]
+        selection = F(filter_operator, tag_filters)
+        facet = F('terms', tags=list(filter_tags))
+    else:
+        selection = facet = F('term', tags=filter_tags[0])
+    return selection.to_dict(), facet.to_dict()
 
 
 class LanguageFilterBackend(BaseFilterBackend):
@@ -164,28 +186,18 @@ class DatabaseFilterBackend(BaseFilterBackend):
 
     It then applies custom aggregations based on those database filters
     but will ignore non-raw aggregations.
+
+    The Elasticsearch filters of the database filters are compiled along
+    with the cached filter configuration, see `filter_clauses`.
     """
     def filter_queryset(self, request, queryset, view):
         active_filters = []
         active_facets = []
 
-        for serialized_filter in view.serialized_filters:
-            filter_tags = serialized_filter['tags']
-            filter_operator = Filter.OPERATORS[serialized_filter['operator']]
-            if serialized_filter['slug'] in view.selected_filters:
-                if len(filter_tags) > 1:
-                    tag_filters = []
-                    for filter_tag in filter_tags:
-                        tag_filters.append(F('term', tags=filter_tag))
-                    active_filters.append(F(filter_operator, tag_filters))
-                else:
-                    active_filters.append(F('term', tags=filter_tags[0]))
-
-            if len(filter_tags) > 1:
-                facet_params = F('terms', tags=list(filter_tags))
-            else:
-                facet_params = F('term', tags=filter_tags[0])
-            active_facets.append((serialized_filter['slug'], facet_params))
+        for slug, selection, facet in view.filter_config['clauses']:
+            if slug in view.selected_filters:
+                active_filters.append(F(selection))
+            active_facets.append((slug, facet))
 
         if active_filters:
             if len(active_filters) == 1:
@@ -194,8 +206,7 @@ class DatabaseFilterBackend(BaseFilterBackend):
                 queryset = queryset.post_filter(F('or', active_filters))
 
         for facet_slug, facet_params in active_facets:
-            queryset.aggs.bucket(facet_slug, 'filter',
-                                 **facet_params.to_dict())
+            queryset.aggs.bucket(facet_slug, 'filter', **facet_params)
 
         return queryset
 
@@ -1,14 +1,52 @@
+from django.conf import settings
+from django.utils import translation
+
 from kuma.core.jobs import KumaJob
 
 
 class AvailableFiltersJob(KumaJob):
     """
-    Cache the available search filters.
+    Cache the configuration of the search filters, to set up search requests
+    without querying the database:
+
+    ``group_slugs``
+        The slugs of the filter groups, the query parameters of the filters
+    ``default_filters``
+        The group slug, slug and shortcut of the filters applied when none
+        is chosen
+    ``filters``
+        The serialized enabled filters, with their names in the default
+        language, to be translated when shown
+    ``clauses``
+        The slug of each enabled filter with tags, along with the
+        Elasticsearch filter selecting its documents and the one counting
+        them
     """
     lifetime = 60 * 60 * 24
 
     def fetch(self, *args, **kwargs):
-        from .models import Filter
+        from .filters import filter_clauses
+        from .models import Filter, FilterGroup
+        from .serializers import FilterWithGroupSerializer
 
-        return (Filter.objects.filter(enabled=True)
-                              .prefetch_related('tags', 'group'))
+        filters = (Filter.objects.filter(enabled=True)
+                                 .prefetch_related('tags', 'group'))
+        with translation.override(settings.LANGUAGE_CODE):
+            serialized_filters = FilterWithGroupSerializer(filters,
+                                                           many=True).data
+        serialized_filters = [dict(serialized_filter,
+                                   tags=list(serialized_filter['tags']),
+                                   group=dict(serialized_filter['group']))
+                              for serialized_filter in serialized_filters]
+        clauses = []
+        for serialized_filter in serialized_filters:
+            if serialized_filter['tags']:
+                clauses.append((serialized_filter['slug'],) +
+                               filter_clauses(serialized_filter))
+        return {
+            'group_slugs': list(FilterGroup.objects.values_list('slug',
+                                                                flat=True)),
+            'default_filters': Filter.objects.default_filters(),
+            'filters': serialized_filters,
+            'clauses': clauses,
+        }
@@ -14,6 +14,16 @@ class Command(BaseCommand):
                          'slow computers with little memory'),
         make_option('-p', '--percent', type='int', dest='percent', default=100,
                     help='the percentage of the db to index (1 to 100)'),
+        make_option('-s', '--stream', action='store_true', dest='stream',
+                    default=False,
+                    help='Index the documents from this process, a window '
+                         'of chunks at a time, until done'),
+        make_option('-w', '--window', type='int', dest='window', default=4,
+                    help='How many chunks to index at once when streaming'),
+        make_option('-r', '--resume', action='store_true', dest='resume',
+                    default=False,
+                    help='Resume an interrupted streaming reindex from its '
+                         'last checkpoint'),
     )
 
     def handle(self, *args, **options):
@@ -22,7 +32,19 @@ class Command(BaseCommand):
         percent = options['percent']
         if not 1 <= percent <= 100:
             raise CommandError('percent should be between 1 and 100')
+        if options['resume'] and not options['stream']:
+            raise CommandError('only a streaming reindex can be resumed')
 
-        message = WikiDocumentType.reindex_all(options['chunk_size'],
-                                               percent=percent)
+        if options['stream']:
+            message = WikiDocumentType.reindex_stream(
+                options['chunk_size'], percent=percent,
+                window=options['window'], resume=options['resume'],
+                progress=self.progress)
+        else:
+            message = WikiDocumentType.reindex_all(options['chunk_size'],
+                                                   percent=percent)
         self.stdout.write(unicode(message) + '\n')
+
+    def progress(self, total, checkpoint):
+        self.stdout.write('Indexed %s documents, up to ID %s\n' %
+                          (total, checkpoint))
@@ -1,10 +1,20 @@
+import time
+from uuid import uuid4
+
 from django.conf import settings
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.utils import timezone
 from elasticsearch.exceptions import RequestError
 
+from kuma.core.cache import memcache
 from kuma.wiki.search import WikiDocumentType
 
 
+CURRENT_INDEX_GENERATION_CACHE_KEY = u'kuma:search:current-index-generation'
+INDEXING_QUEUE_FLUSH_CACHE_KEY = u'kuma:search:indexing-queue-flush'
+INDEXING_QUEUE_SIZE_CACHE_KEY = u'kuma:search:indexing-queue-size'
+
+
 class FilterManager(models.Manager):
     use_for_related_fields = True
 
@@ -30,7 +40,59 @@ class IndexManager(models.Manager):
     The model manager to implement a couple of useful methods for handling
     search indexes.
     """
+    # The field values of the current index as last looked up by this
+    # process, shared by its threads, along with the generation it was
+    # looked up in and when it has to be looked up again anyway.
+    _current = None
+
     def get_current(self):
+        """
+        Return the current index, looked up at most once per generation and
+        timeout in every process.
+
+        The generation is stored in memcache and changed by
+        ``invalidate_current`` whenever an index is saved, promoted,
+        demoted or deleted, so that other processes look it up again on
+        their next call.
+
+        Every call returns an instance of its own, so that callers don't
+        share one they may modify.
+        """
+        generation = self.current_generation()
+        current = IndexManager._current
+        if (generation is not None and current is not None and
+                current[0] == generation and current[1] > time.time()):
+            return self.model.from_db(self.db, current[2], current[3])
+        index = self.lookup_current()
+        names = [field.attname for field in self.model._meta.concrete_fields]
+        IndexManager._current = (
+            generation, time.time() + settings.ES_CURRENT_INDEX_TIMEOUT,
+            names, [getattr(index, name) for name in names])
+        return index
+
+    def current_generation(self):
+        """
+        Return the identifier of the current generation of indexes, which
+        changes whenever the current index may have changed.
+        """
+        generation = memcache.get(CURRENT_INDEX_GENERATION_CACHE_KEY)
+        if generation is None:
+            memcache.add(CURRENT_INDEX_GENERATION_CACHE_KEY, uuid4().hex,
+                         timeout=None)
+            generation = memcache.get(CURRENT_INDEX_GENERATION_CACHE_KEY)
+        return generation
+
+    def invalidate_current(self):
+        """
+        Make every process look up the current index again on its next call
+        of ``get_current``.
+        """
+        IndexManager._current = None
+        memcache.set(CURRENT_INDEX_GENERATION_CACHE_KEY, uuid4().hex,
+                     timeout=None)
+
+    def lookup_current(self):
+        """Return the current index, straight from the database."""
         try:
             return (self.filter(promoted=True, populated=True)
                         .order_by('-created_at'))[0]
@@ -65,3 +127,70 @@ class IndexManager(models.Manager):
             es.indices.create(index.prefixed_name, body=cls.get_settings())
         except RequestError:
             pass
+
+
+class QueuedDocumentManager(models.Manager):
+    """
+    The model manager of the queue of documents waiting to be indexed or
+    unindexed, collecting them until they're flushed in bulk.
+    """
+    def enqueue(self, index, ids, action):
+        """
+        Queue the documents with the given IDs to be indexed into or deleted
+        from the given index, with the given action, and schedule a flush
+        of the queue.
+
+        Documents which are queued already are only queued once, with the
+        latest action.
+        """
+        ids = set(ids)
+        now = timezone.now()
+        queued = self.filter(index=index, document_id__in=ids)
+        queued_ids = set(queued.values_list('document_id', flat=True))
+        if queued_ids:
+            queued.update(action=action, modified_at=now)
+        items = [self.model(index=index, document_id=document_id,
+                            action=action, created_at=now, modified_at=now)
+                 for document_id in ids - queued_ids]
+        try:
+            with transaction.atomic():
+                self.bulk_create(items)
+        except IntegrityError:
+            # Some of the documents were queued concurrently meanwhile
+            for item in items:
+                self.update_or_create(index=index,
+                                      document_id=item.document_id,
+                                      defaults={'action': action,
+                                                'modified_at': now})
+        self.schedule_flush(len(items))
+
+    def schedule_flush(self, queued=0):
+        """
+        Flush the queue right away when the given number of documents just
+        queued makes it hold enough of them, or else schedule a flush unless
+        one is scheduled already.
+
+        The documents queued since the last flush started are counted in
+        memcache rather than in the database.
+        """
+        from .tasks import flush_indexing_queue
+
+        size = queued
+        if queued:
+            memcache.add(INDEXING_QUEUE_SIZE_CACHE_KEY, 0, timeout=None)
+            try:
+                size = memcache.incr(INDEXING_QUEUE_SIZE_CACHE_KEY, queued)
+            except ValueError:
+                # The count was evicted meanwhile
+                pass
+
+        delay = settings.ES_INDEXING_QUEUE_DELAY
+        limit = settings.ES_INDEXING_QUEUE_SIZE
+        if size - queued < limit <= size:
+            # Only the documents going over the limit flush the queue, and
+            # no later flush is scheduled until this one starts.
+            memcache.set(INDEXING_QUEUE_FLUSH_CACHE_KEY, True, timeout=delay)
+            flush_indexing_queue.delay()
+        elif memcache.add(INDEXING_QUEUE_FLUSH_CACHE_KEY, True,
+                          timeout=delay):
+            flush_indexing_queue.apply_async(countdown=delay)
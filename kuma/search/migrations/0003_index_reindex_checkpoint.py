@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('search', '0002_filter_default'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='index',
+            name='reindex_checkpoint',
+            field=models.PositiveIntegerField(help_text=b'The highest document ID indexed so far by a streaming reindex in progress', null=True, blank=True),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('search', '0003_index_reindex_checkpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueuedDocument',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('document_id', models.PositiveIntegerField()),
+                ('action', models.CharField(default=b'index', max_length=6, choices=[(b'index', b'index'), (b'delete', b'delete')])),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('modified_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('index', models.ForeignKey(related_name='queued_documents', to='search.Index')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='queueddocument',
+            unique_together=set([('index', 'document_id')]),
+        ),
+    ]
@@ -2,20 +2,28 @@
 from django.conf import settings
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
-from django.db import models
+from django.db import models, transaction
+from django.db.models import BooleanField, Case, Value, When
 from django.dispatch import receiver
 from django.utils import timezone
 from django.utils.functional import cached_property
 from django.utils.text import slugify
 
+from celery import chain
 from elasticsearch.exceptions import NotFoundError
 from taggit.managers import TaggableManager
+from taggit.models import TaggedItem
 
 from kuma.core.urlresolvers import reverse
+from kuma.core.utils import chunked
 from kuma.wiki.search import WikiDocumentType
 
 from .jobs import AvailableFiltersJob
-from .managers import IndexManager, FilterManager
+from .managers import IndexManager, FilterManager, QueuedDocumentManager
+
+
+#: How many outdated documents to index per task when promoting an index
+OUTDATED_CHUNK_SIZE = 500
 
 
 class Index(models.Model):
@@ -29,6 +37,10 @@ class Index(models.Model):
                                       'the created date when left empty')
     promoted = models.BooleanField(default=False)
     populated = models.BooleanField(default=False)
+    reindex_checkpoint = models.PositiveIntegerField(
+        blank=True, null=True,
+        help_text='The highest document ID indexed so far by a streaming '
+                  'reindex in progress')
 
     objects = IndexManager()
 
@@ -74,23 +86,53 @@ class Index(models.Model):
             return OutdatedObject.objects.create(index=self.successor,
                                                  content_object=instance)
 
+    def outdated_ids(self, after=0, upto=None):
+        """
+        Return the sorted IDs of the documents outdated in this index,
+        recorded after the outdated object with the given ID, and up to the
+        one with the given ID if any.
+        """
+        outdated = self.outdated_objects.filter(pk__gt=after)
+        if upto is not None:
+            outdated = outdated.filter(pk__lte=upto)
+        return sorted(set(outdated.values_list('object_id', flat=True)))
+
+    def last_outdated(self):
+        """Return the ID of the last outdated object of this index, or 0"""
+        return self.outdated_objects.aggregate(
+            last=models.Max('pk'))['last'] or 0
+
     def promote(self):
-        from kuma.wiki.tasks import index_documents
+        """
+        Index the outdated documents into this index in chunks, and only
+        then swap this index in as the single promoted index.
 
-        # Index all outdated documents to this index.
-        outdated_ids = []
-        for outdated_object in self.outdated_objects.all():
-            instance = outdated_object.content_object
-            outdated_ids.append(instance.id)
-        if outdated_ids:
-            index_documents.delay(outdated_ids, self.pk)
-        # Clear outdated.
-        self.outdated_objects.all().delete()
-        # Promote this index.
+        Searches keep using the former index until the swap.
+        """
+        from kuma.wiki.tasks import index_documents
+        from .tasks import promote_index
+
+        last_outdated = self.last_outdated()
+        tasks = [index_documents.si(ids, self.pk)
+                 for ids in chunked(self.outdated_ids(upto=last_outdated),
+                                    OUTDATED_CHUNK_SIZE)]
+        tasks.append(promote_index.si(self.pk, last_outdated))
+        chain(*tasks).apply_async()
+
+    def swap_promoted(self, last_outdated):
+        """
+        Promote this index and demote all others in a single update, and
+        clear the outdated documents indexed already, up to the outdated
+        object with the given ID.
+        """
+        with transaction.atomic():
+            self.outdated_objects.filter(pk__lte=last_outdated).delete()
+            Index.objects.update(promoted=Case(
+                When(pk=self.pk, then=Value(True)),
+                default=Value(False),
+                output_field=BooleanField()))
         self.promoted = True
-        self.save()
-        # Allow only a single index to be promoted.
-        Index.objects.exclude(pk=self.pk).update(promoted=False)
+        Index.objects.invalidate_current()
 
     def demote(self):
         self.promoted = False
@@ -105,6 +147,14 @@ def delete_index(**kwargs):
         index.delete_if_exists()
 
 
+@receiver(models.signals.post_save,
+          sender=Index, dispatch_uid='search.index.save.invalidate')
+@receiver(models.signals.post_delete,
+          sender=Index, dispatch_uid='search.index.delete.invalidate')
+def invalidate_current_index(**kwargs):
+    Index.objects.invalidate_current()
+
+
 class OutdatedObject(models.Model):
     index = models.ForeignKey(Index, related_name='outdated_objects')
     created_at = models.DateTimeField(default=timezone.now)
@@ -113,6 +163,32 @@ class OutdatedObject(models.Model):
     content_object = GenericForeignKey('content_type', 'object_id')
 
 
+class QueuedDocument(models.Model):
+    """
+    A wiki document waiting for the next flush of the indexing queue to be
+    indexed into, or deleted from, a search index.
+    """
+    ACTION_INDEX = 'index'
+    ACTION_DELETE = 'delete'
+    ACTION_CHOICES = (
+        (ACTION_INDEX, ACTION_INDEX),
+        (ACTION_DELETE, ACTION_DELETE),
+    )
+    index = models.ForeignKey(Index, related_name='queued_documents')
+    document_id = models.PositiveIntegerField()
+    action = models.CharField(max_length=6, choices=ACTION_CHOICES,
+                              default=ACTION_INDEX)
+    created_at = models.DateTimeField(default=timezone.now)
+    modified_at = models.DateTimeField(default=timezone.now)
+
+    objects = QueuedDocumentManager()
+
+    class Meta:
+        unique_together = (
+            ('index', 'document_id'),
+        )
+
+
 class FilterGroup(models.Model):
     """
     A way to group different kinds of filters from each other.
@@ -205,6 +281,17 @@ class Filter(models.Model):
 
 
 @receiver(models.signals.post_save, sender=Filter)
-@receiver(models.signals.pre_delete, sender=Filter)
+@receiver(models.signals.post_delete, sender=Filter)
+@receiver(models.signals.post_save, sender=FilterGroup)
+@receiver(models.signals.post_delete, sender=FilterGroup)
 def invalidate_filter_cache(sender, instance, **kwargs):
     AvailableFiltersJob().invalidate()
+
+
+@receiver(models.signals.post_save, sender=TaggedItem)
+@receiver(models.signals.post_delete, sender=TaggedItem)
+def invalidate_filter_tags_cache(sender, instance, **kwargs):
+    """The tags of filters are saved after the filters themselves"""
+    filter_type = ContentType.objects.get_for_model(Filter)
+    if instance.content_type_id == filter_type.id:
+        AvailableFiltersJob().invalidate()
@@ -1,3 +1,5 @@
+import time
+
 from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
 
 
@@ -37,8 +39,16 @@ class SearchPaginator(Paginator):
         # Force the search to evaluate and then attach the count. We want to
         # avoid an extra useless query even if there are no results, so we
         # directly fetch the count from hits.
-        result = self.object_list[bottom:top].execute()
+        search = self.object_list[bottom:top]
+        started = time.time()
+        result = search.execute()
+        round_trip = time.time() - started
         page = Page(result.hits, number, self)
+        # Keep the search and its timings, in seconds and in milliseconds as
+        # reported by Elasticsearch, for the search stats.
+        page.search = search
+        page.round_trip = round_trip
+        page.took = result.took
         # Update the `_count`.
         self._count = page.object_list.total
         # Also store the aggregations, if any.
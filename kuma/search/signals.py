@@ -12,8 +12,7 @@ def render_done_handler(**kwargs):
     if not settings.ES_LIVE_INDEX or 'instance' not in kwargs:
         return
 
-    from kuma.wiki.tasks import index_documents
-    from .models import Index
+    from .models import Index, QueuedDocument
 
     doc = kwargs['instance']
     if WikiDocumentType.should_update(doc):
@@ -25,9 +24,10 @@ def render_done_handler(**kwargs):
         doc_pks = set(doc.other_translations.values_list('pk', flat=True))
         doc_pks.add(doc.id)
         try:
-            index_documents.delay(list(doc_pks), current_index.pk)
+            QueuedDocument.objects.enqueue(current_index, doc_pks,
+                                           QueuedDocument.ACTION_INDEX)
         except Exception:
-            log.error('Search indexing task failed', exc_info=True)
+            log.error('Queueing search indexing failed', exc_info=True)
     else:
         log.info('Ignoring wiki document %r while updating search index',
                  doc.id, exc_info=True)
@@ -37,14 +37,14 @@ def pre_delete_handler(**kwargs):
     if not settings.ES_LIVE_INDEX or 'instance' not in kwargs:
         return
 
-    from kuma.wiki.tasks import unindex_documents
-    from .models import Index
+    from .models import Index, QueuedDocument
 
     doc = kwargs['instance']
     current_index = Index.objects.get_current()
 
     if WikiDocumentType.should_update(doc):
-        unindex_documents.delay([doc.pk], current_index.pk)
+        QueuedDocument.objects.enqueue(current_index, [doc.pk],
+                                       QueuedDocument.ACTION_DELETE)
     else:
         log.info('Ignoring wiki document %r while updating search index',
                  doc.pk, exc_info=True)
@@ -0,0 +1,127 @@
+"""
+Timing of search requests: how long each filter backend takes to build the
+query, the round trip to Elasticsearch and the time it reports having taken,
+the serialization of the results, and how many results were found.
+
+The timings of every search are exported as histograms through the sink
+named by the ``SEARCH_STATS_SINK`` setting, and the searches slower than
+``SEARCH_SLOW_QUERY_THRESHOLD`` seconds are logged with their query.
+"""
+import json
+import logging
+import time
+from bisect import bisect_left
+from collections import Counter, OrderedDict, defaultdict
+from contextlib import contextmanager
+
+import newrelic.agent
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+log = logging.getLogger('kuma.search.slow')
+
+#: The upper bounds, in seconds, of the buckets of the histograms
+HISTOGRAM_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_sinks = {}
+
+
+def bucket(seconds):
+    """Return the label of the histogram bucket of the given duration"""
+    index = bisect_left(HISTOGRAM_BUCKETS, seconds)
+    if index == len(HISTOGRAM_BUCKETS):
+        return '>%gs' % HISTOGRAM_BUCKETS[-1]
+    return '<=%gs' % HISTOGRAM_BUCKETS[index]
+
+
+def get_sink():
+    """Return the sink named by the ``SEARCH_STATS_SINK`` setting"""
+    path = settings.SEARCH_STATS_SINK
+    sink = _sinks.get(path)
+    if sink is None:
+        sink = _sinks[path] = import_string(path)()
+    return sink
+
+
+class NewRelicSink(object):
+    """
+    Record every timing as a New Relic custom metric, along with a count in
+    the bucket of its histogram, e.g. ``Custom/Search/Took/<=0.05s``.
+    """
+    prefix = 'Custom/Search/'
+
+    def timing(self, name, seconds):
+        newrelic.agent.record_custom_metric(self.prefix + name, seconds)
+        newrelic.agent.record_custom_metric(
+            '%s%s/%s' % (self.prefix, name, bucket(seconds)), 1)
+
+    def count(self, name, value):
+        newrelic.agent.record_custom_metric(self.prefix + name, value)
+
+
+class MemorySink(object):
+    """Keep the timings and their histograms in memory, e.g. for tests"""
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.timings = defaultdict(list)
+        self.histograms = defaultdict(Counter)
+        self.counts = defaultdict(list)
+
+    def timing(self, name, seconds):
+        self.timings[name].append(seconds)
+        self.histograms[name][bucket(seconds)] += 1
+
+    def count(self, name, value):
+        self.counts[name].append(value)
+
+
+class SearchStats(object):
+    """The timings of a search request"""
+
+    def __init__(self, url):
+        self.url = url
+        self.started = time.time()
+        self.timings = OrderedDict()
+        self.took = self.count = self.search = None
+
+    @contextmanager
+    def timer(self, name):
+        started = time.time()
+        try:
+            yield
+        finally:
+            self.timings[name] = (self.timings.get(name, 0) +
+                                  time.time() - started)
+
+    def record_page(self, page):
+        """Record the round trip, took and count of a SearchPaginator page"""
+        self.timings['RoundTrip'] = page.round_trip
+        self.took = page.took / 1000.0
+        self.count = page.paginator.count
+        self.search = page.search
+
+    def report(self):
+        """Export the timings to the sink, and log the search if slow."""
+        total = time.time() - self.started
+        sink = get_sink()
+        for name, seconds in self.timings.items():
+            sink.timing(name, seconds)
+        sink.timing('Total', total)
+        if self.took is not None:
+            sink.timing('Took', self.took)
+        if self.count is not None:
+            sink.count('Results', self.count)
+
+        if total >= settings.SEARCH_SLOW_QUERY_THRESHOLD:
+            timings = u', '.join(u'%s %.3fs' % (name, seconds)
+                                 for name, seconds in self.timings.items())
+            body = (json.dumps(self.search.to_dict(), sort_keys=True)
+                    if self.search is not None else None)
+            log.warning(u'Slow search %s: %.3fs (took %s, %s), %s results, '
+                        u'query %s', self.url, total,
+                        None if self.took is None else '%.3fs' % self.took,
+                        timings, self.count, body)
@@ -1,12 +1,22 @@
 import logging
+from collections import defaultdict
 
+import newrelic.agent
 from django.conf import settings
 from django.core.mail import mail_admins
+from django.utils import timezone
 
 from celery.task import task
 
+from kuma.core.cache import memcache
+from kuma.core.utils import MemcacheLock, MemcacheLockException, chunked
+
+from .managers import (INDEXING_QUEUE_FLUSH_CACHE_KEY,
+                       INDEXING_QUEUE_SIZE_CACHE_KEY)
+
 
 log = logging.getLogger('kuma.search.tasks')
+flush_lock = MemcacheLock('search-indexing-queue-flush-lock', expires=60 * 10)
 
 
 @task
@@ -80,3 +90,104 @@ def finalize_index(index_pk):
     subject = 'Index %s completely populated' % index.prefixed_name
     message = 'You may want to promote it now via the admin interface.'
     mail_admins(subject=subject, message=message)
+
+
+@task
+def promote_index(index_pk, last_outdated):
+    """
+    Swap in the given index as the promoted one, once the documents it had
+    outdated up to the outdated object with the given ID are indexed.
+
+    :arg index_pk: The `Index` ID to promote.
+    :arg last_outdated: The ID of the last outdated object indexed already.
+
+    Documents outdated meanwhile are indexed right before the swap, and
+    the ones outdated during that catch-up right after it, since they were
+    indexed into the former index only.
+
+    """
+    from kuma.wiki.tasks import index_documents
+    from kuma.search.models import Index, OUTDATED_CHUNK_SIZE
+
+    index = Index.objects.get(pk=index_pk)
+
+    def index_outdated(after, upto):
+        for ids in chunked(index.outdated_ids(after=after, upto=upto),
+                           OUTDATED_CHUNK_SIZE):
+            index_documents(ids, index.pk)
+
+    caught_up = index.last_outdated()
+    index_outdated(last_outdated, caught_up)
+    index.swap_promoted(caught_up)
+
+    last_outdated, caught_up = caught_up, index.last_outdated()
+    if caught_up > last_outdated:
+        index_outdated(last_outdated, caught_up)
+        index.outdated_objects.filter(pk__lte=caught_up).delete()
+
+
+@task
+def flush_indexing_queue():
+    """
+    Index and unindex the queued documents in bulk, in chunks of up to
+    ``ES_INDEXING_QUEUE_SIZE`` documents.
+
+    Documents queued again while they're flushed stay queued for the next
+    flush, which is scheduled when any are left. So do the documents of a
+    batch which failed to be indexed or unindexed, to be retried then.
+    """
+    from kuma.wiki.tasks import index_documents, unindex_documents
+    from kuma.search.models import QueuedDocument
+
+    # Let the next queued document schedule another flush.
+    memcache.delete(INDEXING_QUEUE_FLUSH_CACHE_KEY)
+    try:
+        flush_lock.acquire()
+    except MemcacheLockException:
+        # The flush in progress will schedule another one for the rest.
+        return
+    # Count the documents queued from now on towards the next flush.
+    memcache.set(INDEXING_QUEUE_SIZE_CACHE_KEY, 0, timeout=None)
+
+    try:
+        started = timezone.now()
+        due = (QueuedDocument.objects.filter(modified_at__lte=started)
+                                     .order_by('pk'))
+        last_pk = 0
+        while True:
+            queued = list(due.filter(pk__gt=last_pk)
+                             [:settings.ES_INDEXING_QUEUE_SIZE])
+            if not queued:
+                break
+            last_pk = queued[-1].pk
+            batches = defaultdict(list)
+            for item in queued:
+                batches[(item.index_id, item.action)].append(item)
+            flushed = []
+            for (index_pk, action), items in batches.items():
+                ids = [item.document_id for item in items]
+                try:
+                    if action == QueuedDocument.ACTION_DELETE:
+                        unindex_documents(ids, index_pk)
+                    else:
+                        index_documents(ids, index_pk)
+                except Exception:
+                    log.exception('Unable to %s queued documents %r',
+                                  action, ids)
+                else:
+                    flushed.extend(item.pk for item in items)
+            due.filter(pk__in=flushed).delete()
+
+            lag = (timezone.now() -
+                   min(item.created_at for item in queued)).total_seconds()
+            log.info('Flushed %s of %s queued documents, the oldest queued '
+                     '%.1fs before', len(flushed), len(queued), lag)
+            newrelic.agent.record_custom_metric(
+                'Custom/Search/IndexingQueue/FlushSize', len(flushed))
+            newrelic.agent.record_custom_metric(
+                'Custom/Search/IndexingQueue/Lag', lag)
+    finally:
+        flush_lock.release()
+
+    if QueuedDocument.objects.exists():
+        QueuedDocument.objects.schedule_flush()
@@ -1,9 +1,11 @@
 from __future__ import absolute_import
 
+import json
 import time
 
 from django.conf import settings
 
+from elasticsearch import Connection, Elasticsearch
 from elasticsearch_dsl.connections import connections
 from elasticsearch.exceptions import ConnectionError
 from rest_framework.test import APIRequestFactory
@@ -14,6 +16,7 @@ from kuma.core.urlresolvers import reset_url_prefixer
 from kuma.users.tests import UserTestCase
 from kuma.wiki.search import WikiDocumentType
 
+from ..jobs import AvailableFiltersJob
 from ..models import Index
 
 
@@ -23,6 +26,34 @@ class LocalizingAPIRequestFactory(LocalizingMixin, APIRequestFactory):
 factory = LocalizingAPIRequestFactory()
 
 
+class FakeConnection(Connection):
+    """
+    A connection to Elasticsearch answering every request with the given
+    response, and keeping the requests, to test searches offline.
+    """
+    def __init__(self, response=None, **kwargs):
+        super(FakeConnection, self).__init__(**kwargs)
+        self.response = response or {}
+        self.requests = []
+
+    def perform_request(self, method, url, params=None, body=None,
+                        timeout=None, ignore=()):
+        self.requests.append((method, url, body))
+        return 200, {}, json.dumps(self.response)
+
+
+def fake_elasticsearch(took=1, total=0, hits=(), aggregations=None):
+    """Return a client to a fake Elasticsearch with the given results"""
+    response = {
+        'took': took,
+        'timed_out': False,
+        '_shards': {'total': 1, 'successful': 1, 'failed': 0},
+        'hits': {'total': total, 'max_score': None, 'hits': list(hits)},
+        'aggregations': aggregations or {},
+    }
+    return Elasticsearch(connection_class=FakeConnection, response=response)
+
+
 class ElasticTestCase(UserTestCase):
     """Base class for Elastic Search tests, providing some conveniences"""
 
@@ -64,6 +95,10 @@ class ElasticTestCase(UserTestCase):
 
     def setUp(self):
         super(ElasticTestCase, self).setUp()
+        # The current index of a previous test is rolled back with it
+        Index.objects.invalidate_current()
+        # So are the filters
+        AvailableFiltersJob().delete()
         self.setup_indexes()
 
     def tearDown(self):
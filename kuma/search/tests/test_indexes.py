@@ -22,6 +22,15 @@ class TestIndexes(ElasticTestCase):
         eq_(Index.objects.get_current().prefixed_name,
             '%s-main_index' % settings.ES_INDEX_PREFIX)
 
+    def test_get_current_copies(self):
+        """Every caller gets an instance of its own of the current index"""
+        index1 = Index.objects.get_current()
+        index2 = Index.objects.get_current()
+        ok_(index1 is not index2)
+        eq_(index1.pk, index2.pk)
+        index2.name = 'changed'
+        eq_(index1.name, Index.objects.get_current().name)
+
     def _reload(self, index):
         return Index.objects.get(pk=index.pk)
 
@@ -39,6 +48,7 @@ class TestIndexes(ElasticTestCase):
         index = self._reload(index)
         ok_(index.populated)
         index.promote()
+        index = self._reload(index)
         ok_(index.promoted)
 
         eq_(Index.objects.get_current().prefixed_name, index.prefixed_name)
@@ -54,6 +64,7 @@ class TestIndexes(ElasticTestCase):
         index2 = Index.objects.create(name='second')
         index2.promote()
         index1 = self._reload(index1)
+        index2 = self._reload(index2)
         ok_(index2.promoted)
         ok_(not index1.promoted)
 
@@ -92,6 +103,44 @@ class TestIndexes(ElasticTestCase):
             .query('match', title='outdated').execute()[0].slug,
             'test-outdated')
 
+    def test_stream_index(self):
+        index = Index.objects.create()
+        progress = []
+        WikiDocumentType.reindex_stream(chunk_size=2, index=index, window=2,
+                                        progress=lambda *args:
+                                        progress.append(args))
+        index = self._reload(index)
+        ok_(index.populated)
+        eq_(None, index.reindex_checkpoint)
+
+        indexable = sorted(WikiDocumentType.get_indexable())
+        eq_((len(indexable), indexable[-1]), progress[-1])
+        self.refresh(index=index.prefixed_name)
+        S = WikiDocumentType.search
+        eq_(len(indexable), S(index=index.prefixed_name).count())
+        index.delete()
+
+    def test_stream_index_resume(self):
+        index = Index.objects.create()
+        indexable = sorted(WikiDocumentType.get_indexable())
+        WikiDocumentType.reindex_stream(chunk_size=2, index=index)
+        S = WikiDocumentType.search
+        WikiDocumentType.bulk_delete(indexable[2:], index=index.prefixed_name)
+
+        # An interrupted reindex indexes the documents after its checkpoint.
+        Index.objects.filter(pk=index.pk).update(
+            reindex_checkpoint=indexable[1])
+        index = self._reload(index)
+        progress = []
+        WikiDocumentType.reindex_stream(chunk_size=2, index=index,
+                                        resume=True,
+                                        progress=lambda *args:
+                                        progress.append(args))
+        eq_(len(indexable) - 2, progress[-1][0])
+        self.refresh(index=index.prefixed_name)
+        eq_(len(indexable), S(index=index.prefixed_name).count())
+        index.delete()
+
     def test_delete_index(self):
         # first create and populate the index
         index = Index.objects.create()
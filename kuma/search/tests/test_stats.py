@@ -0,0 +1,85 @@
+import json
+
+import mock
+from django.test import override_settings
+from elasticsearch_dsl import Search
+from elasticsearch_dsl.connections import connections
+
+from kuma.core.tests import KumaTestCase, eq_, ok_
+
+from . import fake_elasticsearch
+from ..paginator import SearchPaginator
+from ..stats import bucket, get_sink
+
+
+class PaginatorStatsTests(KumaTestCase):
+
+    def test_page_timings(self):
+        es = fake_elasticsearch(took=42, total=25)
+        paginator = SearchPaginator(Search(using=es, index='test'), 10)
+        page = paginator.page(2)
+        eq_(page.took, 42)
+        ok_(page.round_trip >= 0)
+        eq_(paginator.count, 25)
+        eq_(page.search.to_dict(), {'query': {'match_all': {}},
+                                    'from': 10, 'size': 10})
+        method, url, body = es.transport.get_connection().requests[0]
+        eq_(json.loads(body), page.search.to_dict())
+
+
+@override_settings(SEARCH_STATS_SINK='kuma.search.stats.MemorySink',
+                   SEARCH_RESULTS_CACHE_TIMEOUT=0)
+class SearchStatsTests(KumaTestCase):
+    fixtures = ['search/filters.json']
+
+    def setUp(self):
+        super(SearchStatsTests, self).setUp()
+        self.sink = get_sink()
+        self.sink.clear()
+
+    def search(self, es, url='/en-US/search?q=article&format=json'):
+        with mock.patch.object(connections, 'get_connection',
+                               return_value=es):
+            response = self.client.get(url)
+        eq_(response.status_code, 200)
+        return response
+
+    def test_histograms(self):
+        es = fake_elasticsearch(took=42, total=3)
+        self.search(es)
+        self.search(es)
+        eq_(self.sink.counts['Results'], [3, 3])
+        eq_(self.sink.timings['Took'], [0.042, 0.042])
+        eq_(dict(self.sink.histograms['Took']), {'<=0.05s': 2})
+        for name in ('Total', 'RoundTrip', 'Serialization',
+                     'FilterBackend/SearchQueryBackend',
+                     'FilterBackend/AdvancedSearchQueryBackend',
+                     'FilterBackend/DatabaseFilterBackend',
+                     'FilterBackend/LanguageFilterBackend',
+                     'FilterBackend/HighlightFilterBackend'):
+            eq_(len(self.sink.timings[name]), 2)
+            eq_(sum(self.sink.histograms[name].values()), 2)
+
+    def test_buckets(self):
+        eq_(bucket(0), '<=0.01s')
+        eq_(bucket(0.05), '<=0.05s')
+        eq_(bucket(0.3), '<=0.5s')
+        eq_(bucket(60), '>10s')
+
+    @mock.patch('kuma.search.stats.log')
+    def test_slow_query_log(self, log):
+        es = fake_elasticsearch(took=1500, total=3)
+        with override_settings(SEARCH_SLOW_QUERY_THRESHOLD=60):
+            self.search(es)
+        ok_(not log.warning.called)
+
+        with override_settings(SEARCH_SLOW_QUERY_THRESHOLD=0):
+            self.search(es)
+        eq_(log.warning.call_count, 1)
+        args = log.warning.call_args[0]
+        ok_('/en-US/search?q=article' in args[1])
+        eq_(args[3], '1.500s')
+        eq_(args[5], 3)
+        # The logged query is the one sent to Elasticsearch
+        method, url, body = es.transport.get_connection().requests[-1]
+        eq_(json.loads(args[6]), json.loads(body))
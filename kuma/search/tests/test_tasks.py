@@ -1,9 +1,18 @@
-from kuma.core.tests import eq_
+import mock
+from django.contrib.contenttypes.models import ContentType
+
+from kuma.core.cache import memcache
+from kuma.core.tests import eq_, ok_
+from kuma.users.tests import UserTestCase
+from kuma.wiki.models import Document
 from kuma.wiki.search import WikiDocumentType
 from kuma.wiki.tests import revision
 
 from . import ElasticTestCase
-from ..models import Index
+from ..managers import (INDEXING_QUEUE_FLUSH_CACHE_KEY,
+                        INDEXING_QUEUE_SIZE_CACHE_KEY)
+from ..models import Index, OutdatedObject, QueuedDocument
+from ..tasks import flush_indexing_queue, promote_index
 
 
 class TestLiveIndexing(ElasticTestCase):
@@ -28,3 +37,125 @@ class TestLiveIndexing(ElasticTestCase):
         # TODO: Investigate this test failure. The ES debug output appears to
         # be doing the correct thing but the ES delete call is returning a 404.
         eq_(count_before, S().count())
+
+
+class TestIndexingQueue(UserTestCase):
+
+    def setUp(self):
+        super(TestIndexingQueue, self).setUp()
+        memcache.delete_many([INDEXING_QUEUE_FLUSH_CACHE_KEY,
+                              INDEXING_QUEUE_SIZE_CACHE_KEY])
+        self.index = Index.objects.create(promoted=True, populated=True)
+
+    @mock.patch('kuma.search.tasks.flush_indexing_queue.apply_async')
+    def test_enqueue(self, apply_async):
+        enqueue = QueuedDocument.objects.enqueue
+        enqueue(self.index, [1, 2], QueuedDocument.ACTION_INDEX)
+        enqueue(self.index, [2, 3], QueuedDocument.ACTION_INDEX)
+        enqueue(self.index, [3], QueuedDocument.ACTION_DELETE)
+
+        # Queued once, with the latest action, and flushed once
+        queued = (QueuedDocument.objects.order_by('document_id')
+                                        .values_list('document_id', 'action'))
+        eq_(list(queued), [(1, 'index'), (2, 'index'), (3, 'delete')])
+        eq_(apply_async.call_count, 1)
+
+    @mock.patch('kuma.search.tasks.flush_indexing_queue.delay')
+    @mock.patch('kuma.search.tasks.flush_indexing_queue.apply_async')
+    def test_enqueue_full(self, apply_async, delay):
+        enqueue = QueuedDocument.objects.enqueue
+        with self.settings(ES_INDEXING_QUEUE_SIZE=3):
+            enqueue(self.index, [1, 2], QueuedDocument.ACTION_INDEX)
+            eq_(apply_async.call_count, 1)
+            eq_(delay.call_count, 0)
+            # Going over the limit flushes the queue right away, once
+            enqueue(self.index, [3, 4], QueuedDocument.ACTION_INDEX)
+            enqueue(self.index, [5], QueuedDocument.ACTION_INDEX)
+            eq_(delay.call_count, 1)
+            eq_(apply_async.call_count, 1)
+
+    @mock.patch('kuma.wiki.tasks.unindex_documents')
+    @mock.patch('kuma.wiki.tasks.index_documents')
+    def test_flush(self, index_documents, unindex_documents):
+        for document_id in (1, 2, 3):
+            QueuedDocument.objects.create(index=self.index,
+                                          document_id=document_id)
+        QueuedDocument.objects.create(index=self.index, document_id=4,
+                                      action=QueuedDocument.ACTION_DELETE)
+        with self.settings(ES_INDEXING_QUEUE_SIZE=3):
+            flush_indexing_queue()
+
+        eq_(index_documents.call_args_list,
+            [mock.call([1, 2, 3], self.index.pk)])
+        eq_(unindex_documents.call_args_list,
+            [mock.call([4], self.index.pk)])
+        eq_(QueuedDocument.objects.count(), 0)
+
+    @mock.patch('kuma.search.tasks.flush_indexing_queue.apply_async')
+    @mock.patch('kuma.wiki.tasks.unindex_documents')
+    @mock.patch('kuma.wiki.tasks.index_documents')
+    def test_flush_failure(self, index_documents, unindex_documents,
+                           apply_async):
+        index_documents.side_effect = Exception('Elasticsearch is down')
+        for document_id in (1, 2):
+            QueuedDocument.objects.create(index=self.index,
+                                          document_id=document_id)
+        QueuedDocument.objects.create(index=self.index, document_id=3,
+                                      action=QueuedDocument.ACTION_DELETE)
+        flush_indexing_queue()
+
+        # The failed batch stays queued for the next flush
+        eq_(unindex_documents.call_args_list,
+            [mock.call([3], self.index.pk)])
+        queued = (QueuedDocument.objects.order_by('document_id')
+                                        .values_list('document_id', flat=True))
+        eq_(list(queued), [1, 2])
+        eq_(apply_async.call_count, 1)
+
+
+class TestPromotion(UserTestCase):
+
+    @mock.patch('kuma.search.models.OUTDATED_CHUNK_SIZE', 2)
+    @mock.patch.object(WikiDocumentType, 'get_indexing_queryset',
+                       return_value=[])
+    def test_promote_outdated(self, get_indexing_queryset):
+        current = Index.objects.create(promoted=True, populated=True)
+        successor = Index.objects.create(populated=True)
+        content_type = ContentType.objects.get_for_model(Document)
+        for object_id in (3, 1, 2, 3):
+            OutdatedObject.objects.create(index=successor,
+                                          content_type=content_type,
+                                          object_id=object_id)
+        successor.promote()
+
+        # Each outdated document is indexed once, in chunks
+        eq_(get_indexing_queryset.call_args_list,
+            [mock.call([1, 2]), mock.call([3])])
+        eq_(successor.outdated_objects.count(), 0)
+        eq_(list(Index.objects.filter(promoted=True)), [successor])
+        eq_(Index.objects.get_current(), successor)
+        ok_(not Index.objects.get(pk=current.pk).promoted)
+
+    @mock.patch.object(WikiDocumentType, 'get_indexing_queryset')
+    def test_promote_outdated_meanwhile(self, get_indexing_queryset):
+        Index.objects.create(promoted=True, populated=True)
+        successor = Index.objects.create(populated=True)
+        content_type = ContentType.objects.get_for_model(Document)
+        OutdatedObject.objects.create(index=successor,
+                                      content_type=content_type,
+                                      object_id=1)
+
+        def outdate(ids):
+            # A document is outdated while the others are caught up with
+            if ids == [1]:
+                OutdatedObject.objects.create(index=successor,
+                                              content_type=content_type,
+                                              object_id=2)
+            return []
+        get_indexing_queryset.side_effect = outdate
+
+        promote_index(successor.pk, 0)
+        eq_(get_indexing_queryset.call_args_list,
+            [mock.call([1]), mock.call([2])])
+        eq_(successor.outdated_objects.count(), 0)
+        ok_(Index.objects.get(pk=successor.pk).promoted)
@@ -1,8 +1,10 @@
 from elasticsearch_dsl import query
 
 from kuma.core.tests import eq_, ok_
-from kuma.wiki.models import Document
+from kuma.users.tests import UserTestCase
+from kuma.wiki.models import Document, DocumentZone
 from kuma.wiki.search import WikiDocumentType
+from kuma.wiki.tests import revision, translated_revision
 
 from . import ElasticTestCase
 
@@ -46,3 +48,61 @@ class WikiDocumentTypeTests(ElasticTestCase):
     def test_hidden_slugs_should_update(self):
         jezdez_doc = Document.objects.get(slug='User:jezdez')
         eq_(WikiDocumentType.should_update(jezdez_doc), False)
+
+
+class WikiDocumentSerializationTests(UserTestCase):
+
+    def test_from_django_prefetched(self):
+        """A chunk of documents is serialized in a constant number of
+        queries, with their tags, zones and parents."""
+        zone_rev = revision(title='Zone', slug='Zone', is_approved=True,
+                            tags='"foo", "bar"', save=True)
+        DocumentZone.objects.create(document=zone_rev.document)
+        translation = translated_revision(is_approved=True, save=True)
+        plain_rev = revision(title='Plain', slug='Plain/Page',
+                             is_approved=True, save=True)
+        ids = [zone_rev.document.pk, translation.document.pk,
+               plain_rev.document.pk]
+        for doc in Document.objects.filter(pk__in=ids):
+            # Fill the rendered content, cached fields and macro names
+            # beforehand.
+            doc.rendered_html = doc.html
+            doc.get_summary_text()
+            doc.get_macro_names()
+            doc.save()
+
+        with self.assertNumQueries(2):
+            serialized = dict(
+                (obj.id, WikiDocumentType.from_django(obj))
+                for obj in WikiDocumentType.get_indexing_queryset(ids))
+
+        zone_doc = serialized[zone_rev.document.pk]
+        eq_(8.0, zone_doc['boost'])
+        eq_(['bar', 'foo'], sorted(zone_doc['tags']))
+        eq_({}, zone_doc['parent'])
+        eq_(translation.document.parent.pk,
+            serialized[translation.document.pk]['parent']['id'])
+        eq_(4.0, serialized[plain_rev.document.pk]['boost'])
+        ok_('Some content' in serialized[plain_rev.document.pk]['content'])
+
+    def test_get_indexable_chunks(self):
+        """The IDs come in ascending chunks, with the highest ID each covers,
+        sampled by ID modulo 100 with a percent."""
+        for i in range(5):
+            revision(title='Chunked %s' % i, slug='Chunked_%s' % i,
+                     is_approved=True, save=True)
+        indexable = sorted(WikiDocumentType.get_indexable())
+
+        chunks = list(WikiDocumentType.get_indexable_chunks(2))
+        eq_(indexable, [pk for chunk, _ in chunks for pk in chunk])
+        ok_(all(len(chunk) <= 2 for chunk, _ in chunks))
+        eq_([chunk[-1] for chunk, _ in chunks],
+            [after for _, after in chunks])
+
+        chunks = list(WikiDocumentType.get_indexable_chunks(
+            2, after=indexable[1]))
+        eq_(indexable[2:], [pk for chunk, _ in chunks for pk in chunk])
+
+        chunks = list(WikiDocumentType.get_indexable_chunks(2, percent=50))
+        eq_([pk for pk in indexable if pk % 100 < 50],
+            [pk for chunk, _ in chunks for pk in chunk])
@@ -1,8 +1,16 @@
 # -*- coding: utf-8 -*-
+import time
+
 import elasticsearch
+import mock
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from kuma.core.tests import eq_, ok_
+from kuma.wiki.search import WikiDocumentType
 
-from kuma.core.tests import eq_
 from . import ElasticTestCase
+from ..jobs import AvailableFiltersJob
 from ..pagination import SearchPagination
 from ..models import Index, Filter, FilterGroup
 from ..views import SearchView
@@ -136,6 +144,81 @@ class ViewTests(ElasticTestCase):
         request = self.get_request('/en-US/search?q=article&group=tagged')
         view(request)
 
+    def test_current_index_queries(self):
+        """The current index is looked up once, until it changes"""
+        self.client.get('/en-US/search?q=article')
+        table = Index._meta.db_table
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/en-US/search?q=article')
+        eq_(response.status_code, 200)
+        ok_(not [query for query in queries if table in query['sql']])
+
+        index = Index.objects.create(name='another', populated=True)
+        index.promote()
+        with self.assertNumQueries(1):
+            eq_(Index.objects.get_current(), index)
+        with self.assertNumQueries(0):
+            eq_(Index.objects.get_current(), index)
+        index.demote()
+        ok_(Index.objects.get_current() != index)
+
+    def test_filter_setup_queries(self):
+        """Search requests set up their filters without querying them"""
+        self.client.get('/en-US/search?q=article')
+        tables = (Filter._meta.db_table, FilterGroup._meta.db_table, 'taggit')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/en-US/search?q=title&group=tagged')
+        eq_(response.status_code, 200)
+        ok_(not [query for query in queries
+                 if any(table in query['sql'] for table in tables)])
+
+        # Changing the filters changes the configuration
+        group = FilterGroup.objects.get(name='Group')
+        filter_ = Filter.objects.create(name='Cached', slug='cached',
+                                        group=group)
+        filter_.tags.add('cached')
+        config = AvailableFiltersJob().get()
+        eq_([serialized_filter['slug']
+             for serialized_filter in config['filters']],
+            ['tagged', 'cached'])
+        eq_(config['clauses'][1],
+            ('cached', {'term': {'tags': 'cached'}},
+             {'term': {'tags': 'cached'}}))
+        group.slug = 'topic'
+        group.save()
+        eq_(AvailableFiltersJob().get()['group_slugs'], ['topic'])
+
+    def test_results_cache(self):
+        url = '/en-US/search?q=article&per_page=5'
+        with mock.patch.object(WikiDocumentType, 'search',
+                               wraps=WikiDocumentType.search) as search:
+            response = self.client.get(url)
+            eq_(response.status_code, 200)
+            eq_(search.call_count, 1)
+
+            # The same query, with its parameters in another order
+            response = self.client.get('/en-US/search?per_page=5&q=article')
+            self.assertContains(response, 'an article title')
+            eq_(search.call_count, 1)
+
+            # Another page, locale or page size is another query
+            self.client.get(url + '&page=2')
+            self.client.get(url.replace('en-US', 'fr'))
+            self.client.get(url.replace('per_page=5', 'per_page=10'))
+            eq_(search.call_count, 4)
+
+            # Stale results are refreshed once
+            with mock.patch('kuma.search.views.time') as clock:
+                clock.time.return_value = time.time() + 60 * 10
+                self.client.get(url)
+                self.client.get(url)
+            eq_(search.call_count, 5)
+
+            # Promoting an index drops the results of the former one
+            Index.objects.get_current().promote()
+            self.client.get(url)
+            eq_(search.call_count, 6)
+
     def test_allowed_methods(self):
         response = self.client.get('/en-US/search?q=test')
         eq_(response.status_code, 200)
@@ -1,28 +1,41 @@
+import hashlib
 import json
+import time
 from collections import OrderedDict
 from operator import attrgetter
 
+import newrelic.agent
+from django.conf import settings
 from django.http import HttpResponse, HttpResponseBadRequest
 from django.shortcuts import render
 from django.utils.translation import ugettext
+from django.utils.encoding import smart_str
 from django.views.decorators.cache import cache_page
 from rest_framework.generics import ListAPIView
 from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
 
+from kuma.core.cache import memcache
 from kuma.wiki.search import WikiDocumentType
 
 from .filters import (AdvancedSearchQueryBackend, DatabaseFilterBackend,
                       HighlightFilterBackend, LanguageFilterBackend,
                       SearchQueryBackend, get_filters)
 from .jobs import AvailableFiltersJob
+from .models import Index
 from .pagination import SearchPagination
 from .queries import Filter, FilterGroup
 from .renderers import ExtendedTemplateHTMLRenderer
 from .serializers import (DocumentSerializer, FacetedFilterSerializer,
-                          FilterWithGroupSerializer, SearchQuerySerializer)
+                          SearchQuerySerializer)
+from .stats import SearchStats
+from .store import PAGE_PARAM, QUERY_PARAM, ref_from_url
 from .utils import QueryURLObject
 
 
+SEARCH_RESULTS_CACHE_KEY_TMPL = u'kuma:search:results:%s:%s'
+
+
 class SearchView(ListAPIView):
     http_method_names = ['get']
     serializer_class = DocumentSerializer
@@ -47,11 +60,12 @@ class SearchView(ListAPIView):
             self.pagination_class.page_query_param,
             1,
         )
-        self.available_filters = AvailableFiltersJob().get()
-        self.serialized_filters = (
-            FilterWithGroupSerializer(self.available_filters, many=True).data)
-        self.selected_filters = get_filters(self.request.query_params.getlist)
+        self.filter_config = AvailableFiltersJob().get()
+        self.serialized_filters = self.filter_config['filters']
+        self.selected_filters = get_filters(self.request.query_params.getlist,
+                                            self.filter_config)
         self.query_params = {}
+        self.stats = SearchStats(request.get_full_path())
 
     def get_queryset(self):
         return WikiDocumentType.search()
@@ -65,7 +79,81 @@ class SearchView(ListAPIView):
         query_params = SearchQuerySerializer(data=request.query_params)
         query_params.is_valid(raise_exception=True)
         self.query_params = query_params.data
-        return super(SearchView, self).list(request, *args, **kwargs)
+
+        # Superusers get the scoring explained, which isn't worth caching.
+        if (not settings.SEARCH_RESULTS_CACHE_TIMEOUT or
+                request.user.is_superuser):
+            return self.list_results(request, *args, **kwargs)
+
+        cache_key = self.get_results_cache_key()
+        cached = memcache.get(cache_key)
+        if cached is not None:
+            data, fresh_until, duration = cached
+            # Results past their timeout are refreshed by a single request,
+            # while the others keep getting the stale results meanwhile.
+            refresh_timeout = settings.SEARCH_RESULTS_CACHE_REFRESH_TIMEOUT
+            if (fresh_until > time.time() or
+                    not memcache.add(cache_key + ':refresh', True,
+                                     timeout=refresh_timeout)):
+                newrelic.agent.record_custom_metric(
+                    'Custom/Search/ResultsCache/Hit', 1)
+                newrelic.agent.record_custom_metric(
+                    'Custom/Search/ResultsCache/SavedTime', duration)
+                return Response(data)
+        newrelic.agent.record_custom_metric(
+            'Custom/Search/ResultsCache/Miss', 1)
+
+        started = time.time()
+        response = self.list_results(request, *args, **kwargs)
+        duration = time.time() - started
+        if response.status_code == 200:
+            timeout = settings.SEARCH_RESULTS_CACHE_TIMEOUT
+            memcache.set(cache_key,
+                         (response.data, time.time() + timeout, duration),
+                         timeout + settings.SEARCH_RESULTS_CACHE_STALE_TIMEOUT)
+            memcache.delete(cache_key + ':refresh')
+        return response
+
+    def list_results(self, request, *args, **kwargs):
+        """
+        List the results like `ListAPIView.list`, timing the search and the
+        serialization of its results for the search stats.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            self.stats.record_page(self.paginator.page)
+            with self.stats.timer('Serialization'):
+                serializer = self.get_serializer(page, many=True)
+                response = self.get_paginated_response(serializer.data)
+        else:
+            with self.stats.timer('Serialization'):
+                serializer = self.get_serializer(queryset, many=True)
+                response = Response(serializer.data)
+        self.stats.report()
+        return response
+
+    def filter_queryset(self, queryset):
+        """Apply the filter backends, timing each of them."""
+        for backend in list(self.filter_backends):
+            with self.stats.timer('FilterBackend/%s' % backend.__name__):
+                queryset = backend().filter_queryset(self.request, queryset,
+                                                     self)
+        return queryset
+
+    def get_results_cache_key(self):
+        """
+        Return the key of the cached results for the current request, made
+        of the normalized query, page, locale and filters and the remaining
+        query parameters, in the current generation of search indexes.
+        """
+        md5 = hashlib.md5(ref_from_url(self.url))
+        for name, values in sorted(self.request.query_params.lists()):
+            if name not in (QUERY_PARAM, PAGE_PARAM):
+                md5.update(smart_str(u'&%s=%s' % (name,
+                                                  u','.join(sorted(values)))))
+        return SEARCH_RESULTS_CACHE_KEY_TMPL % (
+            Index.objects.current_generation(), md5.hexdigest())
 
     def get_filters(self, aggregations):
         url = QueryURLObject(self.url)
@@ -101,6 +101,12 @@ CACHES = {
 
 CACHEBACK_CACHE_ALIAS = 'memcache'
 
+# How many seconds the responses to anonymous users viewing a document are
+# served from the cache, unless the document is saved or rendered. Set to 0
+# to disable.
+DOCUMENT_RESPONSE_CACHE_TIMEOUT = config('DOCUMENT_RESPONSE_CACHE_TIMEOUT',
+                                         default=60 * 5, cast=int)
+
 # Email
 vars().update(config('EMAIL_URL',
                      default='console://',
@@ -1112,6 +1118,13 @@ CONSTANCE_CONFIG = dict(
         'Maximum seconds to wait before considering a rendering in progress or '
         'scheduled as failed and allowing another attempt.'
     ),
+    KUMA_DOCUMENT_RENDER_CONCURRENCY=(
+        1,
+        'Maximum number of kumascript requests in flight at once when '
+        'rendering a chunk of documents, e.g. for stale documents or the '
+        'render_document management command. Keep it at most the '
+        'KUMASCRIPT_POOL_SIZE setting.'
+    ),
     KUMA_DOCUMENT_FORCE_DEFERRED_TIMEOUT=(
         10.0,
         'Maximum seconds to allow a document to spend rendering during the '
@@ -1131,6 +1144,13 @@ CONSTANCE_CONFIG = dict(
         'kumascript. Passed along in a Cache-Control: max-age={value} header, '
         'which tells kumascript whether or not to serve up a cached response.'
     ),
+    KUMASCRIPT_RENDER_CACHE_TIMEOUT=(
+        86400,
+        'Maximum age (in seconds) of a cached rendering, reused without asking '
+        'kumascript whenever a document and the templates it calls are '
+        'unchanged. Templates called indirectly, by other templates, are not '
+        'checked. 0 disables the render cache.'
+    ),
     KUMA_CUSTOM_SAMPLE_CSS_PATH=(
         '/en-US/docs/Template:CustomSampleCSS',
         'Path to a wiki document whose raw content will be loaded as a CSS '
@@ -1241,6 +1261,21 @@ CONSTANCE_CONFIG = dict(
 )
 
 KUMASCRIPT_URL_TEMPLATE = 'http://localhost:9080/docs/{path}'
+# URL of the kumascript endpoint rendering many documents in one request.
+# Leave empty to render documents one request at a time.
+KUMASCRIPT_BATCH_URL = config('KUMASCRIPT_BATCH_URL', default='')
+# Maximum number of documents to render in one batch request
+KUMASCRIPT_BATCH_SIZE = config('KUMASCRIPT_BATCH_SIZE', default=10, cast=int)
+# Maximum number of keep-alive connections each process keeps open to the
+# kumascript service. Size this to the number of threads rendering
+# concurrently in a single worker process.
+KUMASCRIPT_POOL_SIZE = config('KUMASCRIPT_POOL_SIZE', default=10, cast=int)
+# Number of times to retry connecting to kumascript, and the backoff factor
+# in seconds between retries.
+KUMASCRIPT_CONNECT_RETRIES = config('KUMASCRIPT_CONNECT_RETRIES', default=3,
+                                    cast=int)
+KUMASCRIPT_RETRY_BACKOFF = config('KUMASCRIPT_RETRY_BACKOFF', default=0.2,
+                                  cast=float)
 
 # Elasticsearch related settings.
 ES_DEFAULT_NUM_REPLICAS = 1
@@ -1250,9 +1285,37 @@ ES_INDEX_PREFIX = 'mdn'
 ES_INDEXES = {'default': 'main_index'}
 # Specify the extra timeout in seconds for the indexing ES connection.
 ES_INDEXING_TIMEOUT = 30
+# How many documents, and how many concurrent requests, a streaming reindex
+# sends per bulk request.
+ES_BULK_CHUNK_SIZE = config('ES_BULK_CHUNK_SIZE', default=100, cast=int)
+ES_BULK_THREAD_COUNT = config('ES_BULK_THREAD_COUNT', default=4, cast=int)
 ES_LIVE_INDEX = False
+# How many seconds live indexing collects documents before indexing them in
+# bulk, and how many documents are indexed right away or at most per bulk.
+ES_INDEXING_QUEUE_DELAY = config('ES_INDEXING_QUEUE_DELAY', default=10,
+                                 cast=int)
+ES_INDEXING_QUEUE_SIZE = config('ES_INDEXING_QUEUE_SIZE', default=500,
+                                cast=int)
+# How many seconds a process may use the current index it looked up before
+# looking it up again, even if no index was promoted or demoted meanwhile.
+ES_CURRENT_INDEX_TIMEOUT = config('ES_CURRENT_INDEX_TIMEOUT', default=60,
+                                  cast=int)
 ES_URLS = config('ES_URLS', default='127.0.0.1:9200', cast=Csv())
 
+# How many seconds search results are served from the cache, how many more
+# seconds stale results are served while a single request refreshes them,
+# and how long that request has to do so. Set the first to 0 to disable.
+SEARCH_RESULTS_CACHE_TIMEOUT = config('SEARCH_RESULTS_CACHE_TIMEOUT',
+                                      default=60 * 5, cast=int)
+SEARCH_RESULTS_CACHE_STALE_TIMEOUT = 60 * 60
+SEARCH_RESULTS_CACHE_REFRESH_TIMEOUT = 30
+
+# The dotted path of the sink exporting the timings of searches, and the
+# seconds after which a search is logged as slow along with its query.
+SEARCH_STATS_SINK = 'kuma.search.stats.NewRelicSink'
+SEARCH_SLOW_QUERY_THRESHOLD = config('SEARCH_SLOW_QUERY_THRESHOLD',
+                                     default=1.0, cast=float)
+
 LOG_LEVEL = logging.WARN
 SYSLOG_TAG = 'http_app_kuma'
 
@@ -1293,6 +1356,11 @@ LOGGING = {
             'propagate': True,
             'level': logging.ERROR,
         },
+        'kuma.search.slow': {
+            'handlers': ['console'],
+            'propagate': False,
+            'level': logging.WARNING,
+        },
         'elasticsearch': {
             'handlers': ['console'],
             'level': logging.ERROR,
@@ -4,6 +4,11 @@ DEBUG = False
 CELERY_ALWAYS_EAGER = True
 CELERY_EAGER_PROPAGATES_EXCEPTIONS = True
 ES_LIVE_INDEX = False
+# Don't wait around retrying a kumascript service that isn't there
+KUMASCRIPT_CONNECT_RETRIES = 0
+# Tests change documents and switches between anonymous requests, so the
+# tests of the document response cache enable it themselves
+DOCUMENT_RESPONSE_CACHE_TIMEOUT = 0
 
 PASSWORD_HASHERS = (
     'django.contrib.auth.hashers.SHA1PasswordHasher',
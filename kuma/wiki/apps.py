@@ -10,31 +10,36 @@ from django.utils.translation import ugettext_lazy as _
 
 from elasticsearch_dsl.connections import connections as es_connections
 
-from .jobs import (DocumentContributorsJob, DocumentZoneStackJob,
-                   DocumentZoneURLRemapsJob, DocumentCodeSampleJob)
+from .jobs import (DocumentZoneStackJob, DocumentZoneURLRemapsJob,
+                   DocumentCodeSampleJob)
 from .signals import render_done
+from .zones import url_remaps
 
 
-def invalidate_zone_stack_cache(document, async=False):
+def invalidate_zone_stack_cache(document, async=False, zone_changed=False):
     """
-    Reset the cache for the zone stack for all of the documents
-    in the document tree branch.
+    Reset the cache for the zone stack of the given document and, when it's
+    the document of a zone whose local subnav or zone changed, materialize
+    again the zone subnavs of the whole document tree branch below it.
     """
-    pks = [document.pk] + [parent.pk for parent in
-                           document.get_topic_parents()]
+    from .tasks import update_zone_tree
+
     job = DocumentZoneStackJob()
     if async:
-        invalidator = job.invalidate
+        job.invalidate(document.pk)
     else:
-        invalidator = job.refresh
-    for pk in pks:
-        invalidator(pk)
+        job.refresh(document.pk)
+    try:
+        if document.zone and (zone_changed or document.zone_subnav_changed):
+            update_zone_tree.delay(document.pk, zone_changed=zone_changed)
+    except ObjectDoesNotExist:
+        pass
 
 
 def invalidate_zone_urls_cache(document, async=False):
     """
     Reset the URL remap list cache for the given document, assuming it
-    even has a zone.
+    even has a zone, and the remaps compiled by this process.
     """
     job = DocumentZoneURLRemapsJob()
     if async:
@@ -45,6 +50,7 @@ def invalidate_zone_urls_cache(document, async=False):
         if document.zone:
             # reset the cached list of zones of the document's locale
             invalidator(document.locale)
+            url_remaps.invalidate(document.locale)
     except ObjectDoesNotExist:
         pass
 
@@ -76,6 +82,9 @@ class WikiConfig(AppConfig):
         signals.post_save.connect(self.on_document_save,
                                   sender=Document,
                                   dispatch_uid='wiki.document.post_save')
+        signals.post_delete.connect(self.on_document_delete,
+                                    sender=Document,
+                                    dispatch_uid='wiki.document.post_delete')
         render_done.connect(self.on_render_done,
                             dispatch_uid='wiki.document.render_done')
 
@@ -83,11 +92,17 @@ class WikiConfig(AppConfig):
         signals.post_save.connect(self.on_revision_save,
                                   sender=Revision,
                                   dispatch_uid='wiki.revision.post_save')
+        signals.post_delete.connect(self.on_revision_delete,
+                                    sender=Revision,
+                                    dispatch_uid='wiki.revision.post_delete')
 
         DocumentZone = self.get_model('DocumentZone')
         signals.post_save.connect(self.on_zone_save,
                                   sender=DocumentZone,
                                   dispatch_uid='wiki.zone.post_save')
+        signals.post_delete.connect(self.on_zone_delete,
+                                    sender=DocumentZone,
+                                    dispatch_uid='wiki.zone.post_delete')
 
         DocumentSpamAttempt = self.get_model('DocumentSpamAttempt')
         signals.post_save.connect(self.on_document_spam_attempt_save,
@@ -99,21 +114,43 @@ class WikiConfig(AppConfig):
         A signal handler to be called after saving a document. Does:
 
         - trigger the cache invalidation of both the zone URLs and stack
-          cache for the given document
-        - trigger the cache invalidation of the contributor bar for the given
-          document
+          cache for the given document, and the update of the zone subnavs
+          below it if it's the document of a zone whose subnav changed
         - trigger the renewal of the code sample job generation
+        - update the index of the macros called by the document, and render
+          again the documents calling a template with a new revision
+        - update the title of the document in the autosuggest title index
         """
+        from . import titles
+
         async = kwargs.get('async', True)
+        zone_changed = kwargs.get('zone_changed', False)
 
         invalidate_zone_urls_cache(instance, async=async)
-        invalidate_zone_stack_cache(instance, async=async)
-
-        DocumentContributorsJob().invalidate(instance.pk)
+        invalidate_zone_stack_cache(instance, async=async,
+                                    zone_changed=zone_changed)
 
         code_sample_job = DocumentCodeSampleJob(generation_args=[instance.pk])
         code_sample_job.invalidate_generation()
 
+        titles.document_saved(instance)
+
+        if not kwargs.get('raw'):
+            instance.update_macros()
+            if (instance.is_template and instance.current_revision_id and
+                    instance.locale == settings.WIKI_DEFAULT_LANGUAGE):
+                from .tasks import render_macro_callers
+                render_macro_callers.delay(instance.pk,
+                                           instance.current_revision_id)
+
+    def on_document_delete(self, sender, instance, **kwargs):
+        """
+        A signal handler to remove a deleted document from the autosuggest
+        title index.
+        """
+        from . import titles
+        titles.document_deleted(instance)
+
     def on_zone_save(self, sender, instance, **kwargs):
         """
         A signal handler to trigger the cache invalidation of both the zone
@@ -121,23 +158,55 @@ class WikiConfig(AppConfig):
         """
         self.on_document_save(sender=instance.document.__class__,
                               instance=instance.document,
-                              async=False)
+                              async=False, zone_changed=True)
+
+    def on_zone_delete(self, sender, instance, **kwargs):
+        """
+        A signal handler to reset the zone URLs cache of a deleted zone's
+        locale, and to materialize again the zone stacks and subnavs below
+        its document.
+        """
+        from .tasks import update_zone_tree
+
+        try:
+            document = instance.document
+        except ObjectDoesNotExist:
+            # The document is being deleted along with its zone.
+            return
+        DocumentZoneURLRemapsJob().refresh(document.locale)
+        url_remaps.invalidate(document.locale)
+        DocumentZoneStackJob().refresh(document.pk)
+        update_zone_tree.delay(document.pk, zone_changed=True)
 
     def on_render_done(self, sender, instance, **kwargs):
         """
-        A signal handler to update the given document's json field.
+        A signal handler to update the given document's json field and to
+        drop the responses cached with its former rendering.
         """
         from .tasks import build_json_data_for_document
+        instance.purge_response_cache()
         if not instance.deleted:
             build_json_data_for_document.delay(instance.pk, stale=False)
 
     def on_revision_save(self, sender, instance, **kwargs):
         """
         A signal handler to trigger the Celery task to update the
-        tidied_content field of the given revision
+        tidied_content field of the given revision, and to count a new
+        revision in the contributors of its document
         """
         from .tasks import tidy_revision_content
         tidy_revision_content.delay(instance.pk)
+        if kwargs.get('created') and not kwargs.get('raw'):
+            contributors = self.get_model('DocumentContributor').objects
+            contributors.add_revision(instance)
+
+    def on_revision_delete(self, sender, instance, **kwargs):
+        """
+        A signal handler to count again the contributions of the creator of
+        a deleted revision
+        """
+        contributors = self.get_model('DocumentContributor').objects
+        contributors.remove_revision(instance)
 
     def on_document_spam_attempt_save(
             self, sender, instance, created, raw, **kwargs):
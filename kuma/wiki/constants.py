@@ -244,7 +244,36 @@ DOCUMENT_PATH_RE = re.compile(r'[^\$]+')
 REDIRECT_HTML = 'REDIRECT <a class="redirect"'
 REDIRECT_CONTENT = 'REDIRECT <a class="redirect" href="%(href)s">%(title)s</a>'
 
+# the heavy text columns of a document, left out of the queries that only
+# need its metadata, see DocumentQuerySet.defer_content
+DOCUMENT_CONTENT_FIELDS = (
+    'html', 'rendered_html', 'rendered_errors', 'json', 'body_html',
+    'quick_links_html', 'zone_subnav_local_html', 'zone_subnav_html',
+    'toc_html', 'summary_html', 'summary_text',
+)
+
+# the columns a document tree is walked with, see
+# Document.get_descendant_children
+DOCUMENT_TREE_FIELDS = ('id', 'slug', 'parent_topic')
+# how many documents of a tree are loaded whole per query
+TREE_CHUNK_SIZE = 500
+
+# how many documents a bulk page move looks up and writes per query
+MOVE_CHUNK_SIZE = 500
+# how many documents the title autosuggest returns at most
+AUTOSUGGEST_LIMIT = 20
+
 DOCUMENT_LAST_MODIFIED_CACHE_KEY_TMPL = u'kuma:document-last-modified:%s'
+DOCUMENT_RESPONSE_CACHE_KEY_TMPL = u'kuma:document-response:%s:%s:%s:%s'
+DOCUMENT_RESPONSE_GENERATION_CACHE_KEY_TMPL = (
+    u'kuma:document-response-generation:%s')
+DOCUMENT_MACROS_CACHE_KEY_TMPL = u'kuma:document-macros:%s'
+DOCUMENT_SECTION_FRAGMENT_CACHE_KEY_TMPL = u'kuma:document-section:%s:%s:%s'
+MACRO_CALLERS_RENDERED_CACHE_KEY_TMPL = u'kuma:macro-callers-rendered:%s'
+TITLE_INDEX_GENERATION_CACHE_KEY_TMPL = u'kuma:title-index-generation:%s'
+TITLE_INDEX_REBUILD_CACHE_KEY_TMPL = u'kuma:title-index-rebuild:%s'
+TITLE_INDEX_DELETED_COUNT_CACHE_KEY_TMPL = u'kuma:title-index-deleted:%s'
+TITLE_INDEX_DELETED_CACHE_KEY_TMPL = u'kuma:title-index-deleted:%s:%s'
 
 DEKI_FILE_URL = re.compile(r'@api/deki/files/(?P<file_id>\d+)/=')
 KUMA_FILE_URL = re.compile(r'%s%s/files/(?P<file_id>\d+)/' %
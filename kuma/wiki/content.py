@@ -1,12 +1,13 @@
 # -*- coding: utf-8 -*-
 import re
 import urllib
-from collections import defaultdict
+from collections import defaultdict, deque
 from urllib import urlencode
 from urlparse import urlparse
 
 import html5lib
 import newrelic.agent
+from django.utils.html import escape
 from django.utils.translation import ugettext
 from html5lib.filters._base import Filter as html5lib_Filter
 from lxml import etree
@@ -50,6 +51,14 @@ TAGS_IN_TOC = ('code')
 # just the likely candidates for links.
 DOC_SPECIAL_PATHS = ('new', 'tag', 'feeds', 'templates', 'needs-review')
 
+# Sections removed from the document body, since they're shown elsewhere on
+# the page.
+BODY_HIDDEN_SECTIONS = ('Quick_Links', 'Subnav')
+
+# Document fields holding content generated from the rendered HTML
+CACHED_FIELDS = ('body_html', 'quick_links_html', 'zone_subnav_local_html',
+                 'toc_html', 'summary_html', 'summary_text')
+
 
 class Extractor(object):
 
@@ -106,6 +115,32 @@ class Extractor(object):
         except:
             return []
 
+    @newrelic.agent.function_trace()
+    def search_fields(self):
+        """
+        Extract the text, the unique set of class names and the HTML
+        attributes of the rendered content, from a single parse of it.
+
+        The text is escaped, as the tags stripped from it are.
+        """
+        text = []
+        classnames = set()
+        attribs = []
+        for token in parse(self.document.rendered_html or '').stream:
+            if token['type'] in ('Characters', 'SpaceCharacters'):
+                text.append(token['data'])
+            elif token['type'] in ('StartTag', 'EmptyTag'):
+                for (namespace, name), value in token['data'].items():
+                    if token['type'] == 'StartTag':
+                        attribs.append((name, value))
+                    if name == 'class' and value:
+                        classnames.update(value.split(' '))
+        return {
+            'content': escape(u''.join(text)),
+            'css_classnames': list(classnames),
+            'html_attributes': ['%s="%s"' % (k, v) for k, v in attribs],
+        }
+
     @newrelic.agent.function_trace()
     def code_sample(self, name):
         """
@@ -194,58 +229,183 @@ def get_seo_description(content, locale=None, strip_markup=True):
     #        logical way to find the end of sentence before 180?
     seo_summary = ''
     if content:
-        # Try constraining the search for summary to an explicit "Summary"
-        # section, if any.
-        summary_section = (parse(content).extractSection('Summary')
-                                         .serialize())
-        if summary_section:
-            content = summary_section
-
-        # Need to add a BR to the page content otherwise pyQuery wont find
-        # a <p></p> element if it's the only element in the doc_html
-        seo_analyze_doc_html = content + '<br />'
-        page = pq(seo_analyze_doc_html)
-
-        # Look for the SEO summary class first
-        summaryClasses = page.find('.seoSummary')
-        if len(summaryClasses):
-            if strip_markup:
-                seo_summary = summaryClasses.text()
-            else:
-                seo_summary = summaryClasses.html()
-        else:
-            paragraphs = page.find('p')
-            if paragraphs.length:
-                for p in range(len(paragraphs)):
-                    item = paragraphs.eq(p)
-                    if strip_markup:
-                        text = item.text()
-                    else:
-                        text = item.html()
-                    # Checking for a parent length of 2
-                    # because we don't want p's wrapped
-                    # in DIVs ("<div class='warning'>") and pyQuery adds
-                    # "<html><div>" wrapping to entire document
-                    if (text and len(text) and
-                            'Redirect' not in text and
-                            text.find(u'«') == -1 and
-                            text.find('&laquo') == -1 and
-                            item.parents().length == 2):
-                        seo_summary = text.strip()
-                        break
+        page = _get_seo_summary_page(parse(content))
+        seo_summary = _find_seo_summary(page, strip_markup)
 
     if strip_markup:
-        # Post-found cleanup
-        # remove markup chars
-        seo_summary = seo_summary.replace('<', '').replace('>', '')
-        # remove spaces around some punctuation added by PyQuery
-        if locale == 'en-US':
-            seo_summary = re.sub(r' ([,\)\.])', r'\1', seo_summary)
-            seo_summary = re.sub(r'(\() ', r'\1', seo_summary)
+        seo_summary = _clean_seo_summary(seo_summary, locale)
+
+    return seo_summary
+
+
+def _get_seo_summary_page(parsed):
+    """
+    Get a PyQuery page in which to look for the SEO summary of parsed content
+    """
+    content = parsed.src
+    # Try constraining the search for summary to an explicit "Summary"
+    # section, if any.
+    summary_section = parsed.extractSection('Summary').serialize()
+    if summary_section:
+        content = summary_section
+
+    # Need to add a BR to the page content otherwise pyQuery wont find
+    # a <p></p> element if it's the only element in the doc_html
+    seo_analyze_doc_html = content + '<br />'
+    return pq(seo_analyze_doc_html)
+
+
+def _find_seo_summary(page, strip_markup):
+    """
+    Find the SEO summary in a page, as text or as HTML
+    """
+    seo_summary = ''
+
+    # Look for the SEO summary class first
+    summaryClasses = page.find('.seoSummary')
+    if len(summaryClasses):
+        if strip_markup:
+            seo_summary = summaryClasses.text()
+        else:
+            seo_summary = summaryClasses.html()
+    else:
+        paragraphs = page.find('p')
+        if paragraphs.length:
+            for p in range(len(paragraphs)):
+                item = paragraphs.eq(p)
+                if strip_markup:
+                    text = item.text()
+                else:
+                    text = item.html()
+                # Checking for a parent length of 2
+                # because we don't want p's wrapped
+                # in DIVs ("<div class='warning'>") and pyQuery adds
+                # "<html><div>" wrapping to entire document
+                if (text and len(text) and
+                        'Redirect' not in text and
+                        text.find(u'«') == -1 and
+                        text.find('&laquo') == -1 and
+                        item.parents().length == 2):
+                    seo_summary = text.strip()
+                    break
 
     return seo_summary
 
 
+def _clean_seo_summary(seo_summary, locale=None):
+    """
+    Post-found cleanup of a text SEO summary
+    """
+    # remove markup chars
+    seo_summary = seo_summary.replace('<', '').replace('>', '')
+    # remove spaces around some punctuation added by PyQuery
+    if locale == 'en-US':
+        seo_summary = re.sub(r' ([,\)\.])', r'\1', seo_summary)
+        seo_summary = re.sub(r'(\() ', r'\1', seo_summary)
+    return seo_summary
+
+
+@newrelic.agent.function_trace()
+def build_cached_fields(src, base_url, locale=None, toc_filter=None,
+                        fields=CACHED_FIELDS):
+    """
+    Build the cached content fields of a document from one parse of its
+    source, returning a dict of field name to content.
+
+    Each field gets its own walk over the shared tree, so the results are the
+    same as parsing the source again for every field.
+    """
+    parsed = parse(src)
+    built = {}
+
+    if 'body_html' in fields:
+        body = parsed.clone()
+        for section_id in BODY_HIDDEN_SECTIONS:
+            body.replaceSection(section_id, '<!-- -->')
+        built['body_html'] = (body.injectSectionIDs()
+                                  .annotateLinks(base_url=base_url)
+                                  .serialize())
+
+    if 'quick_links_html' in fields:
+        built['quick_links_html'] = (parsed.clone()
+                                           .extractSection('Quick_Links',
+                                                           ignore_heading=True)
+                                           .serialize())
+
+    if 'zone_subnav_local_html' in fields:
+        built['zone_subnav_local_html'] = (parsed.clone()
+                                                 .extractSection(
+                                                     'Subnav',
+                                                     ignore_heading=True)
+                                                 .serialize())
+
+    if 'toc_html' in fields:
+        if toc_filter is None:
+            built['toc_html'] = ''
+        else:
+            built['toc_html'] = (parsed.clone()
+                                       .injectSectionIDs()
+                                       .filter(toc_filter)
+                                       .serialize())
+
+    if 'summary_html' in fields or 'summary_text' in fields:
+        # Both summaries are found in the same page, so only build it once.
+        summary_html, summary_text = '', ''
+        if src:
+            page = _get_seo_summary_page(parsed.clone())
+            summary_html = _find_seo_summary(page, strip_markup=False)
+            summary_text = _find_seo_summary(page, strip_markup=True)
+        built['summary_html'] = summary_html
+        built['summary_text'] = _clean_seo_summary(summary_text, locale)
+
+    return built
+
+
+@newrelic.agent.function_trace()
+def build_section_fragments(src):
+    """
+    Build every section of a document's source as ?raw requests serve it,
+    from one parse of the source, returning a dict of section ID to a dict
+    of:
+
+    - 'html': the section, with section IDs and editor safety filtering
+    - 'include_html': the same without the class="noinclude" blocks
+    - 'source_html': the section extracted from the unfiltered source
+
+    The whole document is under the empty section ID.
+    """
+    parsed = parse(src)
+
+    def raw():
+        return parsed.clone().injectSectionIDs().filterEditorSafety()
+
+    section_ids = ['']
+    for token in raw().stream:
+        if (token['type'] == 'StartTag' and
+                token['name'] in SectionFilter.HEADING_TAGS +
+                SectionFilter.SECTION_TAGS):
+            section_id = dict(token['data']).get((None, 'id'))
+            if section_id and section_id not in section_ids:
+                section_ids.append(section_id)
+
+    fragments = {}
+    for section_id in section_ids:
+        if section_id:
+            html = raw().extractSection(section_id).serialize()
+            source_html = (parsed.clone()
+                                 .extractSection(section_id)
+                                 .serialize())
+        else:
+            html = raw().serialize()
+            source_html = src
+        fragments[section_id] = {
+            'html': html,
+            'include_html': filter_out_noinclude(html),
+            'source_html': source_html,
+        }
+    return fragments
+
+
 @newrelic.agent.function_trace()
 def filter_out_noinclude(src):
     """
@@ -294,6 +454,20 @@ class ContentSectionTool(object):
         self.stream = self.walker(self.doc)
         return self
 
+    def clone(self):
+        """
+        Get a new tool with a fresh stream over the same parsed tree.
+
+        Filters only change the tokens walked from the tree and never the
+        tree itself, so any number of passes can share a single parse.
+        """
+        tool = ContentSectionTool()
+        tool.src = self.src
+        tool.doc = self.doc
+        if self.doc is not None:
+            tool.stream = self.walker(self.doc)
+        return tool
+
     def _get_serializer(self, **options):
         soptions = self._default_serializer_options.copy()
         soptions.update(options)
@@ -332,7 +506,10 @@ class ContentSectionTool(object):
 
     @newrelic.agent.function_trace()
     def annotateLinks(self, base_url):
-        self.stream = LinkAnnotationFilter(self.stream, base_url)
+        # Gather the links from a walk of their own, so that the content
+        # doesn't have to be held in memory until they're all checked.
+        self.stream = LinkAnnotationFilter(self.stream, base_url,
+                                           links_source=self.clone().stream)
         return self
 
     @newrelic.agent.function_trace()
@@ -408,36 +585,40 @@ class LinkAnnotationFilter(html5lib_Filter):
     """
     Filter which annotates links to indicate things like whether they're
     external, if they point to non-existent wiki pages, etc.
+
+    The links are gathered from ``links_source``, a separate walk over the
+    same content, so that the tokens can be annotated as they stream by.
+    Without it, the tokens of ``source`` are kept in memory for a second pass.
     """
     # TODO: Need more external link prefixes, here?
     EXTERNAL_PREFIXES = ('http:', 'https:', 'ftp:',)
 
-    def __init__(self, source, base_url):
+    def __init__(self, source, base_url, links_source=None):
         html5lib_Filter.__init__(self, source)
         self.base_url = base_url
         self.base_url_parsed = urlparse(base_url)
-
-    def __iter__(self):
+        self.links_source = links_source
+
+    def get_hrefs(self, token):
+        """Get the (namespace, href) pairs of a link start tag"""
+        hrefs = []
+        if token['type'] == 'StartTag' and token['name'] == 'a':
+            for (namespace, name), value in token['data'].items():
+                if name == 'href':
+                    href = value
+                    href_parsed = urlparse(href)
+                    if href_parsed.netloc == self.base_url_parsed.netloc:
+                        # Squash site-absolute URLs to site-relative paths.
+                        href = href_parsed.path
+                    hrefs.append((namespace, href))
+        return hrefs
+
+    def get_annotations(self, hrefs):
+        """Get a dict of the annotations for each of the given hrefs"""
         from kuma.wiki.models import Document
 
-        input = html5lib_Filter.__iter__(self)
-
-        # Pass #1: Gather all the link URLs and prepare annotations
-        links = {}
-        buffer = []
-        for token in input:
-            buffer.append(token)
-            if token['type'] == 'StartTag' and token['name'] == 'a':
-                for (namespace, name), value in token['data'].items():
-                    if name == 'href':
-                        href = value
-                        href_parsed = urlparse(href)
-                        if href_parsed.netloc == self.base_url_parsed.netloc:
-                            # Squash site-absolute URLs to site-relative paths.
-                            href = href_parsed.path
-
-                        # Prepare annotations record for this path.
-                        links[href] = {'classes': []}
+        # Prepare annotations record for each path.
+        links = dict((href, {'classes': []}) for href in hrefs)
 
         needs_existence_check = defaultdict(lambda: defaultdict(set))
 
@@ -512,31 +693,38 @@ class LinkAnnotationFilter(html5lib_Filter):
                 for href in hrefs:
                     links[href]['classes'].append('new')
 
-        # Pass #2: Filter the content, annotating links
-        for token in buffer:
-            if token['type'] == 'StartTag' and token['name'] == 'a':
-                attrs = dict(token['data'])
-                names = [name for (namespace, name) in attrs.keys()]
-                for (namespace, name), value in attrs.items():
-                    if name == 'href':
-                        href = value
-                        href_parsed = urlparse(value)
-                        if href_parsed.netloc == self.base_url_parsed.netloc:
-                            # Squash site-absolute URLs to site-relative paths.
-                            href = href_parsed.path
-
-                        if href in links:
-                            # Update class names on this link element.
-                            if 'class' in names:
-                                classes = set(attrs[(namespace, 'class')].split(u' '))
-                            else:
-                                classes = set()
-                            classes.update(links[href]['classes'])
-                            if classes:
-                                attrs[(namespace, u'class')] = u' '.join(classes)
+        return links
 
-                token['data'] = attrs
+    def __iter__(self):
+        input = html5lib_Filter.__iter__(self)
+        links_source = self.links_source
+        if links_source is None:
+            input = links_source = list(input)
 
+        # Pass #1: Gather all the link URLs and prepare annotations.
+        links = self.get_annotations(set(
+            href
+            for token in links_source
+            for namespace, href in self.get_hrefs(token)))
+
+        # Pass #2: Annotate the links while filtering the content.
+        for token in input:
+            for namespace, href in self.get_hrefs(token):
+                if href not in links:
+                    # An earlier filter changed this link after it was
+                    # gathered, so annotate it on its own.
+                    links.update(self.get_annotations([href]))
+                attrs = dict(token['data'])
+                names = [key[1] for key in attrs.keys()]
+                # Update class names on this link element.
+                if 'class' in names:
+                    classes = set(attrs[(namespace, 'class')].split(u' '))
+                else:
+                    classes = set()
+                classes.update(links[href]['classes'])
+                if classes:
+                    attrs[(namespace, u'class')] = u' '.join(classes)
+                token['data'] = attrs
             yield token
 
 
@@ -581,7 +769,7 @@ class SectionIDFilter(html5lib_Filter):
         # If we get into this code, 'token' will be the start tag of a
         # header element. We're going to grab its text contents to
         # generate a slugified ID for it, add that ID in, and then
-        # spit it back out. 'buffer' is the list of tokens we were in
+        # spit it back out. 'buffer' is the deque of tokens we were in
         # the process of handling when we hit this header.
         start, text, tmp = token, [], []
         attrs = dict(token['data'])
@@ -590,7 +778,7 @@ class SectionIDFilter(html5lib_Filter):
             # until we find our end tag, building up in 'tmp' a list
             # of those tokens to emit later, and in 'text' a list of
             # the text content we see along the way.
-            next_token = buffer.pop(0)
+            next_token = buffer.popleft()
             tmp.append(next_token)
             if next_token['type'] in ('Characters', 'SpaceCharacters'):
                 text.append(next_token['data'])
@@ -627,8 +815,10 @@ class SectionIDFilter(html5lib_Filter):
     def __iter__(self):
         input = html5lib_Filter.__iter__(self)
 
-        # First, collect all ID values already in the source HTML.
-        buffer = []
+        # First, collect all ID values already in the source HTML. Tokens
+        # are taken back off the front of the buffer as they're handled, so
+        # use a deque to keep that constant time on big documents.
+        buffer = deque()
         for token in input:
             buffer.append(token)
             if token['type'] == 'StartTag':
@@ -645,7 +835,7 @@ class SectionIDFilter(html5lib_Filter):
         # Then walk the tree again identifying elements in need of IDs
         # and adding them.
         while len(buffer):
-            token = buffer.pop(0)
+            token = buffer.popleft()
 
             if not (token['type'] == 'StartTag' and
                     token['name'] in SECTION_TAGS):
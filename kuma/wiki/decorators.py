@@ -3,14 +3,26 @@ try:
 except ImportError:
     from django.utils.functional import wraps
 
+import hashlib
+from uuid import uuid4
+
 import newrelic.agent
+from django.conf import settings
+from django.contrib.messages.storage.cookie import CookieStorage
 from django.http import Http404, HttpResponsePermanentRedirect
+from django.utils.encoding import smart_str
 from waffle import flag_is_active, switch_is_active
 
+from kuma.core.cache import memcache
 from kuma.core.urlresolvers import reverse
 from kuma.core.utils import urlparams
+from kuma.search.store import get_search_url_from_referer
 
+from .constants import (DOCUMENT_LAST_MODIFIED_CACHE_KEY_TMPL,
+                        DOCUMENT_RESPONSE_CACHE_KEY_TMPL,
+                        DOCUMENT_RESPONSE_GENERATION_CACHE_KEY_TMPL)
 from .exceptions import ReadOnlyException
+from .models import Document
 from .utils import locale_and_slug_from_path
 
 
@@ -106,3 +118,79 @@ def process_document_path(func, reverse_name='wiki.document'):
         return func(request, *args, **kwargs)
 
     return process
+
+
+def _is_anonymous_view(request):
+    """
+    Whether the request is an anonymous GET, rendered alike for every
+    anonymous user: without pending messages, waffle flags decided by
+    cookies or search results to get back to.
+    """
+    return (request.method == 'GET' and
+            not request.user.is_authenticated() and
+            CookieStorage.cookie_name not in request.COOKIES and
+            not any(name.startswith('dwf_') for name in request.COOKIES) and
+            not (request.META.get('HTTP_REFERER') and
+                 get_search_url_from_referer(request)))
+
+
+def cache_anonymous_document(func):
+    """
+    Decorator to cache the responses of a document view to anonymous users,
+    keyed by the path and query of the request, the last modification of the
+    document, as cached by Document.fill_last_modified_cache, and a
+    generation changed when the document is saved or rendered.
+
+    Cached responses are served before the view looks the document up.
+    Documents without a cached last modification aren't cached until it's
+    cached again.
+    """
+    @wraps(func)
+    def cached(request, document_slug, document_locale, *args, **kwargs):
+        timeout = settings.DOCUMENT_RESPONSE_CACHE_TIMEOUT
+        if not (timeout and _is_anonymous_view(request)):
+            return func(request, document_slug, document_locale,
+                        *args, **kwargs)
+
+        natural_key_hash = Document.natural_key_hash((document_locale,
+                                                      document_slug))
+        last_modified_key = (DOCUMENT_LAST_MODIFIED_CACHE_KEY_TMPL %
+                             natural_key_hash)
+        generation_key = (DOCUMENT_RESPONSE_GENERATION_CACHE_KEY_TMPL %
+                          natural_key_hash)
+        cached_keys = memcache.get_many([last_modified_key, generation_key])
+        last_modified = cached_keys.get(last_modified_key)
+        generation = cached_keys.get(generation_key)
+        if generation is None and last_modified is not None:
+            generation = uuid4().hex
+            if not memcache.add(generation_key, generation, timeout=None):
+                # Another request started a generation meanwhile.
+                generation = None
+        if last_modified is None or generation is None:
+            return func(request, document_slug, document_locale,
+                        *args, **kwargs)
+
+        md5 = hashlib.md5(smart_str(request.path))
+        for name, values in sorted(request.GET.lists()):
+            md5.update(smart_str(u'&%s=%s' % (name, u','.join(values))))
+        cache_key = DOCUMENT_RESPONSE_CACHE_KEY_TMPL % (
+            natural_key_hash, last_modified, generation, md5.hexdigest())
+        response = memcache.get(cache_key)
+        if response is not None:
+            newrelic.agent.record_custom_metric(
+                'Custom/Wiki/DocumentResponseCache/Hit', 1)
+            return response
+        newrelic.agent.record_custom_metric(
+            'Custom/Wiki/DocumentResponseCache/Miss', 1)
+
+        response = func(request, document_slug, document_locale,
+                        *args, **kwargs)
+        # Responses setting cookies, e.g. with a CSRF token or the waffle
+        # flags decided for this user, are only for this user.
+        if (response.status_code == 200 and not response.cookies and
+                not request.META.get('CSRF_COOKIE_USED') and
+                not getattr(request, 'waffles', None)):
+            memcache.set(cache_key, response, timeout)
+        return response
+
+    return cached
@@ -169,7 +169,7 @@ class DocumentsRecentFeed(DocumentsFeed):
                             .order_by('-current_revision__id')
                             .values_list('pk', flat=True)[:MAX_FEED_ITEMS])
         return (Document.objects.filter(pk__in=list(item_pks))
-                                .defer('html')
+                                .defer_content()
                                 .prefetch_related('current_revision',
                                                   'current_revision__creator',
                                                   'tags'))
@@ -204,7 +204,7 @@ class DocumentsReviewFeed(DocumentsRecentFeed):
                             .order_by('-current_revision__id')
                             .values_list('pk', flat=True)[:MAX_FEED_ITEMS])
         return (Document.objects.filter(pk__in=list(item_pks))
-                                .defer('html')
+                                .defer_content()
                                 .prefetch_related('current_revision',
                                                   'current_revision__creator',
                                                   'tags'))
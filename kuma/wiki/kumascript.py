@@ -1,21 +1,122 @@
 import base64
 from collections import defaultdict
+from functools import partial
 import json
 import hashlib
+import operator
+import os
+import threading
 import time
 from urlparse import urljoin
 
 from django.conf import settings
 from django.contrib.sites.models import Site
+from django.db.models import Q
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from constance import config
-import requests
+from requests import Session
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.packages.urllib3.util import Retry
 
 from kuma.core.cache import memcache
+from kuma.core.utils import chunked
 
 from .constants import KUMASCRIPT_TIMEOUT_ERROR, TEMPLATE_TITLE_PREFIX
 
 
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+_latency = {'requests': 0, 'seconds': 0.0}
+_latency_lock = threading.Lock()
+_render_cache_stats = {'hits': 0, 'misses': 0}
+_render_cache_lock = threading.Lock()
+
+
+def get_session():
+    """
+    Get the keep-alive session for kumascript requests in this process.
+
+    The session is created on first use in each process, so forked workers
+    never share connections with their parent.
+    """
+    global _session, _session_pid
+    pid = os.getpid()
+    if _session is None or _session_pid != pid:
+        with _session_lock:
+            if _session is None or _session_pid != pid:
+                session = Session()
+                adapter = HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=settings.KUMASCRIPT_POOL_SIZE,
+                    max_retries=Retry(
+                        # only retry failed connections, since a request
+                        # which reached kumascript may be half-rendered
+                        total=settings.KUMASCRIPT_CONNECT_RETRIES,
+                        connect=settings.KUMASCRIPT_CONNECT_RETRIES,
+                        read=0,
+                        redirect=0,
+                        backoff_factor=settings.KUMASCRIPT_RETRY_BACKOFF))
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                with _latency_lock:
+                    _latency.update(requests=0, seconds=0.0)
+                _session, _session_pid = session, pid
+    return _session
+
+
+def reset_session():
+    """Close the kumascript session, along with its pooled connections"""
+    global _session, _session_pid
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session, _session_pid = None, None
+    with _latency_lock:
+        _latency.update(requests=0, seconds=0.0)
+
+
+def session_stats():
+    """
+    Return stats on the kumascript requests made by this process: the number
+    of requests, of connections opened for them and of requests which reused
+    a pooled connection, plus the total and average latency in seconds.
+    """
+    num_requests, num_connections = 0, 0
+    if _session is not None and _session_pid == os.getpid():
+        for adapter in set(_session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is not None:
+                    num_requests += pool.num_requests
+                    num_connections += pool.num_connections
+    with _latency_lock:
+        seconds, timed = _latency['seconds'], _latency['requests']
+    return {
+        'requests': num_requests,
+        'connections': num_connections,
+        'pool_hits': max(num_requests - num_connections, 0),
+        'latency': seconds,
+        'average_latency': timed and seconds / timed or 0.0,
+    }
+
+
+def send_request(method, url, **kwargs):
+    """Make a request to kumascript over the pooled session"""
+    session = get_session()
+    start = time.time()
+    try:
+        return session.request(method, url, **kwargs)
+    finally:
+        elapsed = time.time() - start
+        with _latency_lock:
+            _latency['requests'] += 1
+            _latency['seconds'] += elapsed
+
+
 def should_use_rendered(doc, params, html=None):
     """
       * The service isn't disabled with a timeout of 0
@@ -51,10 +152,10 @@ def post(request, content, locale=settings.LANGUAGE_CODE,
         'locale': locale,
     }
     add_env_headers(headers, env_vars)
-    response = requests.post(url,
-                             timeout=config.KUMASCRIPT_TIMEOUT,
-                             data=content.encode('utf8'),
-                             headers=headers)
+    response = send_request('POST', url,
+                            timeout=config.KUMASCRIPT_TIMEOUT,
+                            data=content.encode('utf8'),
+                            headers=headers)
     if response:
         body = process_body(response, use_constance_bleach_whitelists)
         errors = process_errors(response)
@@ -92,6 +193,165 @@ def _format_slug_for_request(slug):
 
 def get(document, cache_control, base_url, timeout=None):
     """Perform a kumascript GET request for a document locale and slug."""
+    cache_control, base_url, timeout = _get_defaults(cache_control, base_url,
+                                                     timeout)
+    body, errors = None, None
+
+    try:
+        env_vars = _build_env_vars(document, cache_control, base_url)
+        render_key, rendering = get_cached_rendering(document, cache_control,
+                                                     env_vars)
+        if rendering is not None:
+            return rendering
+        render_timeout = render_cache_timeout(document)
+
+        url, headers, cache_keys = _build_get_request(document, cache_control,
+                                                      env_vars)
+
+        # Finally, fire off the request.
+        response = send_request('GET', url, headers=headers, timeout=timeout)
+        body, errors = _process_get_response(response, cache_keys)
+        set_cached_rendering(render_key, body, errors, render_timeout)
+
+    except Exception as exc:
+        errors = _unexpected_failure_errors(exc)
+    return (body, errors)
+
+
+def get_many(documents, cache_control, base_url, timeout=None,
+             concurrency=1):
+    """
+    Perform kumascript requests for several documents.
+
+    Documents are sent in batches of KUMASCRIPT_BATCH_SIZE when there's a
+    KUMASCRIPT_BATCH_URL, and one GET request each otherwise or if the
+    kumascript service doesn't support batches. Up to ``concurrency`` of
+    these requests are kept in flight at once, by threads which only wait on
+    kumascript: the documents are read and the responses processed on the
+    calling thread, the only one to use the database connection.
+
+    Returns a list of (body, errors) tuples, in the same order as the given
+    documents.
+    """
+    cache_control, base_url, timeout = _get_defaults(cache_control, base_url,
+                                                     timeout)
+    prepared = []
+    results = [None] * len(documents)
+    for index, document in enumerate(documents):
+        try:
+            env_vars = _build_env_vars(document, cache_control, base_url)
+            render_key, rendering = get_cached_rendering(document,
+                                                         cache_control,
+                                                         env_vars)
+            if rendering is not None:
+                results[index] = rendering
+                continue
+            url, headers, cache_keys = _build_get_request(document,
+                                                          cache_control,
+                                                          env_vars)
+        except Exception as exc:
+            results[index] = (None, _unexpected_failure_errors(exc))
+            continue
+        # Include the source, sparing kumascript from fetching it back.
+        prepared.append((index, url, headers, cache_keys, document.html,
+                         render_key, render_cache_timeout(document)))
+
+    if settings.KUMASCRIPT_BATCH_URL:
+        groups = list(chunked(prepared, settings.KUMASCRIPT_BATCH_SIZE))
+    else:
+        groups = [(item,) for item in prepared]
+
+    if concurrency > 1 and len(groups) > 1:
+        with ThreadPoolExecutor(min(concurrency, len(groups))) as executor:
+            futures = dict((executor.submit(_send_requests, group, timeout),
+                            group)
+                           for group in groups)
+            for future in as_completed(futures):
+                _collect_responses(futures[future], future.result, results)
+    else:
+        for group in groups:
+            _collect_responses(group, partial(_send_requests, group, timeout),
+                               results)
+
+    return results
+
+
+def _send_requests(group, timeout):
+    """
+    Send the kumascript requests for a group of prepared documents, returning
+    a response, or the exception raised in trying to get it, per document.
+    """
+    batch_url = settings.KUMASCRIPT_BATCH_URL
+    if batch_url and len(group) > 1:
+        batch = [{'url': url, 'headers': headers, 'source': source}
+                 for (index, url, headers, cache_keys, source, render_key,
+                      render_timeout) in group]
+        # The batch gets as long to render as its documents would have had
+        # one at a time.
+        response = send_request('POST', batch_url,
+                                data=json.dumps({'documents': batch}),
+                                headers={'Content-Type': 'application/json'},
+                                timeout=timeout * len(batch))
+        if response.status_code not in (404, 405, 501):
+            if response.status_code != 200:
+                raise ValueError('Unexpected response to batch request: %s' %
+                                 response.status_code)
+            rendered = response.json()['documents']
+            if len(rendered) != len(batch):
+                raise ValueError('Expected %s documents in batch response, '
+                                 'got %s' % (len(batch), len(rendered)))
+            return [BatchItemResponse(item) for item in rendered]
+        # No batch support in this kumascript service, so go one by one.
+
+    responses = []
+    for (index, url, headers, cache_keys, source, render_key,
+         render_timeout) in group:
+        try:
+            responses.append(send_request('GET', url, headers=headers,
+                                          timeout=timeout))
+        except Exception as exc:
+            responses.append(exc)
+    return responses
+
+
+def _collect_responses(group, get_responses, results):
+    """
+    Store the body and errors of each document of a group in results, from
+    the responses returned by get_responses.
+    """
+    try:
+        responses = get_responses()
+    except Exception as exc:
+        errors = _unexpected_failure_errors(exc)
+        for item in group:
+            results[item[0]] = (None, errors)
+        return
+
+    for item, response in zip(group, responses):
+        (index, url, headers, cache_keys, source, render_key,
+         render_timeout) = item
+        try:
+            if isinstance(response, Exception):
+                raise response
+            body, errors = _process_get_response(response, cache_keys)
+            set_cached_rendering(render_key, body, errors, render_timeout)
+            results[index] = (body, errors)
+        except Exception as exc:
+            results[index] = (None, _unexpected_failure_errors(exc))
+
+
+class BatchItemResponse(object):
+    """
+    One document's part of a batch response, looking enough like a requests
+    response to be handled like the response to a single GET request.
+    """
+    def __init__(self, item):
+        self.status_code = item.get('status')
+        self.headers = CaseInsensitiveDict(item.get('headers') or {})
+        self.text = item.get('body') or u''
+
+
+def _get_defaults(cache_control, base_url, timeout):
     if not cache_control:
         # Default to the configured max-age for cache control.
         max_age = config.KUMASCRIPT_MAX_AGE
@@ -104,9 +364,16 @@ def get(document, cache_control, base_url, timeout=None):
     if not timeout:
         timeout = config.KUMASCRIPT_TIMEOUT
 
+    return cache_control, base_url, timeout
+
+
+def _build_get_request(document, cache_control, env_vars):
+    """
+    Build the URL, headers and cache keys of a kumascript GET request for a
+    document, passing it the given env vars.
+    """
     document_locale = document.locale
     document_slug = document.slug
-    max_age = config.KUMASCRIPT_MAX_AGE
 
     # 1063580 - Kumascript converts template name calls to lower case and bases
     # caching keys off of that.
@@ -114,104 +381,211 @@ def get(document, cache_control, base_url, timeout=None):
     if document.is_template:
         document_slug_for_kumascript = _format_slug_for_request(document_slug)
 
+    url_tmpl = settings.KUMASCRIPT_URL_TEMPLATE
+    url = unicode(url_tmpl).format(path=u'%s/%s' %
+                                   (document_locale,
+                                    document_slug_for_kumascript))
+
+    cache_keys = build_cache_keys(document_slug, document_locale)
+    etag_key, modified_key, body_key, errors_key = cache_keys
+
+    headers = {
+        'X-FireLogger': '1.2',
+        'Cache-Control': cache_control,
+    }
+    add_env_headers(headers, env_vars)
+
+    # Set up for conditional GET, if we have the details cached.
+    cached_meta = memcache.get_many([etag_key, modified_key])
+    if etag_key in cached_meta:
+        headers['If-None-Match'] = cached_meta[etag_key]
+    if modified_key in cached_meta:
+        headers['If-Modified-Since'] = cached_meta[modified_key]
+
+    return url, headers, cache_keys
+
+
+def _build_env_vars(document, cache_control, base_url):
+    """Build the env vars kumascript renders a document with."""
+    # Create the file interface
+    files = []
+    for attachment in document.files.select_related('current_revision'):
+        files.append(_get_attachment_metadata_dict(attachment))
+
+    # Assemble some KumaScript env vars
+    # TODO: See dekiscript vars for future inspiration
+    # http://developer.mindtouch.com/en/docs/DekiScript/Reference/
+    #   Wiki_Functions_and_Variables
+    path = document.get_absolute_url()
+    # TODO: Someday merge with _get_document_for_json in views.py
+    # where most of this is duplicated code.
+    env_vars = dict(
+        path=path,
+        url=urljoin(base_url, path),
+        id=document.pk,
+        revision_id=document.current_revision.pk,
+        locale=document.locale,
+        title=document.title,
+        files=files,
+        attachments=files,  # Just for sake of verbiage?
+        slug=document.slug,
+        tags=list(document.tags.names()),
+        review_tags=list(document.current_revision.review_tags.names()),
+        modified=time.mktime(document.modified.timetuple()),
+        cache_control=cache_control,
+    )
+    return env_vars
+
+
+def _process_get_response(response, cache_keys):
+    """Get the body and errors from the response to a kumascript GET"""
+    etag_key, modified_key, body_key, errors_key = cache_keys
+    max_age = config.KUMASCRIPT_MAX_AGE
     body, errors = None, None
 
-    try:
-        url_tmpl = settings.KUMASCRIPT_URL_TEMPLATE
-        url = unicode(url_tmpl).format(path=u'%s/%s' %
-                                       (document_locale,
-                                        document_slug_for_kumascript))
-
-        cache_keys = build_cache_keys(document_slug, document_locale)
-        etag_key, modified_key, body_key, errors_key = cache_keys
-
-        headers = {
-            'X-FireLogger': '1.2',
-            'Cache-Control': cache_control,
-        }
-
-        # Create the file interface
-        files = []
-        for attachment in document.files.select_related('current_revision'):
-            files.append(_get_attachment_metadata_dict(attachment))
-
-        # Assemble some KumaScript env vars
-        # TODO: See dekiscript vars for future inspiration
-        # http://developer.mindtouch.com/en/docs/DekiScript/Reference/
-        #   Wiki_Functions_and_Variables
-        path = document.get_absolute_url()
-        # TODO: Someday merge with _get_document_for_json in views.py
-        # where most of this is duplicated code.
-        env_vars = dict(
-            path=path,
-            url=urljoin(base_url, path),
-            id=document.pk,
-            revision_id=document.current_revision.pk,
-            locale=document.locale,
-            title=document.title,
-            files=files,
-            attachments=files,  # Just for sake of verbiage?
-            slug=document.slug,
-            tags=list(document.tags.names()),
-            review_tags=list(document.current_revision.review_tags.names()),
-            modified=time.mktime(document.modified.timetuple()),
-            cache_control=cache_control,
-        )
-        add_env_headers(headers, env_vars)
-
-        # Set up for conditional GET, if we have the details cached.
-        cached_meta = memcache.get_many([etag_key, modified_key])
-        if etag_key in cached_meta:
-            headers['If-None-Match'] = cached_meta[etag_key]
-        if modified_key in cached_meta:
-            headers['If-Modified-Since'] = cached_meta[modified_key]
+    if response.status_code == 304:
+        # Conditional GET was a pass, so use the cached content.
+        result = memcache.get_many([body_key, errors_key])
+        body = result.get(body_key, '').decode('utf-8')
+        errors = result.get(errors_key, None)
 
-        # Finally, fire off the request.
-        response = requests.get(url, headers=headers, timeout=timeout)
-
-        if response.status_code == 304:
-            # Conditional GET was a pass, so use the cached content.
-            result = memcache.get_many([body_key, errors_key])
-            body = result.get(body_key, '').decode('utf-8')
-            errors = result.get(errors_key, None)
-
-        elif response.status_code == 200:
-            body = process_body(response)
-            errors = process_errors(response)
-
-            # Cache the request for conditional GET, but use the max_age for
-            # the cache timeout here too.
-            headers = response.headers
-            memcache.set(etag_key, headers.get('etag'), timeout=max_age)
-            memcache.set(modified_key, headers.get('last-modified'), timeout=max_age)
-            memcache.set(body_key, body.encode('utf-8'), timeout=max_age)
-            if errors:
-                memcache.set(errors_key, errors, timeout=max_age)
-
-        elif response.status_code is None:
-            errors = KUMASCRIPT_TIMEOUT_ERROR
+    elif response.status_code == 200:
+        body = process_body(response)
+        errors = process_errors(response)
 
-        else:
-            errors = [
-                {
-                    "level": "error",
-                    "message": "Unexpected response from Kumascript service: %s" %
-                               response.status_code,
-                    "args": ["UnknownError"],
-                },
-            ]
+        # Cache the request for conditional GET, but use the max_age for
+        # the cache timeout here too.
+        headers = response.headers
+        memcache.set(etag_key, headers.get('etag'), timeout=max_age)
+        memcache.set(modified_key, headers.get('last-modified'), timeout=max_age)
+        memcache.set(body_key, body.encode('utf-8'), timeout=max_age)
+        if errors:
+            memcache.set(errors_key, errors, timeout=max_age)
 
-    except Exception as exc:
-        # Last resort: Something went really haywire. Kumascript server died
-        # mid-request, or something. Try to report at least some hint.
+    elif response.status_code is None:
+        errors = KUMASCRIPT_TIMEOUT_ERROR
+
+    else:
         errors = [
             {
                 "level": "error",
-                "message": "Kumascript service failed unexpectedly: %s" % exc,
+                "message": "Unexpected response from Kumascript service: %s" %
+                           response.status_code,
                 "args": ["UnknownError"],
             },
         ]
-    return (body, errors)
+
+    return body, errors
+
+
+def _unexpected_failure_errors(exc):
+    # Last resort: Something went really haywire. Kumascript server died
+    # mid-request, or something. Try to report at least some hint.
+    return [
+        {
+            "level": "error",
+            "message": "Kumascript service failed unexpectedly: %s" % exc,
+            "args": ["UnknownError"],
+        },
+    ]
+
+
+def get_cached_rendering(document, cache_control, env_vars=None):
+    """
+    Get the cached rendering of a document, as a (body, errors) tuple, or
+    None on a miss. Returned along with the key of the cached rendering,
+    which is None when the render cache is disabled.
+    """
+    if not config.KUMASCRIPT_RENDER_CACHE_TIMEOUT:
+        return None, None
+    render_key = build_render_cache_key(document, env_vars)
+    if cache_control == 'no-cache':
+        # A fresh rendering was asked for, which will replace this one.
+        return render_key, None
+    rendering = memcache.get(render_key)
+    with _render_cache_lock:
+        if rendering is None:
+            _render_cache_stats['misses'] += 1
+        else:
+            _render_cache_stats['hits'] += 1
+    return render_key, rendering
+
+
+def render_cache_timeout(document):
+    """
+    Return how long to cache a rendering of a document. A document with a
+    render_max_age calls macros whose output changes over time, so its
+    rendering isn't cached for longer, and the next rendering of the stale
+    document gets a fresh one.
+    """
+    timeout = config.KUMASCRIPT_RENDER_CACHE_TIMEOUT
+    if document.render_max_age:
+        timeout = min(timeout, document.render_max_age)
+    return timeout
+
+
+def set_cached_rendering(render_key, body, errors, timeout):
+    """Cache a rendering, unless it failed or the render cache is disabled"""
+    if render_key and body is not None and not errors:
+        memcache.set(render_key, (body, errors), timeout=timeout)
+
+
+def render_cache_stats():
+    """Return the hits and misses of the render cache in this process"""
+    with _render_cache_lock:
+        stats = dict(_render_cache_stats)
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_ratio'] = lookups and stats['hits'] / float(lookups)
+    return stats
+
+
+def build_render_cache_key(document, env_vars=None):
+    """
+    Build the key of the cached rendering of a document, from a hash of its
+    locale, slug and source, the env vars kumascript renders it with but
+    its modification time, and the current revisions of the templates it
+    calls. Editing the document, its tags or attachments, or one of those
+    templates changes the key, leaving the outdated rendering to expire
+    unused.
+    """
+    if env_vars is None:
+        env_vars = _build_env_vars(document, None, '')
+    # The cache control and the site of the request don't change the
+    # rendering. Neither does the modification time, changed by every save
+    # of the rendering itself, which the revision ID stands for.
+    env = sorted((name, sorted(value) if name in ('tags', 'review_tags')
+                  else value)
+                 for name, value in env_vars.items()
+                 if name not in ('cache_control', 'url', 'modified'))
+    source = document.html or u''
+    source_hash = hashlib.sha1(source.encode('utf8')).hexdigest()
+    dependencies = [document.locale, document.slug, source_hash, env,
+                    get_macro_versions(document.get_macro_names())]
+    digest = hashlib.sha1(json.dumps(dependencies)).hexdigest()
+    return 'kumascript:render:%s' % digest
+
+
+def get_macro_versions(macro_names):
+    """
+    Return a list of (macro name, version) pairs, where the version is the
+    current revision ID of the macro's template, or None for a missing one.
+    Kumascript loads templates from the default locale only.
+    """
+    from kuma.wiki.models import Document
+    versions = {}
+    if macro_names:
+        # Kumascript looks templates up case-insensitively.
+        slugs = reduce(operator.or_,
+                       (Q(slug__iexact=TEMPLATE_TITLE_PREFIX + name)
+                        for name in macro_names))
+        templates = (Document.objects
+                             .filter(slugs,
+                                     locale=settings.WIKI_DEFAULT_LANGUAGE,
+                                     is_template=True)
+                             .values_list('slug', 'current_revision_id'))
+        for slug, revision_id in templates:
+            versions[slug[len(TEMPLATE_TITLE_PREFIX):].lower()] = revision_id
+    return [(name, versions.get(name)) for name in macro_names]
 
 
 def add_env_headers(headers, env_vars):
@@ -0,0 +1,109 @@
+"""
+Compare the latency of answering title autosuggest requests, or slug
+lookups of the dashboards, by scanning every title or slug, as the database
+did for title__icontains and slug__icontains, against the in-memory title
+and slug indexes, over synthetic documents. Each term is typed one
+keystroke at a time, as the typeaheads request it.
+"""
+from __future__ import division
+
+import random
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from kuma.wiki.titles import LocaleSlugs, LocaleTitles
+
+WORDS = (u'Array API CSS DOM Element Event Fetch Flexbox Global HTML '
+         u'HTTP Headers IndexedDB JavaScript Map Node Object Promise Proxy '
+         u'Reference Request Response SVG Set String Web WebGL Worker '
+         u'addEventListener border color display filter font grid margin '
+         u'prototype querySelector reduce transform transition').split()
+TERMS = (u'array', u'flexbox', u'fetch', u'e', u'pr', u'grid', u'web worker',
+         u'proto', u'queryselector', u'zzz')
+
+
+class Rows(list):
+    def iterator(self):
+        return iter(self)
+
+
+def synthetic(locale_class):
+    """Return the class of an index loaded from synthetic rows"""
+    class SyntheticIndex(locale_class):
+        def __init__(self, rows):
+            super(SyntheticIndex, self).__init__('en-US')
+            self.synthetic_rows = rows
+
+        def rows(self, **filters):
+            return self.synthetic_rows
+
+    return SyntheticIndex
+
+
+class Command(BaseCommand):
+    help = ('Benchmark title autosuggest and slug lookups over synthetic '
+            'documents')
+    option_list = BaseCommand.option_list + (
+        make_option('--size', dest='size', type='int', default=200000,
+                    help='Number of documents'),
+        make_option('--limit', dest='limit', type='int', default=20,
+                    help='Number of suggestions per request'),
+        make_option('--repeat', dest='repeat', type='int', default=5,
+                    help='Number of requests per keystroke'),
+        make_option('--slugs', dest='slugs', action='store_true',
+                    default=False,
+                    help='Look up slugs rather than titles'),
+    )
+
+    def handle(self, *args, **options):
+        rows = Rows(self.synthetic_rows(options['size']))
+        if options['slugs']:
+            index = synthetic(LocaleSlugs)(rows)
+            field = 2
+        else:
+            index = synthetic(LocaleTitles)(rows)
+            field = 1
+        start = time.time()
+        index.load()
+        self.stdout.write(u'Loaded %s documents in %.2fs' %
+                          (options['size'], time.time() - start))
+
+        limit = options['limit']
+        self.stdout.write(u'The slowest keystroke of each term:')
+        self.stdout.write(u'%-16s %12s %12s %8s' %
+                          ('keystrokes', 'scan', 'index', 'matches'))
+        for term in TERMS:
+            scanned = indexed = 0
+            for length in range(1, len(term) + 1):
+                typed = term[:length]
+                scanned = max(scanned, self.measure(
+                    lambda: self.scan(rows, field, typed, limit),
+                    options['repeat']))
+                indexed = max(indexed, self.measure(
+                    lambda: index.search(typed, limit), options['repeat']))
+            self.stdout.write(u'%-16s %10.2fms %10.2fms %8s' %
+                              (term, scanned * 1000, indexed * 1000,
+                               len(index.search(term, limit))))
+
+    def synthetic_rows(self, size):
+        random.seed(size)
+        for pk in xrange(1, size + 1):
+            title = u' '.join(random.sample(WORDS, random.randint(1, 4)))
+            slug = title.replace(u' ', u'/')
+            yield (pk, title, slug, False, False, None)
+
+    def scan(self, rows, field, term, limit):
+        """Sort every title or slug containing the term, then take the
+        first"""
+        term = term.lower()
+        matches = sorted((row[field].lower(), len(row[2]), row[0])
+                         for row in rows if term in row[field].lower())
+        return matches[:limit]
+
+    def measure(self, fn, repeat):
+        start = time.time()
+        for i in xrange(repeat):
+            fn()
+        return (time.time() - start) / repeat
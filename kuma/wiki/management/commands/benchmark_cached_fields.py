@@ -0,0 +1,82 @@
+"""
+Compare the CPU time spent building the cached content fields of documents
+one field at a time, as the separate getters do, against building them all
+from a single parse, as a render does.
+"""
+from __future__ import division
+
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from kuma.wiki.content import CACHED_FIELDS
+from kuma.wiki.models import Document
+
+
+class Command(BaseCommand):
+    args = '<document_path document_path ...>'
+    help = 'Benchmark building the cached content fields of documents'
+    option_list = BaseCommand.option_list + (
+        make_option('--limit', dest='limit', type='int', default=20,
+                    help='Number of the largest rendered documents to use '
+                         'when no document paths are given'),
+        make_option('--repeat', dest='repeat', type='int', default=5,
+                    help='Number of times to build the fields of each '
+                         'document'),
+    )
+
+    def handle(self, *args, **options):
+        if args:
+            docs = [self.get_document(path) for path in args]
+        else:
+            docs = list(Document.objects
+                                .exclude(rendered_html__isnull=True)
+                                .extra(select={'length':
+                                               'CHAR_LENGTH(rendered_html)'})
+                                .order_by('-length')[:options['limit']])
+        if not docs:
+            raise CommandError('No rendered documents to benchmark')
+
+        separate_total = single_total = 0
+        for doc in docs:
+            separate = self.time(options['repeat'], self.build_separately,
+                                 doc)
+            single = self.time(options['repeat'], doc.build_cached_fields)
+            separate_total += separate
+            single_total += single
+            self.stdout.write(u'%8.1fms %8.1fms %5.2fx  %s' %
+                              (separate * 1000, single * 1000,
+                               separate / single, doc.get_absolute_url()))
+
+        self.stdout.write(u'%8.1fms %8.1fms %5.2fx  total for %s documents' %
+                          (separate_total * 1000, single_total * 1000,
+                           separate_total / single_total, len(docs)))
+
+    def get_document(self, path):
+        # Accept the same kinds of paths as the render_document command.
+        if path.startswith('/'):
+            path = path[1:]
+        locale, sep, slug = path.partition('/')
+        head, sep, tail = slug.partition('/')
+        if head == 'docs':
+            slug = tail
+        try:
+            return Document.objects.get(locale=locale, slug=slug)
+        except Document.DoesNotExist:
+            raise CommandError('Document not found: %s' % path)
+
+    def build_separately(self, doc):
+        for field_name in CACHED_FIELDS:
+            doc.build_cached_fields(field_name)
+
+    def time(self, repeat, fn, *args):
+        """Return the best CPU time in seconds of repeated calls to fn"""
+        best = None
+        for i in range(repeat):
+            start = time.clock()
+            fn(*args)
+            elapsed = time.clock() - start
+            if best is None or elapsed < best:
+                best = elapsed
+        return best
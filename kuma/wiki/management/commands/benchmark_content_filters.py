@@ -0,0 +1,78 @@
+"""
+Time the content filters that buffer the token stream over synthetic
+documents of growing size, to check that their cost stays linear.
+"""
+from __future__ import division
+
+import time
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from kuma.wiki.content import (LinkAnnotationFilter, SectionIDFilter,
+                               parse)
+
+
+# One section of a synthetic document. Headings repeat every few sections
+# to exercise the unique ID generation, and links cycle through a small pool
+# of slugs to keep the existence check query the same size for any document.
+SECTION_TMPL = (u'<h2>Section %(heading)s</h2>\n'
+                u'<p>Some text with <a href="/en-US/docs/Page_%(slug)s">a '
+                u'link</a>, <a href="https://example.com/">another</a> and '
+                u'<code>code</code>.</p>\n')
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the buffering content filters on synthetic documents'
+    option_list = BaseCommand.option_list + (
+        make_option('--sizes', dest='sizes',
+                    default='10000,100000,1000000',
+                    help='Comma-separated list of document sizes, in tokens'),
+        make_option('--repeat', dest='repeat', type='int', default=3,
+                    help='Number of times to run each filter'),
+    )
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',')]
+        except ValueError:
+            raise CommandError('Sizes must be a list of integers')
+
+        filters = (
+            ('SectionIDFilter', SectionIDFilter),
+            ('LinkAnnotationFilter',
+             lambda source: LinkAnnotationFilter(source, settings.SITE_URL)),
+        )
+
+        tokens_per_section = self.count_tokens(parse(self.build_src(1)))
+        for size in sizes:
+            sections = max(1, size // tokens_per_section)
+            parsed = parse(self.build_src(sections))
+            tokens = self.count_tokens(parsed)
+            for name, filter_cls in filters:
+                elapsed = self.time(options['repeat'], parsed, filter_cls)
+                self.stdout.write(u'%-20s %9s tokens %9.1fms %6.3fus/token' %
+                                  (name, tokens, elapsed * 1000,
+                                   elapsed * 1000000 / tokens))
+
+    def build_src(self, sections):
+        return u''.join(SECTION_TMPL % {'heading': i // 4, 'slug': i % 100}
+                        for i in range(sections))
+
+    def count_tokens(self, parsed):
+        return sum(1 for token in parsed.clone().stream)
+
+    def time(self, repeat, parsed, filter_cls):
+        """Return the best CPU time in seconds of filtering the content"""
+        best = None
+        for i in range(repeat):
+            # Walk the tree up front, so only the filter itself is timed.
+            stream = list(parsed.clone().stream)
+            start = time.clock()
+            for token in filter_cls(stream):
+                pass
+            elapsed = time.clock() - start
+            if best is None or elapsed < best:
+                best = elapsed
+        return best
@@ -0,0 +1,98 @@
+"""
+Compare the bytes fetched, the memory held by the loaded documents and the
+time taken by the queries of the document lists, breadcrumbs and translation
+lookups when loading the whole documents, as they used to, against leaving
+out their content, over synthetic documents which are rolled back
+afterwards.
+"""
+from __future__ import division
+
+import sys
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from kuma.wiki.constants import DOCUMENT_CONTENT_FIELDS, DOCUMENTS_PER_PAGE
+from kuma.wiki.models import Document
+
+
+class Command(BaseCommand):
+    help = ('Benchmark loading documents with and without their content on '
+            'synthetic documents')
+    option_list = BaseCommand.option_list + (
+        make_option('--size', dest='size', type='int', default=1000,
+                    help='Number of documents'),
+        make_option('--content', dest='content', type='int', default=100,
+                    help='Kilobytes in each content field'),
+        make_option('--depth', dest='depth', type='int', default=5,
+                    help='Number of topical parents of the last document'),
+    )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            docs = self.build_documents(options['size'], options['content'],
+                                        options['depth'])
+            prefix = docs[0].slug
+            parents = docs[-options['depth'] - 1:-1]
+            self.stdout.write(u'%s documents with %sKB in each content field'
+                              % (options['size'], options['content']))
+            self.stdout.write(u'%-12s %-8s %12s %12s %10s' %
+                              ('query', 'content', 'fetched', 'memory',
+                               'time'))
+            for name, queryset in (
+                    ('list', Document.objects.filter_for_list(locale='en-US')
+                                             .filter(slug__startswith=prefix)
+                                             [:DOCUMENTS_PER_PAGE]),
+                    ('parents', Document.admin_objects.defer_content()
+                                        .filter(pk__in=[doc.pk
+                                                        for doc in parents])),
+                    ('translation', Document.objects.defer_content()
+                                            .filter(locale='fr',
+                                                    parent=docs[0]))):
+                for content, measured in (('with', queryset.defer(None)),
+                                          ('without', queryset)):
+                    fetched, elapsed = self.fetch(measured)
+                    memory = self.memory(list(measured))
+                    self.stdout.write(u'%-12s %-8s %10.1fKB %10.1fKB %8.1fms' %
+                                      (name, content, fetched / 1024,
+                                       memory / 1024, elapsed * 1000))
+            transaction.set_rollback(True)
+
+    def build_documents(self, size, content, depth):
+        """Create the documents with one insert, the last ones nested"""
+        slug = u'Benchmark_Content_%d' % time.time()
+        text = u'<p>%s</p>' % (u'x' * (content * 1024 - 7))
+        fields = dict((field, text) for field in DOCUMENT_CONTENT_FIELDS)
+        Document.objects.bulk_create(
+            Document(locale='en-US', slug=u'%s/Page_%s' % (slug, i),
+                     title=u'Page %s' % i, **fields)
+            for i in range(size))
+        docs = list(Document.objects.filter(locale='en-US',
+                                            slug__startswith=slug)
+                                    .order_by('pk'))
+        for parent, child in zip(docs[-depth - 1:], docs[-depth:]):
+            Document.objects.filter(pk=child.pk).update(parent_topic=parent)
+        Document.objects.create(locale='fr', slug=docs[0].slug,
+                                title=docs[0].title, parent=docs[0],
+                                **fields)
+        return docs
+
+    def fetch(self, queryset):
+        """Run the SQL of the queryset, returning the bytes of the text
+        columns fetched and the time taken"""
+        sql, params = queryset.query.sql_with_params()
+        cursor = connection.cursor()
+        start = time.time()
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+        elapsed = time.time() - start
+        fetched = sum(len(value) for row in rows for value in row
+                      if isinstance(value, basestring))
+        return fetched, elapsed
+
+    def memory(self, docs):
+        """The approximate memory held by the field values of documents"""
+        return sum(sys.getsizeof(value)
+                   for doc in docs for value in doc.__dict__.values())
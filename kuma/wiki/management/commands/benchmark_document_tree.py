@@ -0,0 +1,83 @@
+"""
+Compare the number of queries and the time taken to load a tree of
+documents one level at a time, as get_descendants used to, against loading
+it at once, over a synthetic tree which is rolled back afterwards.
+"""
+from __future__ import division
+
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from kuma.core.utils import chunked
+from kuma.wiki.models import Document
+from kuma.wiki.views.document import _make_doc_structure
+
+
+class Command(BaseCommand):
+    help = 'Benchmark loading a tree of documents on a synthetic tree'
+    option_list = BaseCommand.option_list + (
+        make_option('--size', dest='size', type='int', default=5000,
+                    help='Number of documents in the tree'),
+        make_option('--fanout', dest='fanout', type='int', default=10,
+                    help='Number of children of each document'),
+        make_option('--locale', dest='locale', default='en-US',
+                    help='Locale of the tree'),
+    )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            root = self.build_tree(options['size'], options['fanout'],
+                                   options['locale'])
+            self.stdout.write(u'Tree of %s documents under %s' %
+                              (options['size'], root.slug))
+            for name, fn in (
+                    ('level by level', lambda: self.get_descendants(root)),
+                    ('at once', lambda: root.get_descendants()),
+                    ('$children', lambda: _make_doc_structure(
+                        root, 0, False, options['size']))):
+                queries, elapsed = self.measure(fn)
+                self.stdout.write(u'%-16s %8s queries %9.1fms' %
+                                  (name, queries, elapsed * 1000))
+            transaction.set_rollback(True)
+
+    def build_tree(self, size, fanout, locale):
+        """Create the tree level by level, with one insert per level"""
+        slug = u'Benchmark_Tree_%d' % time.time()
+        root = Document.objects.create(locale=locale, slug=slug, title=slug)
+        parents = [root]
+        count = 1
+        while count < size:
+            children = []
+            for parent in parents:
+                for i in range(min(fanout, size - count - len(children))):
+                    child_slug = u'%s/Page_%s' % (parent.slug, i)
+                    children.append(Document(locale=locale, slug=child_slug,
+                                             title=child_slug,
+                                             parent_topic=parent))
+            Document.objects.bulk_create(children)
+            count += len(children)
+            parents = []
+            for slugs in chunked([child.slug for child in children], 500):
+                parents.extend(Document.objects.filter(locale=locale,
+                                                       slug__in=slugs))
+        return root
+
+    def get_descendants(self, document):
+        """The former get_descendants, querying the children of each
+        document in turn"""
+        results = []
+        for child in document.children.filter(locale=document.locale):
+            results.append(child)
+            results.extend(self.get_descendants(child))
+        return results
+
+    def measure(self, fn):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.time()
+            fn()
+            elapsed = time.time() - start
+        return len(queries), elapsed
@@ -0,0 +1,148 @@
+"""
+Compare the throughput of indexing documents serialized one query and one
+parse at a time, as index_documents used to, against the batched
+serialization, using a local stand-in for Elasticsearch which accepts every
+bulk request.
+"""
+from __future__ import division
+
+import json
+import threading
+import time
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from optparse import make_option
+from SocketServer import ThreadingMixIn
+
+from django.core.exceptions import ObjectDoesNotExist
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils.html import strip_tags
+from elasticsearch import Elasticsearch
+
+from kuma.core.utils import chunked
+from kuma.wiki.models import Document
+from kuma.wiki.search import WikiDocumentType
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Accept the actions of bulk requests, without storing anything"""
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        lines = self.rfile.read(int(self.headers['Content-Length']))
+        items = []
+        for line in lines.splitlines():
+            if not line.strip():
+                continue
+            action = json.loads(line)
+            if 'index' in action:
+                items.append({'index': dict(action['index'], status=201)})
+        self.respond({'took': 1, 'errors': False, 'items': items})
+
+    def do_HEAD(self):
+        self.respond({})
+
+    def respond(self, data):
+        body = json.dumps(data)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StandInServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class Command(BaseCommand):
+    help = ('Benchmark serializing and indexing documents one at a time '
+            'against in batches, with a local stand-in for Elasticsearch')
+    option_list = BaseCommand.option_list + (
+        make_option('--limit', dest='limit', type='int', default=1000,
+                    help='Number of documents to index'),
+        make_option('--chunk-size', dest='chunk_size', type='int',
+                    default=100,
+                    help='Number of documents per index_documents task'),
+    )
+
+    def handle(self, *args, **options):
+        ids = list(WikiDocumentType.get_indexable()
+                                   .order_by('-modified')[:options['limit']])
+        if not ids:
+            raise CommandError('No documents to index')
+        chunks = list(chunked(ids, options['chunk_size']))
+
+        server = StandInServer(('127.0.0.1', 0), StandInHandler)
+        server_thread = threading.Thread(target=server.serve_forever)
+        server_thread.daemon = True
+        server_thread.start()
+        es = Elasticsearch(['http://127.0.0.1:%s' % server.server_port])
+
+        try:
+            results = []
+            for name, serialize in (('per document', self.serialize_each),
+                                    ('batched', self.serialize_batch)):
+                queries, elapsed = self.measure(
+                    lambda: [WikiDocumentType.bulk_index(serialize(chunk),
+                                                         es=es,
+                                                         index='benchmark')
+                             for chunk in chunks])
+                results.append(elapsed)
+                self.stdout.write(u'%-14s %8s queries %8.2fs %8.1f '
+                                  u'documents/s' %
+                                  (name, queries, elapsed, len(ids) / elapsed))
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.stdout.write(u'%.2fx throughput with chunks of %s documents' %
+                          (results[0] / results[1], options['chunk_size']))
+
+    def serialize_batch(self, ids):
+        return [WikiDocumentType.from_django(obj)
+                for obj in WikiDocumentType.get_indexing_queryset(ids)]
+
+    def serialize_each(self, ids):
+        """The former serialization, with its own queries for the tags,
+        zone and parent of each document and a parse for each field"""
+        documents = []
+        for obj in Document.objects.filter(id__in=ids):
+            doc = {
+                'id': obj.id,
+                'title': obj.title,
+                'slug': obj.slug,
+                'summary': obj.get_summary_text(),
+                'locale': obj.locale,
+                'modified': obj.modified,
+                'content': strip_tags(obj.rendered_html or ''),
+                'tags': list(obj.tags.names()),
+                'kumascript_macros': obj.extract.macro_names(),
+                'css_classnames': obj.extract.css_classnames(),
+                'html_attributes': obj.extract.html_attributes(),
+            }
+            try:
+                doc['boost'] = 8.0 if obj.zone else 1.0
+            except ObjectDoesNotExist:
+                doc['boost'] = 1.0
+            doc['parent'] = {}
+            if obj.parent:
+                doc['parent'] = {
+                    'id': obj.parent.id,
+                    'title': obj.parent.title,
+                    'locale': obj.parent.locale,
+                    'slug': obj.parent.slug,
+                }
+            documents.append(doc)
+        return documents
+
+    def measure(self, fn):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.time()
+            fn()
+            elapsed = time.time() - start
+        return len(queries), elapsed
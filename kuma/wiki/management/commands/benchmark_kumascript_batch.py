@@ -0,0 +1,130 @@
+"""
+Compare the throughput of rendering documents with one kumascript request
+each against batched and concurrent requests, using a local stand-in for kumascript which
+simulates the cost of a request and of rendering a document.
+"""
+from __future__ import division
+
+import json
+import threading
+import time
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from optparse import make_option
+from SocketServer import ThreadingMixIn
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from kuma.core.utils import chunked
+from kuma.wiki import kumascript
+from kuma.wiki.models import Document
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Render documents as-is, after sleeping for the simulated costs"""
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        time.sleep(self.server.request_time + self.server.render_time)
+        self.respond({'body': u'<p>%s</p>' % self.path})
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        documents = json.loads(body)['documents']
+        time.sleep(self.server.request_time +
+                   self.server.render_time * len(documents))
+        self.respond({'documents': [
+            {'status': 200, 'headers': {}, 'body': document['source']}
+            for document in documents]})
+
+    def respond(self, data):
+        body = json.dumps(data)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StandInServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class Command(BaseCommand):
+    help = ('Benchmark single against batched and concurrent kumascript '
+            'requests, with a local stand-in for kumascript')
+    option_list = BaseCommand.option_list + (
+        make_option('--limit', dest='limit', type='int', default=100,
+                    help='Number of documents to render'),
+        make_option('--batch-size', dest='batch_size', type='int',
+                    default=settings.KUMASCRIPT_BATCH_SIZE,
+                    help='Number of documents per batch request'),
+        make_option('--concurrency', dest='concurrency', type='int',
+                    default=settings.KUMASCRIPT_POOL_SIZE,
+                    help='Number of concurrent requests'),
+        make_option('--request-time', dest='request_time', type='float',
+                    default=0.02,
+                    help='Simulated seconds of overhead per request'),
+        make_option('--render-time', dest='render_time', type='float',
+                    default=0.005,
+                    help='Simulated seconds to render each document'),
+    )
+
+    def handle(self, *args, **options):
+        docs = list(Document.objects
+                            .filter(is_redirect=False,
+                                    current_revision__isnull=False)
+                            .order_by('-modified')[:options['limit']])
+        if not docs:
+            raise CommandError('No documents to render')
+
+        server = StandInServer(('127.0.0.1', 0), StandInHandler)
+        server.request_time = options['request_time']
+        server.render_time = options['render_time']
+        server_thread = threading.Thread(target=server.serve_forever)
+        server_thread.daemon = True
+        server_thread.start()
+        server_url = 'http://127.0.0.1:%s' % server.server_port
+
+        try:
+            with override_settings(
+                    KUMASCRIPT_URL_TEMPLATE=server_url + '/docs/{path}',
+                    KUMASCRIPT_BATCH_URL=server_url + '/batch'):
+                kumascript.reset_session()
+                single = self.time(lambda: [
+                    kumascript.get(doc, 'no-cache', settings.SITE_URL,
+                                   timeout=60)
+                    for doc in docs])
+                batched = self.time(lambda: [
+                    kumascript.get_many(batch, 'no-cache', settings.SITE_URL,
+                                        timeout=60)
+                    for batch in chunked(docs, options['batch_size'])])
+                concurrent = self.time(lambda: self.get_concurrently(
+                    docs, options['concurrency']))
+        finally:
+            kumascript.reset_session()
+            server.shutdown()
+            server.server_close()
+
+        for name, elapsed in (('single', single), ('batched', batched),
+                              ('concurrent', concurrent)):
+            self.stdout.write(u'%-10s %8.2fs %8.1f documents/s' %
+                              (name, elapsed, len(docs) / elapsed))
+        self.stdout.write(u'%.2fx throughput with batches of %s documents' %
+                          (single / batched, options['batch_size']))
+        self.stdout.write(u'%.2fx throughput with %s concurrent requests' %
+                          (single / concurrent, options['concurrency']))
+
+    def get_concurrently(self, docs, concurrency):
+        with override_settings(KUMASCRIPT_BATCH_URL=''):
+            kumascript.get_many(docs, 'no-cache', settings.SITE_URL,
+                                timeout=60, concurrency=concurrency)
+
+    def time(self, fn):
+        start = time.time()
+        fn()
+        return time.time() - start
@@ -0,0 +1,79 @@
+"""
+Compare the latency of remapping request paths by scanning the URL remaps of
+every zone, as DocumentZoneMiddleware used to, against the compiled tries of
+path segments, over synthetic zones.
+"""
+from __future__ import division
+
+import random
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from kuma.wiki.zones import ZoneURLRemaps
+
+WORDS = (u'API CSS DOM Firefox Guide HTML HTTP JavaScript Learn Mozilla '
+         u'Reference SVG Tools Web WebAssembly WebExtensions').split()
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the URL remaps of document zones on synthetic zones'
+    option_list = BaseCommand.option_list + (
+        make_option('--zones', dest='zones', type='int', default=1000,
+                    help='Number of zones with a URL root'),
+        make_option('--requests', dest='requests', type='int',
+                    default=10000,
+                    help='Number of request paths to remap'),
+    )
+
+    def handle(self, *args, **options):
+        random.seed(options['zones'])
+        remaps = self.synthetic_remaps(options['zones'])
+        start = time.time()
+        compiled = ZoneURLRemaps(remaps)
+        self.stdout.write(u'Compiled %s zones in %.2fms' %
+                          (len(remaps), (time.time() - start) * 1000))
+
+        self.stdout.write(u'%-12s %12s %12s' % ('paths', 'scan', 'trie'))
+        for name, paths in (
+                ('wiki paths', self.paths(remaps, 0, options['requests'])),
+                ('URL roots', self.paths(remaps, 1, options['requests'])),
+                ('unzoned', [u'/docs/Web/Page_%s' % i
+                             for i in range(options['requests'])])):
+            for path in paths[:100]:
+                assert self.scan(remaps, path) == compiled.remap(path), path
+            scanned = self.measure(
+                lambda: [self.scan(remaps, path) for path in paths])
+            compiled_time = self.measure(
+                lambda: [compiled.remap(path) for path in paths])
+            self.stdout.write(u'%-12s %10.2fus %10.2fus' %
+                              (name, scanned / len(paths) * 10 ** 6,
+                               compiled_time / len(paths) * 10 ** 6))
+
+    def synthetic_remaps(self, size):
+        remaps = []
+        for i in range(size):
+            slug = u'/'.join(random.sample(WORDS, random.randint(1, 3)) +
+                             [u'Zone_%s' % i])
+            remaps.append((u'/docs/%s' % slug, u'/zone-%06d' % i))
+        return remaps
+
+    def paths(self, remaps, index, size):
+        return [u'%s/Page/Subpage_%s' % (random.choice(remaps)[index], i)
+                for i in range(size)]
+
+    def scan(self, remaps, path):
+        """The former remapping of the middleware, for zones not nested
+        within one another"""
+        for original_path, new_path in remaps:
+            if (path == original_path or
+                    path.startswith(u''.join([original_path, '/']))):
+                return True, path.replace(original_path, new_path, 1)
+            elif path.startswith(new_path):
+                return False, path.replace(new_path, original_path, 1)
+
+    def measure(self, fn):
+        start = time.time()
+        fn()
+        return time.time() - start
@@ -0,0 +1,68 @@
+"""
+Inspect the macro index: which documents get rendered again after a change
+to a template, in which order, and which macros are called the most.
+"""
+from collections import Counter
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from kuma.wiki.constants import TEMPLATE_TITLE_PREFIX
+from kuma.wiki.models import Document, DocumentMacro
+
+
+class Command(BaseCommand):
+    args = '<macro_name macro_name ...>'
+    help = 'Show the documents calling macros, from the macro index'
+    option_list = BaseCommand.option_list + (
+        make_option('--limit', dest='limit', type='int', default=20,
+                    help='Number of documents or macros to list'),
+        make_option('--top', action='store_true', dest='top', default=False,
+                    help='List the macros called by the most documents'),
+        make_option('--rebuild', action='store_true', dest='rebuild',
+                    default=False,
+                    help='Index the macros called by every document first'),
+    )
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            self.rebuild()
+
+        if options['top']:
+            macros = (DocumentMacro.objects
+                                   .filter(document__deleted=False)
+                                   .values('name')
+                                   .annotate(callers=Count('document'))
+                                   .order_by('-callers'))
+            for macro in macros[:options['limit']]:
+                self.stdout.write(u'%8s  %s' % (macro['callers'],
+                                                macro['name']))
+
+        for macro_name in args:
+            if macro_name.startswith(TEMPLATE_TITLE_PREFIX):
+                macro_name = macro_name[len(TEMPLATE_TITLE_PREFIX):]
+            pks = DocumentMacro.objects.callers(macro_name)
+            self.stdout.write(u'%s documents call %s' % (len(pks),
+                                                         macro_name))
+            locales = Counter(Document.objects.filter(pk__in=pks)
+                                              .values_list('locale',
+                                                           flat=True))
+            for locale, count in locales.most_common():
+                self.stdout.write(u'%8s  %s' % (count, locale))
+            if pks:
+                self.stdout.write(u'Rendered again in this order:')
+                documents = Document.objects.in_bulk(pks[:options['limit']])
+                for pk in pks[:options['limit']]:
+                    self.stdout.write(u'  %s' %
+                                      documents[pk].get_absolute_url())
+
+    def rebuild(self):
+        documents = Document.objects.filter(is_redirect=False)
+        total = documents.count()
+        for count, document in enumerate(documents.iterator(), 1):
+            document.update_macros()
+            if count % 5000 == 0:
+                self.stdout.write(u'Indexed macros of %s / %s documents' %
+                                  (count, total))
+        self.stdout.write(u'Indexed macros of %s documents' % total)
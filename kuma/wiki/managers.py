@@ -1,16 +1,19 @@
 from datetime import date, datetime, timedelta
 
+from django.conf import settings
 from django.core import serializers
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, F, Max
 
 import bleach
 from constance import config
-from django_mysql.models import QuerySet
+
+from kuma.users.jobs import UserGravatarURLJob
 
 from .constants import (ALLOWED_TAGS, ALLOWED_ATTRIBUTES, ALLOWED_STYLES,
                         TEMPLATE_TITLE_PREFIX)
 from .content import parse as parse_content
-from .queries import TransformQuerySet
+from .queries import DocumentQuerySet, TransformQuerySet
 
 
 class TransformManager(models.Manager):
@@ -22,7 +25,10 @@ class TransformManager(models.Manager):
 class BaseDocumentManager(models.Manager):
     """Manager for Documents, assists for queries"""
     def get_queryset(self):
-        return QuerySet(self.model)
+        return DocumentQuerySet(self.model)
+
+    def defer_content(self, *keep):
+        return self.get_queryset().defer_content(*keep)
 
     def clean_content(self, content_in, use_constance_bleach_whitelists=False):
         allowed_hosts = config.KUMA_WIKI_IFRAME_ALLOWED_HOSTS
@@ -90,9 +96,9 @@ class BaseDocumentManager(models.Manager):
         if toplevel:
             docs = docs.filter(parent_topic__isnull=True)
 
-        # Leave out the html, since that leads to huge cache objects and we
-        # never use the content in lists.
-        docs = docs.defer('html')
+        # Leave out the content, since that leads to huge cache objects and
+        # we never use it in lists, but for the summaries.
+        docs = docs.defer_content('summary_text')
         return docs
 
     def filter_for_review(self, locale=None, tag=None, tag_name=None):
@@ -106,7 +112,7 @@ class BaseDocumentManager(models.Manager):
             query = {query % 'name__isnull': False}
         if locale:
             query['locale'] = locale
-        return self.filter(**query).distinct()
+        return self.filter(**query).distinct().defer_content()
 
     def filter_with_localization_tag(self, locale=None, tag=None, tag_name=None):
         """Filter for documents with a localization tag on current revision"""
@@ -119,7 +125,7 @@ class BaseDocumentManager(models.Manager):
             query = {query % 'name__isnull': False}
         if locale:
             query['locale'] = locale
-        return self.filter(**query).distinct()
+        return self.filter(**query).distinct().defer_content()
 
     def dump_json(self, queryset, stream):
         """Export a stream of JSON-serialized Documents and Revisions
@@ -228,6 +234,98 @@ class TaggedDocumentManager(models.Manager):
         return base_qs.filter(content_object__deleted=False)
 
 
+class DocumentMacroManager(models.Manager):
+
+    def callers(self, macro_name):
+        """
+        Return the pks of the documents calling a macro, in the order to
+        render them again after a change to the macro: documents in the
+        default language first, most recently modified first.
+        """
+        callers = (self.filter(name=macro_name.lower(),
+                               document__deleted=False,
+                               document__is_redirect=False)
+                       .order_by('-document__modified')
+                       .values_list('document_id', 'document__locale'))
+        default_locale = settings.WIKI_DEFAULT_LANGUAGE
+        return [pk for pk, locale in
+                sorted(callers, key=lambda caller: caller[1] != default_locale)]
+
+
+class DocumentContributorManager(models.Manager):
+
+    def contributors(self, document_id):
+        """
+        Return the ID, username, email and avatar of the active users who
+        contributed to a document, the most recent contributor first.
+        """
+        contributions = (self.filter(document_id=document_id,
+                                     user__is_active=True)
+                             .order_by('-last_contributed')
+                             .values_list('user_id', 'user__username',
+                                          'user__email'))
+        # Build the avatar URLs right away rather than caching each one.
+        gravatar = UserGravatarURLJob()
+        return [{'id': user_id,
+                 'username': username,
+                 'email': email,
+                 'gravatar_34': gravatar.fetch(email, size=34)}
+                for user_id, username, email in contributions]
+
+    def add_revision(self, revision):
+        """Count a new revision in the contributions of its creator"""
+        self.add_revisions([revision.document_id], revision.creator_id,
+                           revision.created)
+
+    def add_revisions(self, document_ids, user_id, created):
+        """
+        Count a revision created by a user in the contributions to each of
+        the given documents, e.g. the revisions of a moved tree of documents
+        """
+        contributions = self.filter(document_id__in=document_ids,
+                                    user_id=user_id)
+        existing = set(contributions.values_list('document_id', flat=True))
+        self._count_revision(contributions, created)
+        items = [self.model(document_id=document_id, user_id=user_id,
+                            last_contributed=created, revisions=1)
+                 for document_id in document_ids
+                 if document_id not in existing]
+        try:
+            with transaction.atomic():
+                self.bulk_create(items)
+        except IntegrityError:
+            # Some of the contributions were created concurrently meanwhile
+            for item in items:
+                try:
+                    with transaction.atomic():
+                        item.save(force_insert=True)
+                except IntegrityError:
+                    self._count_revision(
+                        self.filter(document_id=item.document_id,
+                                    user_id=user_id),
+                        created)
+
+    def _count_revision(self, contributions, created):
+        contributions.update(revisions=F('revisions') + 1)
+        (contributions.filter(last_contributed__lt=created)
+                      .update(last_contributed=created))
+
+    def remove_revision(self, revision):
+        """Count again the contributions of the creator of a deleted
+        revision"""
+        contributions = self.filter(document_id=revision.document_id,
+                                    user_id=revision.creator_id)
+        remaining = (type(revision)._default_manager
+                                   .filter(document_id=revision.document_id,
+                                           creator_id=revision.creator_id)
+                                   .aggregate(revisions=Count('id'),
+                                              last_contributed=Max('created')))
+        if remaining['revisions']:
+            contributions.update(**remaining)
+        else:
+            contributions.delete()
+
+
 class RevisionIPManager(models.Manager):
 
     def delete_old(self, days=30):
@@ -4,7 +4,7 @@ from django.shortcuts import render
 from kuma.core.utils import urlparams
 
 from .exceptions import ReadOnlyException
-from .jobs import DocumentZoneURLRemapsJob
+from .zones import url_remaps
 
 
 class ReadOnlyMiddleware(object):
@@ -30,31 +30,23 @@ class DocumentZoneMiddleware(object):
                 ('$subscribe' in request.path or '$files' in request.path)):
             return None
 
-        remaps = DocumentZoneURLRemapsJob().get(request.LANGUAGE_CODE)
-        for original_path, new_path in remaps:
-
-            if (
-                request.path_info == original_path or
-                request.path_info.startswith(u''.join([original_path, '/']))
-            ):
-                # Is this a request for the "original" wiki path? Redirect to
-                # new URL root, if so.
-                new_path = request.path_info.replace(original_path,
-                                                     new_path,
-                                                     1)
-                new_path = '/%s%s' % (request.LANGUAGE_CODE, new_path)
-
-                query = request.GET.copy()
-                if 'lang' in query:
-                    query.pop('lang')
-                new_path = urlparams(new_path, query_dict=query)
-
-                return HttpResponseRedirect(new_path)
-
-            elif request.path_info.startswith(new_path):
-                # Is this a request for the relocated wiki path? If so, rewrite
-                # the path as a request for the proper wiki view.
-                request.path_info = request.path_info.replace(new_path,
-                                                              original_path,
-                                                              1)
-                break
+        remapped = url_remaps.get(request.LANGUAGE_CODE).remap(
+            request.path_info)
+        if remapped is None:
+            return None
+        is_redirect, new_path = remapped
+        if is_redirect:
+            # Is this a request for the "original" wiki path? Redirect to
+            # new URL root, if so.
+            new_path = '/%s%s' % (request.LANGUAGE_CODE, new_path)
+
+            query = request.GET.copy()
+            if 'lang' in query:
+                query.pop('lang')
+            new_path = urlparams(new_path, query_dict=query)
+
+            return HttpResponseRedirect(new_path)
+
+        # Is this a request for the relocated wiki path? If so, rewrite
+        # the path as a request for the proper wiki view.
+        request.path_info = new_path
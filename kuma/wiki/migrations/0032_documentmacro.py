@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wiki', '0031_add_data_to_revisionip'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentMacro',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('name', models.CharField(max_length=255, db_index=True)),
+                ('document', models.ForeignKey(related_name='macros', to='wiki.Document')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='documentmacro',
+            unique_together=set([('document', 'name')]),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wiki', '0032_documentmacro'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='zone_subnav_html',
+            field=models.TextField(null=True, editable=False, blank=True),
+        ),
+    ]
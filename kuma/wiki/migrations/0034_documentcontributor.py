@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def index_contributors(apps, schema_editor):
+    Revision = apps.get_model('wiki', 'Revision')
+    DocumentContributor = apps.get_model('wiki', 'DocumentContributor')
+    contributions = (Revision.objects.values('document_id', 'creator_id')
+                                     .annotate(revisions=Count('id'),
+                                               last_contributed=Max('created'))
+                                     .order_by())
+    batch = []
+    for contribution in contributions.iterator():
+        batch.append(DocumentContributor(
+            document_id=contribution['document_id'],
+            user_id=contribution['creator_id'],
+            revisions=contribution['revisions'],
+            last_contributed=contribution['last_contributed']))
+        if len(batch) == 1000:
+            DocumentContributor.objects.bulk_create(batch)
+            batch = []
+    DocumentContributor.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('wiki', '0033_document_zone_subnav_html'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentContributor',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('last_contributed', models.DateTimeField()),
+                ('revisions', models.PositiveIntegerField(default=0)),
+                ('document', models.ForeignKey(related_name='contributions', to='wiki.Document')),
+                ('user', models.ForeignKey(related_name='document_contributions', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='documentcontributor',
+            unique_together=set([('document', 'user')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='documentcontributor',
+            index_together=set([('document', 'last_contributed')]),
+        ),
+        migrations.RunPython(index_contributors, migrations.RunPython.noop),
+    ]
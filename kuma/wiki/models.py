@@ -1,7 +1,6 @@
 import hashlib
 import json
-import sys
-import traceback
+from collections import defaultdict
 from datetime import datetime, timedelta
 from functools import wraps
 from uuid import uuid4
@@ -12,8 +11,8 @@ from constance import config
 from django.apps import apps
 from django.conf import settings
 from django.core.exceptions import ValidationError
-from django.db import models, transaction
-from django.db.models import signals
+from django.db import IntegrityError, models, transaction
+from django.db.models import Q, signals
 from django.utils.decorators import available_attrs
 from django.utils.functional import cached_property
 from django.utils.translation import ugettext, ugettext_lazy as _
@@ -27,25 +26,34 @@ from kuma.core.cache import memcache
 from kuma.core.exceptions import ProgrammingError
 from kuma.core.i18n import get_language_mapping
 from kuma.core.urlresolvers import reverse
+from kuma.core.utils import chunked
 from kuma.search.decorators import register_live_index
 from kuma.spam.models import AkismetSubmission, SpamAttempt
 
 from . import kumascript
-from .constants import (DEKI_FILE_URL, DOCUMENT_LAST_MODIFIED_CACHE_KEY_TMPL,
-                        KUMA_FILE_URL, REDIRECT_CONTENT, REDIRECT_HTML,
-                        TEMPLATE_TITLE_PREFIX)
+from .constants import (DEKI_FILE_URL, DOCUMENT_CONTENT_FIELDS,
+                        DOCUMENT_LAST_MODIFIED_CACHE_KEY_TMPL,
+                        DOCUMENT_MACROS_CACHE_KEY_TMPL,
+                        DOCUMENT_RESPONSE_GENERATION_CACHE_KEY_TMPL,
+                        DOCUMENT_SECTION_FRAGMENT_CACHE_KEY_TMPL,
+                        DOCUMENT_TREE_FIELDS, KUMA_FILE_URL, MOVE_CHUNK_SIZE,
+                        REDIRECT_CONTENT, REDIRECT_HTML,
+                        TEMPLATE_TITLE_PREFIX, TREE_CHUNK_SIZE)
 from .content import parse as parse_content
-from .content import (Extractor, H2TOCFilter, H3TOCFilter, SectionTOCFilter,
-                      get_content_sections, get_seo_description)
+from .content import (CACHED_FIELDS, Extractor, H2TOCFilter, H3TOCFilter,
+                      SectionTOCFilter, build_cached_fields,
+                      build_section_fragments, get_content_sections, get_seo_description)
 from .exceptions import (DocumentRenderedContentNotAvailable,
                          DocumentRenderingInProgress, PageMoveError,
                          SlugCollision, UniqueCollision)
-from .jobs import DocumentContributorsJob, DocumentZoneStackJob
+from .jobs import DocumentZoneStackJob
 from .managers import (DeletedDocumentManager, DocumentAdminManager,
+                       DocumentContributorManager, DocumentMacroManager,
                        DocumentManager, RevisionIPManager,
                        TaggedDocumentManager, TransformManager)
 from .signals import render_done
 from .templatetags.jinja_helpers import absolutify
+from .titles import locale_changed as titles_changed
 from .utils import tidy_content
 
 
@@ -310,6 +318,11 @@ class Document(NotificationsMixin, models.Model):
     zone_subnav_local_html = models.TextField(editable=False,
                                               blank=True, null=True)
 
+    # The subnav shown with the document: its own or that of the nearest zone
+    # above it having one, materialized when the document is rendered and
+    # when a zone above it changes
+    zone_subnav_html = models.TextField(editable=False, blank=True, null=True)
+
     toc_html = models.TextField(editable=False, blank=True, null=True)
 
     summary_html = models.TextField(editable=False, blank=True, null=True)
@@ -341,67 +354,74 @@ class Document(NotificationsMixin, models.Model):
 
     @cache_with_field('body_html')
     def get_body_html(self, *args, **kwargs):
-        html = self.rendered_html and self.rendered_html or self.html
-        sections_to_hide = ('Quick_Links', 'Subnav')
-        doc = parse_content(html)
-        for sid in sections_to_hide:
-            doc = doc.replaceSection(sid, '<!-- -->')
-        doc.injectSectionIDs()
-        doc.annotateLinks(base_url=settings.SITE_URL)
-        return doc.serialize()
+        return self.build_cached_fields('body_html')['body_html']
 
     @cache_with_field('quick_links_html')
     def get_quick_links_html(self, *args, **kwargs):
-        return self.get_section_content('Quick_Links')
+        return self.build_cached_fields('quick_links_html')['quick_links_html']
 
     @cache_with_field('zone_subnav_local_html')
     def get_zone_subnav_local_html(self, *args, **kwargs):
-        return self.get_section_content('Subnav')
+        fields = self.build_cached_fields('zone_subnav_local_html')
+        return fields['zone_subnav_local_html']
 
     @cache_with_field('toc_html')
     def get_toc_html(self, *args, **kwargs):
-        if not self.current_revision:
-            return ''
-        toc_depth = self.current_revision.toc_depth
-        if not toc_depth:
-            return ''
-        html = self.rendered_html and self.rendered_html or self.html
-        return (parse_content(html)
-                .injectSectionIDs()
-                .filter(self.TOC_FILTERS[toc_depth])
-                .serialize())
+        return self.build_cached_fields('toc_html')['toc_html']
 
     @cache_with_field('summary_html')
     def get_summary_html(self, *args, **kwargs):
-        return self.get_summary(strip_markup=False)
+        return self.build_cached_fields('summary_html')['summary_html']
 
     @cache_with_field('summary_text')
     def get_summary_text(self, *args, **kwargs):
-        return self.get_summary(strip_markup=True)
+        return self.build_cached_fields('summary_text')['summary_text']
+
+    def build_cached_fields(self, *fields):
+        """
+        Build content for the given cached fields, or all of them, from a
+        single parse of the rendered HTML.
+        """
+        html = self.rendered_html and self.rendered_html or self.html
+        toc_filter = None
+        if self.current_revision and self.current_revision.toc_depth:
+            toc_filter = self.TOC_FILTERS[self.current_revision.toc_depth]
+        return build_cached_fields(html, base_url=settings.SITE_URL,
+                                   locale=self.locale, toc_filter=toc_filter,
+                                   fields=fields or CACHED_FIELDS)
 
     def regenerate_cache_with_fields(self):
         """Regenerate fresh content for all the cached fields"""
-        # TODO: Maybe @cache_with_field can build a registry over which this
-        # method can iterate?
-        self.get_body_html(force_fresh=True)
-        self.get_quick_links_html(force_fresh=True)
-        self.get_zone_subnav_local_html(force_fresh=True)
-        self.get_toc_html(force_fresh=True)
-        self.get_summary_html(force_fresh=True)
-        self.get_summary_text(force_fresh=True)
+        for field_name, value in self.build_cached_fields().items():
+            setattr(self, field_name, value)
+        self.zone_subnav_html = self.build_zone_subnav_html()
+
+    @cache_with_field('zone_subnav_html')
+    def get_zone_subnav_html(self, *args, **kwargs):
+        return self.build_zone_subnav_html()
 
-    def get_zone_subnav_html(self):
+    def build_zone_subnav_html(self):
         """
         Search from self up through DocumentZone stack, returning the first
-        zone nav HTML found.
+        zone nav HTML found, or an empty string.
         """
         src = self.get_zone_subnav_local_html()
         if src:
             return src
+        return self.build_inherited_zone_subnav_html()
+
+    def build_inherited_zone_subnav_html(self):
+        """
+        Search up through the DocumentZone stack above self, returning the
+        first zone nav HTML found, or an empty string.
+        """
         for zone in DocumentZoneStackJob().get(self.pk):
+            if zone.document_id == self.pk:
+                continue
             src = zone.document.get_zone_subnav_local_html()
             if src:
                 return src
+        return u''
 
     def get_section_content(self, section_id, ignore_heading=True):
         """
@@ -415,12 +435,63 @@ class Document(NotificationsMixin, models.Model):
 
     def calculate_etag(self, section_id=None):
         """Calculate an etag-suitable hash for document content or a section"""
-        if not section_id:
-            content = self.html
-        else:
+        if section_id:
+            fragment = self.get_section_fragment(section_id, fill=False)
+            if fragment is not None:
+                return fragment['etag']
             content = self.extract.section(self.html, section_id)
+        else:
+            content = self.html
+        return self._etag(content)
+
+    @staticmethod
+    def _etag(content):
         return '"%s"' % hashlib.sha1(content.encode('utf8')).hexdigest()
 
+    def section_fragment_cache_key(self, section_id):
+        section_hash = hashlib.md5(section_id.encode('utf8')).hexdigest()
+        return DOCUMENT_SECTION_FRAGMENT_CACHE_KEY_TMPL % (
+            self.pk, self.current_revision_id, section_hash)
+
+    def fill_section_fragments(self):
+        """
+        Extract every section of the current revision's HTML, as ?raw
+        requests serve it, and store them with their etags, returning a
+        dict of section ID to fragment.
+        """
+        fragments = {}
+        for section_id, built in build_section_fragments(self.html).items():
+            fragments[section_id] = {
+                'html': built['html'],
+                'include_html': built['include_html'],
+                'etag': self._etag(built['source_html']),
+            }
+        memcache.set_many(dict(
+            (self.section_fragment_cache_key(section_id), fragment)
+            for section_id, fragment in fragments.items()))
+        return fragments
+
+    def get_section_fragment(self, section_id=None, fill=True):
+        """
+        Get the stored fragment of a section, or of the whole document if
+        no section ID is given, as a dict of 'html', 'include_html' and
+        'etag'. If the fragments aren't stored yet and `fill` is true, they
+        are all extracted and stored now.
+
+        Return None if the document has no such section.
+        """
+        section_id = section_id or ''
+        # The whole document is always stored with its sections, so it
+        # tells a missing section from fragments which aren't stored.
+        key = self.section_fragment_cache_key(section_id)
+        document_key = self.section_fragment_cache_key('')
+        stored = memcache.get_many([key, document_key])
+        if key in stored:
+            return stored[key]
+        if fill and document_key not in stored:
+            return self.fill_section_fragments().get(section_id)
+        return None
+
     def current_or_latest_revision(self):
         """Returns current revision if there is one, else the last created
         revision."""
@@ -540,6 +611,23 @@ class Document(NotificationsMixin, models.Model):
         if not base_url:
             base_url = settings.SITE_URL
 
+        self.start_rendering()
+
+        # Perform rendering and update document
+        if not config.KUMASCRIPT_TIMEOUT:
+            # A timeout of 0 should shortcircuit kumascript usage.
+            rendered_html, errors = self.html, []
+        else:
+            rendered_html, errors = kumascript.get(self, cache_control,
+                                                   base_url, timeout=timeout)
+
+        self.finish_rendering(rendered_html, errors)
+
+    def start_rendering(self):
+        """
+        Note the start of a rendering, whose content will be handed to
+        finish_rendering() once it's back from kumascript.
+        """
         # Disallow rendering while another is in progress.
         if self.is_rendering_in_progress:
             raise DocumentRenderingInProgress
@@ -550,19 +638,20 @@ class Document(NotificationsMixin, models.Model):
         Document.objects.filter(pk=self.pk).update(render_started_at=now)
         self.render_started_at = now
 
-        # Perform rendering and update document
-        if not config.KUMASCRIPT_TIMEOUT:
-            # A timeout of 0 should shortcircuit kumascript usage.
-            self.rendered_html, self.rendered_errors = self.html, []
-        else:
-            self.rendered_html, errors = kumascript.get(self, cache_control,
-                                                        base_url,
-                                                        timeout=timeout)
-            self.rendered_errors = errors and json.dumps(errors) or None
+    def finish_rendering(self, rendered_html, errors):
+        """
+        Update the document with rendered content and errors, for a rendering
+        begun with start_rendering().
+        """
+        self.rendered_html = rendered_html
+        self.rendered_errors = errors and json.dumps(errors) or None
 
         # Regenerate the cached content fields
         self.regenerate_cache_with_fields()
 
+        # Extract the sections served to ?raw requests, from the source
+        self.fill_section_fragments()
+
         # Finally, note the end time of rendering and update the document.
         self.last_rendered_at = datetime.now()
 
@@ -710,6 +799,47 @@ class Document(NotificationsMixin, models.Model):
     def extract(self):
         return Extractor(self)
 
+    def get_macro_names(self):
+        """
+        Return the sorted, lowercased names of the macros called by the
+        document. Extracting them takes a parse, so they're cached by a hash
+        of the document's source.
+        """
+        source_hash = hashlib.sha1((self.html or u'').encode('utf8'))
+        cache_key = DOCUMENT_MACROS_CACHE_KEY_TMPL % source_hash.hexdigest()
+        macro_names = memcache.get(cache_key)
+        if macro_names is None:
+            macro_names = sorted(set(name.lower()[:255] for name in
+                                     self.extract.macro_names()))
+            memcache.set(cache_key, macro_names, timeout=None)
+        return macro_names
+
+    def update_macros(self):
+        """
+        Update the index of the macros called by the document, telling which
+        documents to render again after a change to a template.
+        """
+        if self.is_template:
+            # Templates are run by kumascript, not rendered with macros.
+            macro_names = set()
+        else:
+            macro_names = set(self.get_macro_names())
+        indexed = set(self.macros.values_list('name', flat=True))
+
+        removed = indexed - macro_names
+        if removed:
+            self.macros.filter(name__in=removed).delete()
+        added = macro_names - indexed
+        if added:
+            try:
+                with transaction.atomic():
+                    DocumentMacro.objects.bulk_create([
+                        DocumentMacro(document=self, name=name)
+                        for name in sorted(added)])
+            except IntegrityError:
+                # Indexed concurrently, by another save of the document.
+                pass
+
     def natural_key(self):
         return (self.locale, self.slug)
 
@@ -906,7 +1036,64 @@ class Document(NotificationsMixin, models.Model):
         memcache.set(self.last_modified_cache_key, modified_epoch)
         return modified_epoch
 
+    @cached_property
+    def response_generation_cache_key(self):
+        return (DOCUMENT_RESPONSE_GENERATION_CACHE_KEY_TMPL %
+                self.natural_cache_key)
+
+    def purge_response_cache(self):
+        """
+        Drop the responses cached for anonymous users viewing the document,
+        see kuma.wiki.decorators.cache_anonymous_document.
+        """
+        memcache.delete(self.response_generation_cache_key)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        document = super(Document, cls).from_db(db, field_names, values)
+        # Keep the local zone subnav as loaded, see zone_subnav_changed.
+        if 'zone_subnav_local_html' in field_names:
+            document._loaded_zone_subnav_local_html = (
+                document.zone_subnav_local_html)
+        return document
+
+    @property
+    def zone_subnav_changed(self):
+        """
+        Whether the local zone subnav changed since the document was loaded
+        or last saved.
+        """
+        return (self.zone_subnav_local_html !=
+                getattr(self, '_loaded_zone_subnav_local_html', None))
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        # Reading one deferred content field loads the others as well, e.g.
+        # the html along with the rendered_html, in a single query.
+        if fields is not None and set(fields) <= set(DOCUMENT_CONTENT_FIELDS):
+            fields = set(fields) | set(
+                field for field in DOCUMENT_CONTENT_FIELDS
+                if field in self.get_deferred_fields() and
+                field not in self.__dict__)
+        super(Document, self).refresh_from_db(using=using, fields=fields,
+                                              **kwargs)
+
+    def _undefer(self):
+        """
+        Load the fields a document was loaded without, e.g. its content,
+        and make it a plain Document again. The signals of a document with
+        deferred fields are sent for a proxy model, which the receivers for
+        Document miss.
+        """
+        if self._deferred:
+            # Deleted documents included, unlike with refresh_from_db.
+            fields = self.get_deferred_fields()
+            loaded = Document.admin_objects.only(*fields).get(pk=self.pk)
+            for field in fields:
+                setattr(self, field, getattr(loaded, field))
+            self.__class__ = self._meta.concrete_model
+
     def save(self, *args, **kwargs):
+        self._undefer()
 
         self.is_template = self.slug.startswith(TEMPLATE_TITLE_PREFIX)
         self.is_redirect = bool(self.get_redirect_url())
@@ -930,9 +1117,11 @@ class Document(NotificationsMixin, models.Model):
             self.acquire_translated_topic_parent()
 
         super(Document, self).save(*args, **kwargs)
+        self._loaded_zone_subnav_local_html = self.zone_subnav_local_html
 
         # Delete any cached last-modified timestamp.
         self.fill_last_modified_cache()
+        self.purge_response_cache()
 
     def delete(self, *args, **kwargs):
         if waffle.switch_is_active('wiki_error_on_delete'):
@@ -940,6 +1129,7 @@ class Document(NotificationsMixin, models.Model):
             raise Exception("Attempt to delete document %s: %s" %
                             (self.id, self.title))
         else:
+            self._undefer()
             if self.is_redirect or 'purge' in kwargs:
                 if 'purge' in kwargs:
                     kwargs.pop('purge')
@@ -971,52 +1161,11 @@ class Document(NotificationsMixin, models.Model):
         """
         if not self.deleted:
             raise Exception("Document is not deleted, cannot be restored.")
+        self._undefer()
         signals.pre_save.send(sender=self.__class__, instance=self)
         Document.deleted_objects.filter(pk=self.pk).update(deleted=False)
         signals.post_save.send(sender=self.__class__, instance=self)
 
-    def _post_move_redirects(self, new_slug, user, title):
-        """
-        Create and return a Document and a Revision to serve as
-        redirects once this page has been moved.
-
-        """
-        redirect_doc = Document(locale=self.locale,
-                                title=self.title,
-                                slug=self.slug,
-                                is_localizable=False)
-        content = REDIRECT_CONTENT % {
-            'href': reverse('wiki.document',
-                            args=[new_slug],
-                            locale=self.locale),
-            'title': title,
-        }
-        redirect_rev = Revision(content=content,
-                                is_approved=True,
-                                toc_depth=self.current_revision.toc_depth,
-                                creator=user)
-        return redirect_doc, redirect_rev
-
-    def _moved_revision(self, new_slug, user, title=None):
-        """
-        Create and return a Revision which is a copy of this
-        Document's current Revision, as it will exist at a moved
-        location.
-
-        """
-        moved_rev = self.current_revision
-
-        # Shortcut trick for getting an object with all the same
-        # values, but making Django think it's new.
-        moved_rev.id = None
-
-        moved_rev.creator = user
-        moved_rev.created = datetime.now()
-        moved_rev.slug = new_slug
-        if title:
-            moved_rev.title = title
-        return moved_rev
-
     def _get_new_parent(self, new_slug):
         """
         Get this moved Document's parent doc if a Document
@@ -1024,30 +1173,36 @@ class Document(NotificationsMixin, models.Model):
         """
         return valid_slug_parent(new_slug, self.locale)
 
-    def _move_conflicts(self, new_slug):
-        """
-        Given a new slug to be assigned to this document, check
-        whether there is an existing, non-redirect, Document at that
-        slug in this locale. Any redirect existing there will be
-        deleted.
-
-        This is necessary since page moving is a background task, and
-        a Document may come into existence at the target slug after
-        the move is requested.
-
-        """
-        existing = None
-        try:
-            existing = Document.objects.get(locale=self.locale,
-                                            slug=new_slug)
-        except Document.DoesNotExist:
-            pass
-
-        if existing is not None:
-            if existing.is_redirect:
-                existing.delete()
-            else:
-                raise Exception("Requested move would overwrite a non-redirect page.")
+    def _move_targets(self, new_slug):
+        """
+        Return a list of (document, slug) pairs for this document and
+        each of its descendants, in the order of get_descendants, with
+        the slug each of them would have once this document is moved to
+        `new_slug`.
+        """
+        children = self.get_descendant_children()
+        targets = []
+        stack = [(self, new_slug)]
+        while stack:
+            document, slug = stack.pop()
+            targets.append((document, slug))
+            stack.extend(reversed([
+                (child, '/'.join([slug, child.slug.split('/')[-1]]))
+                for child in children.get(document.pk, [])]))
+        return targets
+
+    def _existing_at(self, slugs):
+        """
+        Return a dict mapping the lowercased slugs among `slugs` to the
+        documents existing at them in this locale, in one query per
+        MOVE_CHUNK_SIZE slugs.
+        """
+        existing = {}
+        for chunk in chunked(slugs, MOVE_CHUNK_SIZE):
+            for document in Document.objects.filter(locale=self.locale,
+                                                    slug__in=chunk):
+                existing[document.slug.lower()] = document
+        return existing
 
     def _tree_conflicts(self, new_slug):
         """
@@ -1055,121 +1210,222 @@ class Document(NotificationsMixin, models.Model):
         list of documents (if any) which would be overwritten by
         moving this document or any of its children in that fashion.
         """
+        targets = self._move_targets(new_slug)
+        existing = self._existing_at([slug for _, slug in targets])
         conflicts = []
-        try:
-            existing = Document.objects.get(locale=self.locale, slug=new_slug)
-            if not existing.is_redirect:
-                conflicts.append(existing)
-        except Document.DoesNotExist:
-            pass
-        for child in self.get_descendants():
-            child_title = child.slug.split('/')[-1]
-            try:
-                slug = '/'.join([new_slug, child_title])
-                existing = Document.objects.get(locale=self.locale, slug=slug)
-                if not existing.get_redirect_url():
-                    conflicts.append(existing)
-            except Document.DoesNotExist:
-                pass
+        for _, slug in targets:
+            conflict = existing.get(slug.lower())
+            if conflict is not None and not conflict.is_redirect:
+                conflicts.append(conflict)
         return conflicts
 
-    def _move_tree(self, new_slug, user=None, title=None):
-        """
-        Move this page and all its children.
+    def _bulk_move_tree(self, new_slug, user=None, title=None,
+                        progress=None):
         """
-        # Page move is a 10-step process.
-        #
-        # Step 1: Sanity check. Has a page been created at this slug
-        # since the move was requested? If not, OK to go ahead and
-        # change our slug.
-        self._move_conflicts(new_slug)
+        Move this page and all its children, with a number of queries
+        growing with the number of MOVE_CHUNK_SIZE chunks of documents
+        rather than with the number of documents.
 
-        if user is None:
-            user = self.current_revision.creator
-        if title is None:
-            title = self.title
+        The new slugs and the conflicts are computed up front, so that
+        nothing is written if any document would be overwritten. The
+        documents are then moved, and their redirects and moved
+        revisions are bulk created, in one transaction.
 
-        # Step 2: stash our current review tags, since we want to
-        # preserve them.
-        review_tags = list(self.current_revision.review_tags.names())
+        If given, `progress` is called with the number of documents
+        moved so far and the total number of documents, once per chunk.
 
-        # Step 3: Create (but don't yet save) a Document and Revision
-        # to leave behind as a redirect from old location to new.
-        redirect_doc, redirect_rev = self._post_move_redirects(new_slug,
-                                                               user,
-                                                               title)
-
-        # Step 4: Update our breadcrumbs.
-        new_parent = self._get_new_parent(new_slug)
-
-        # If we found a Document at what will be our parent slug, set
-        # it as our parent_topic. If we didn't find one, then we no
-        # longer have a parent_topic (since our original parent_topic
-        # would already have moved if it were going to).
-        self.parent_topic = new_parent
-
-        # Step 5: Save this Document.
-        self.slug = new_slug
-        self.save()
-
-        # Step 6: Create (but don't yet save) a copy of our current
-        # revision, but with the new slug and title (if title is
-        # changing too).
-        moved_rev = self._moved_revision(new_slug, user, title)
-
-        # Step 7: Save the Revision that actually moves us.
-        moved_rev.save(force_insert=True)
-
-        # Step 8: Save the review tags.
-        moved_rev.review_tags.set(*review_tags)
-
-        # Step 9: Save the redirect.
-        redirect_doc.save()
-        redirect_rev.document = redirect_doc
-        redirect_rev.save()
-
-        # Finally, step 10: recurse through all of our children.
-        for child in self.children.filter(locale=self.locale):
-            # Save the original slug and locale so we can use them in
-            # the error message if something goes wrong.
-            old_child_slug, old_child_locale = child.slug, child.locale
-
-            child_title = child.slug.split('/')[-1]
-            try:
-                child._move_tree('/'.join([new_slug, child_title]), user)
-            except PageMoveError:
-                # A child move already caught this and created the
-                # correct exception + error message, so just propagate
-                # it up.
-                raise
-            except Exception as e:
-                # One of the immediate children of this page failed to
-                # move.
-                exc_class, exc_message, exc_tb = sys.exc_info()
-                message = """
-Failure occurred while attempting to move document
-with id %(doc_id)s.
-
-That document can be viewed at:
+        The documents are updated in bulk, without sending the post_save
+        signals. Returns the pks of the moved documents and of the
+        redirects left behind, which need to be caught up with afterwards,
+        as move_page does with update_moved_documents.
+        """
+        targets = self._move_targets(new_slug)
+        total = len(targets)
 
-https://developer.mozilla.org/%(locale)s/docs/%(slug)s
+        existing = self._existing_at([slug for _, slug in targets])
+        conflicts = []
+        redirect_pks = []
+        for _, slug in targets:
+            conflict = existing.get(slug.lower())
+            if conflict is None:
+                continue
+            if conflict.is_redirect:
+                redirect_pks.append(conflict.pk)
+            else:
+                conflicts.append(conflict)
+        if conflicts:
+            raise PageMoveError("""
+Requested move would overwrite %(count)s non-redirect page(s):
+
+%(pages)s
+            """ % {
+                'count': len(conflicts),
+                'pages': '\n'.join(
+                    'https://developer.mozilla.org/%s/docs/%s (id %s)' %
+                    (conflict.locale, conflict.slug, conflict.id)
+                    for conflict in conflicts),
+            })
 
-The exception raised was:
+        new_parent = self._get_new_parent(new_slug)
 
-Exception type: %(exc_class)s
+        if user is None:
+            user = self.current_revision.creator
 
-Exception message: %(exc_message)s
+        current_revisions = {}
+        for chunk in chunked([document.current_revision_id
+                              for document, _ in targets
+                              if document.current_revision_id],
+                             MOVE_CHUNK_SIZE):
+            current_revisions.update(
+                (revision.pk, revision)
+                for revision in Revision.objects.filter(pk__in=chunk))
+        review_tags = defaultdict(list)
+        for chunk in chunked(current_revisions.keys(), MOVE_CHUNK_SIZE):
+            tagged = (ReviewTaggedRevision.objects
+                                          .filter(content_object__in=chunk)
+                                          .values_list('content_object_id',
+                                                       'tag_id'))
+            for revision_pk, tag_pk in tagged:
+                review_tags[revision_pk].append(tag_pk)
 
-Full traceback:
+        now = datetime.now()
+        moved = 0
+        pks = []
+        with transaction.atomic():
+            for chunk in chunked(redirect_pks, MOVE_CHUNK_SIZE):
+                Document.objects.filter(pk__in=chunk).delete()
+
+            Document.objects.filter(pk=self.pk).update(
+                parent_topic=new_parent,
+                title=title or self.title)
+
+            for chunk in chunked(targets, MOVE_CHUNK_SIZE):
+                old_slugs = [document.slug for document, _ in chunk]
+                pks.extend(document.pk for document, _ in chunk)
+                pks.extend(self._bulk_move_chunk(chunk, user, title, now,
+                                                 current_revisions,
+                                                 review_tags))
+                memcache.delete_many([
+                    DOCUMENT_LAST_MODIFIED_CACHE_KEY_TMPL %
+                    self.natural_key_hash((self.locale, slug))
+                    for slug in old_slugs + [slug for _, slug in chunk]])
+                moved += len(chunk)
+                if progress is not None:
+                    progress(moved, total)
+        titles_changed(self.locale)
 
-%(traceback)s
-                """ % {'doc_id': child.id,
-                       'locale': old_child_locale,
-                       'slug': old_child_slug,
-                       'exc_class': exc_class,
-                       'exc_message': exc_message,
-                       'traceback': traceback.format_exc(e)}
-                raise PageMoveError(message)
+        self.parent_topic = new_parent
+        self.slug = new_slug
+        if title:
+            self.title = title
+        return pks
+
+    def _bulk_move_chunk(self, targets, user, title, now,
+                         current_revisions, review_tags):
+        """
+        Move a chunk of the (document, slug) pairs of _bulk_move_tree,
+        leaving redirects behind, and return the pks of the redirects.
+        """
+        # Move the documents first, so that the redirects can take their
+        # slugs. Their current revisions are set once the moved revisions
+        # exist.
+        pks = [document.pk for document, _ in targets]
+        Document.objects.filter(pk__in=pks).update(
+            slug=models.Case(*[models.When(pk=document.pk,
+                                           then=models.Value(slug))
+                               for document, slug in targets],
+                             output_field=models.CharField()),
+            is_template=models.Case(
+                *[models.When(pk=document.pk, then=models.Value(
+                    slug.startswith(TEMPLATE_TITLE_PREFIX)))
+                  for document, slug in targets],
+                output_field=models.BooleanField()),
+            modified=now)
+        for document, slug in targets:
+            # Templates don't call macros, see update_macros.
+            is_template = slug.startswith(TEMPLATE_TITLE_PREFIX)
+            if document.is_template != is_template:
+                document.is_template = is_template
+                document.update_macros()
+
+        redirect_docs = []
+        redirect_revs = {}
+        moved_revs = []
+        for document, slug in targets:
+            document_title = (title if document.pk == self.pk and title
+                              else document.title)
+            redirect_doc = Document(
+                locale=document.locale,
+                title=document.title,
+                slug=document.slug,
+                is_localizable=False,
+                is_redirect=True,
+                is_template=document.slug.startswith(TEMPLATE_TITLE_PREFIX))
+            content = REDIRECT_CONTENT % {
+                'href': reverse('wiki.document',
+                                args=[slug],
+                                locale=document.locale),
+                'title': document_title,
+            }
+            redirect_doc.html = (content if redirect_doc.is_template else
+                                 Document.objects.clean_content(content))
+            current_revision = current_revisions.get(
+                document.current_revision_id)
+            redirect_docs.append(redirect_doc)
+            redirect_revs[document.slug.lower()] = Revision(
+                title=document.title,
+                slug=document.slug,
+                content=content,
+                is_approved=True,
+                toc_depth=(current_revision.toc_depth
+                           if current_revision else 1),
+                creator=user,
+                created=now)
+
+            if current_revision is not None:
+                # Shortcut trick for getting a copy of the current revision
+                # which Django takes for a new one.
+                old_revision_pk = current_revision.pk
+                current_revision.id = None
+                current_revision.creator = user
+                current_revision.created = now
+                current_revision.slug = slug
+                current_revision.title = document_title
+                moved_revs.append((old_revision_pk, current_revision))
+
+        Document.objects.bulk_create(redirect_docs)
+        redirect_pks = []
+        for redirect_doc in Document.objects.filter(
+                locale=self.locale,
+                slug__in=[document.slug for document, _ in targets]):
+            redirect_revs[redirect_doc.slug.lower()].document = redirect_doc
+            redirect_pks.append(redirect_doc.pk)
+        Revision.objects.bulk_create(redirect_revs.values())
+        Revision.objects.bulk_create(revision for _, revision in moved_revs)
+
+        # The revisions created in bulk skip their post_save handler, so
+        # their contributions are counted here.
+        moved_pks = [revision.document_id for _, revision in moved_revs]
+        DocumentContributor.objects.add_revisions(moved_pks + redirect_pks,
+                                                  user.pk, now)
+        latest = dict(Revision.objects.filter(document__in=(moved_pks +
+                                                            redirect_pks))
+                                      .values('document')
+                                      .annotate(latest=models.Max('id'))
+                                      .values_list('document', 'latest'))
+        Document.objects.filter(pk__in=latest.keys()).update(
+            current_revision=models.Case(
+                *[models.When(pk=pk, then=models.Value(revision_pk))
+                  for pk, revision_pk in latest.items()],
+                output_field=models.IntegerField()))
+
+        ReviewTaggedRevision.objects.bulk_create(
+            ReviewTaggedRevision(
+                content_object_id=latest[revision.document_id],
+                tag_id=tag_pk)
+            for old_pk, revision in moved_revs
+            for tag_pk in review_tags.get(old_pk, []))
+        return redirect_pks
 
     def repair_breadcrumbs(self):
         """
@@ -1396,7 +1652,8 @@ Full traceback:
                                       'Documents in the default language so'
                                       'far.')
         try:
-            return Document.objects.get(locale=locale, parent=self)
+            return Document.objects.defer_content().get(locale=locale,
+                                                        parent=self)
         except Document.DoesNotExist:
             return None
 
@@ -1425,16 +1682,25 @@ Full traceback:
     def parents(self):
         """
         Return the list of topical parent documents above this one,
-        or an empty list if none exist.
-        """
-        if self.parent_topic is None:
-            return []
-        current_parent = self.parent_topic
-        parents = [current_parent]
-        while current_parent.parent_topic is not None:
-            parents.insert(0, current_parent.parent_topic)
-            current_parent = current_parent.parent_topic
-        return parents
+        or an empty list if none exist. The parents not loaded yet are
+        loaded without their content.
+        """
+        descriptor = Document.parent_topic
+        parents = []
+        current = self
+        while True:
+            if descriptor.is_cached(current):
+                parent = current.parent_topic
+            elif current.parent_topic_id is not None:
+                parent = (Document.admin_objects.defer_content()
+                                                .get(pk=current.parent_topic_id))
+                setattr(current, descriptor.cache_name, parent)
+            else:
+                parent = None
+            if parent is None:
+                return parents
+            parents.insert(0, parent)
+            current = parent
 
     def is_child_of(self, other):
         """
@@ -1453,15 +1719,83 @@ Full traceback:
         Return a list of all documents which are children
         (grandchildren, great-grandchildren, etc.) of this one.
         """
+        if limit is not None:
+            limit -= levels
+        children = self.get_descendant_children(limit)
         results = []
-
-        if (limit is None or levels < limit) and self.children.exists():
-            for child in self.children.all().filter(locale=self.locale):
-                results.append(child)
-                [results.append(grandchild)
-                 for grandchild in child.get_descendants(limit, levels + 1)]
+        stack = list(reversed(children.get(self.pk, [])))
+        while stack:
+            document = stack.pop()
+            results.append(document)
+            stack.extend(reversed(children.get(document.pk, [])))
         return results
 
+    def get_descendant_children(self, limit=None, fields=None):
+        """
+        Return a dict mapping the pks of this document and of its descendants
+        in the same locale to lists of their children, down to `limit` levels
+        below this one.
+
+        The tree is walked on its slug and parent columns only, loaded by slug
+        prefix. The descendants whose slugs don't start with this document's
+        slug are then found by parent, in one more query per level of them,
+        so most trees take two queries. The children returned are then loaded
+        whole, TREE_CHUNK_SIZE per query, or with only the given `fields`
+        besides the tree columns right away.
+        """
+        prefix = u'%s/' % self.slug
+        documents = (Document.objects.filter(locale=self.locale)
+                                     .only(*(DOCUMENT_TREE_FIELDS +
+                                             tuple(fields or ()))))
+        by_parent = defaultdict(list)
+        for document in documents.filter(slug__startswith=prefix):
+            by_parent[document.parent_topic_id].append(document)
+        others = (documents.filter(Q(parent_topic=self) |
+                                   Q(parent_topic__slug__startswith=prefix))
+                           .exclude(slug__startswith=prefix))
+        others_pks = set([self.pk])
+        while True:
+            parent_pks = []
+            for document in others:
+                if document.pk not in others_pks:
+                    by_parent[document.parent_topic_id].append(document)
+                    others_pks.add(document.pk)
+                    parent_pks.append(document.pk)
+            if not parent_pks:
+                break
+            others = (documents.filter(parent_topic__in=parent_pks)
+                               .exclude(slug__startswith=prefix))
+
+        # Walk down the tree from this document, leaving out the documents
+        # sharing the slug prefix without being under this one.
+        # A broken tree looping back up is cut where it loops.
+        children = {}
+        seen_pks = set([self.pk])
+        level = 0
+        parent_pks = [self.pk]
+        while parent_pks and (limit is None or level < limit):
+            child_pks = []
+            for pk in parent_pks:
+                children[pk] = [
+                    child for child in sorted(by_parent.get(pk, []),
+                                              key=lambda child: child.pk)
+                    if child.pk not in seen_pks]
+                for child in children[pk]:
+                    seen_pks.add(child.pk)
+                    child_pks.append(child.pk)
+            parent_pks = child_pks
+            level += 1
+
+        if fields is None:
+            loaded = {}
+            pks = [child.pk for kids in children.values() for child in kids]
+            for chunk in chunked(pks, TREE_CHUNK_SIZE):
+                loaded.update(Document.objects.in_bulk(chunk))
+            for pk, kids in children.items():
+                children[pk] = [loaded[child.pk] for child in kids
+                                if child.pk in loaded]
+        return children
+
     def is_watched_by(self, user):
         """
         Return whether `user` is notified of edits to me.
@@ -1483,7 +1817,7 @@ Full traceback:
 
     @cached_property
     def contributors(self):
-        return DocumentContributorsJob().get(self.pk)
+        return DocumentContributor.objects.contributors(self.pk)
 
     @cached_property
     def zone_stack(self):
@@ -1536,6 +1870,47 @@ class DocumentZone(models.Model):
                                           self.document.title)
 
 
+class DocumentMacro(models.Model):
+    """
+    A macro called by a document, indexing the documents to render again
+    after a change to the macro's template.
+    """
+    document = models.ForeignKey(Document, related_name='macros')
+    # The lowercased name of the macro, as kumascript looks templates up
+    name = models.CharField(max_length=255, db_index=True)
+
+    objects = DocumentMacroManager()
+
+    class Meta:
+        unique_together = ('document', 'name')
+
+    def __unicode__(self):
+        return u'%s calls %s' % (self.document, self.name)
+
+
+class DocumentContributor(models.Model):
+    """
+    The revisions of a document by a user, indexing the contributors shown
+    with the document, the most recent first.
+    """
+    document = models.ForeignKey(Document, related_name='contributions')
+    user = models.ForeignKey(settings.AUTH_USER_MODEL,
+                             related_name='document_contributions')
+    # The creation time of the latest revision of the document by the user
+    last_contributed = models.DateTimeField()
+    # How many revisions of the document the user created
+    revisions = models.PositiveIntegerField(default=0)
+
+    objects = DocumentContributorManager()
+
+    class Meta:
+        unique_together = ('document', 'user')
+        index_together = ('document', 'last_contributed')
+
+    def __unicode__(self):
+        return u'%s contributed to %s' % (self.user, self.document)
+
+
 class ReviewTag(TagBase):
     """A tag indicating review status, mainly for revisions"""
     class Meta:
@@ -1,4 +1,7 @@
 from django.db import models
+from django_mysql.models import QuerySet
+
+from .constants import DOCUMENT_CONTENT_FIELDS
 
 
 class MultiQuerySet(object):
@@ -68,3 +71,17 @@ class TransformQuerySet(models.query.QuerySet):
                 fn(results)
             return iter(results)
         return result_iter
+
+
+class DocumentQuerySet(QuerySet):
+
+    def defer_content(self, *keep):
+        """
+        Leave out the heavy content of the documents, but for the given
+        fields, when only their metadata is needed, e.g. to list them or to
+        redirect to them. Reading any of the deferred fields of a document
+        loads all of them with a single query, and the documents can't be
+        saved, see Document.refresh_from_db and Document.save.
+        """
+        return self.defer(*[field for field in DOCUMENT_CONTENT_FIELDS
+                            if field not in keep])
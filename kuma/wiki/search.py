@@ -3,16 +3,16 @@ from __future__ import division
 
 import logging
 import operator
+from collections import deque
 from math import ceil
 
 from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
 from django.db.models import Q
-from django.utils.html import strip_tags
 from django.utils.translation import ugettext_lazy as _
 
 from celery import chain
-from elasticsearch.helpers import bulk
+from elasticsearch.helpers import bulk, parallel_bulk
 from elasticsearch_dsl import document, field
 from elasticsearch_dsl.connections import connections
 from elasticsearch_dsl.mapping import Mapping
@@ -64,6 +64,11 @@ class WikiDocumentType(document.DocType):
 
     @classmethod
     def from_django(cls, obj):
+        """
+        Serialize a document for indexing. Its tags, zone and parent are
+        taken from those prefetched by get_indexing_queryset, if any, and
+        its rendered content is parsed once.
+        """
         doc = {
             'id': obj.id,
             'title': obj.title,
@@ -71,12 +76,10 @@ class WikiDocumentType(document.DocType):
             'summary': obj.get_summary_text(),
             'locale': obj.locale,
             'modified': obj.modified,
-            'content': strip_tags(obj.rendered_html or ''),
-            'tags': list(obj.tags.names()),
-            'kumascript_macros': obj.extract.macro_names(),
-            'css_classnames': obj.extract.css_classnames(),
-            'html_attributes': obj.extract.html_attributes(),
+            'tags': [tag.name for tag in obj.tags.all()],
+            'kumascript_macros': obj.get_macro_names(),
         }
+        doc.update(obj.extract.search_fields())
 
         # Check if the document has a document zone attached
         try:
@@ -176,8 +179,12 @@ class WikiDocumentType(document.DocType):
         }
 
     @classmethod
-    def bulk_index(cls, documents, id_field='id', es=None, index=None):
-        """Index of a bunch of documents."""
+    def bulk_index(cls, documents, id_field='id', es=None, index=None,
+                   thread_count=1):
+        """
+        Index of a bunch of documents, with `thread_count` concurrent bulk
+        requests of ES_BULK_CHUNK_SIZE documents if more than one.
+        """
         es = es or cls.get_connection()
         index = index or cls.get_index()
         type = cls.get_doc_type()
@@ -186,7 +193,13 @@ class WikiDocumentType(document.DocType):
             {'_index': index, '_type': type, '_id': d['id'], '_source': d}
             for d in documents]
 
-        bulk(es, actions)
+        if thread_count > 1:
+            # parallel_bulk is lazy, so consume it to send the requests.
+            for _ in parallel_bulk(es, actions, thread_count=thread_count,
+                                   chunk_size=settings.ES_BULK_CHUNK_SIZE):
+                pass
+        else:
+            bulk(es, actions)
 
     @classmethod
     def bulk_delete(cls, ids, es=None, index=None):
@@ -224,14 +237,21 @@ class WikiDocumentType(document.DocType):
         return Document
 
     @classmethod
-    def get_indexable(cls, percent=100):
+    def get_indexing_queryset(cls, ids):
         """
-        For this mapping type return a list of model IDs that should be
-        indexed with the management command, in a full reindex.
-
-        WARNING: When changing this code make sure to update the
-                 ``should_update`` method below, too!
+        Return the documents with the given IDs, with the tags, zones and
+        parents from_django needs fetched for all of them at once.
+        """
+        model = cls.get_model()
+        return (model.objects.filter(id__in=ids)
+                             .select_related('zone', 'parent')
+                             .prefetch_related('tags'))
 
+    @classmethod
+    def get_indexable_queryset(cls):
+        """
+        Return a queryset of the documents that should be indexed, in a
+        full reindex.
         """
         model = cls.get_model()
 
@@ -239,11 +259,46 @@ class WikiDocumentType(document.DocType):
         for exclude in cls.exclude_slugs:
             excludes.append(Q(slug__icontains=exclude))
 
-        qs = (model.objects
-                   .filter(is_template=False,
-                           is_redirect=False,
-                           deleted=False)
-                   .exclude(reduce(operator.or_, excludes)))
+        return (model.objects
+                     .filter(is_template=False,
+                             is_redirect=False,
+                             deleted=False)
+                     .exclude(reduce(operator.or_, excludes)))
+
+    @classmethod
+    def get_indexable_chunks(cls, chunk_size, after=0, percent=100):
+        """
+        Generate the IDs of the documents to index, in chunks of ascending
+        IDs above `after`, with one query per chunk and only one chunk in
+        memory at a time. Each chunk comes with the highest ID it covers.
+
+        With a percent under 100, only the documents whose ID modulo 100 is
+        under it are kept, without counting them first.
+        """
+        ids = (cls.get_indexable_queryset()
+                  .order_by('id')
+                  .values_list('id', flat=True))
+        while True:
+            chunk = list(ids.filter(id__gt=after)[:chunk_size])
+            if not chunk:
+                break
+            after = chunk[-1]
+            if percent < 100:
+                chunk = [pk for pk in chunk if pk % 100 < percent]
+            if chunk:
+                yield chunk, after
+
+    @classmethod
+    def get_indexable(cls, percent=100):
+        """
+        For this mapping type return a list of model IDs that should be
+        indexed with the management command, in a full reindex.
+
+        WARNING: When changing this code make sure to update the
+                 ``should_update`` method below, too!
+
+        """
+        qs = cls.get_indexable_queryset()
 
         percent = percent / 100
         if percent < 1:
@@ -317,3 +372,77 @@ class WikiDocumentType(document.DocType):
             }
         )
         return message
+
+    @classmethod
+    def reindex_stream(cls, chunk_size=500, index=None, percent=100,
+                       window=4, resume=False, progress=None):
+        """Rebuild ElasticSearch indexes, streaming the documents.
+
+        Unlike reindex_all, this runs until the index is populated, with no
+        more than `window` index_documents tasks in flight. The highest ID
+        of the chunks indexed so far, in order, is saved on the `Index` as
+        a checkpoint, from which an interrupted reindex can resume.
+
+        :arg chunk_size: how many documents to bulk index as a single chunk.
+        :arg index: the `Index` object to reindex into. Uses the current
+            promoted index if none provided.
+        :arg percent: 1 to 100--the percentage of the db to index.
+        :arg window: how many chunks to index at once.
+        :arg resume: whether to resume from the index checkpoint, rather
+            than recreating the index.
+        :arg progress: a function called with the number of documents
+            indexed and the checkpoint, after each chunk.
+
+        """
+        from kuma.search.models import Index
+        from kuma.search.tasks import prepare_index, finalize_index
+        from kuma.wiki.tasks import index_documents
+
+        index = index or Index.objects.get_current()
+
+        if resume and index.reindex_checkpoint is not None:
+            after = index.reindex_checkpoint
+        else:
+            prepare_index(index.pk)
+            after = 0
+            Index.objects.filter(pk=index.pk).update(reindex_checkpoint=after)
+
+        pending = deque()
+        total = [0]
+
+        def complete(block):
+            # Move the checkpoint past the chunks indexed so far, in order.
+            checkpoint = None
+            while pending and (block or pending[0][2].ready()):
+                size, checkpoint, result = pending.popleft()
+                result.get()
+                total[0] += size
+                block = False
+            if checkpoint is not None:
+                Index.objects.filter(pk=index.pk).update(
+                    reindex_checkpoint=checkpoint)
+                if progress is not None:
+                    progress(total[0], checkpoint)
+
+        for chunk, checkpoint in cls.get_indexable_chunks(chunk_size, after,
+                                                          percent):
+            result = index_documents.apply_async(
+                (chunk, index.pk),
+                {'thread_count': settings.ES_BULK_THREAD_COUNT})
+            pending.append((len(chunk), checkpoint, result))
+            complete(block=len(pending) >= window)
+        while pending:
+            complete(block=True)
+
+        finalize_index(index.pk)
+        Index.objects.filter(pk=index.pk).update(reindex_checkpoint=None)
+
+        message = _(
+            'Indexed %(total)d documents in chunks of size %(size)d into '
+            'index %(index)s.' % {
+                'total': total[0],
+                'size': chunk_size,
+                'index': index.prefixed_name
+            }
+        )
+        return message
@@ -4,6 +4,7 @@ import json
 import logging
 import os
 import textwrap
+from collections import defaultdict
 from datetime import datetime, timedelta
 
 from django.conf import settings
@@ -23,12 +24,21 @@ from kuma.core.cache import memcache
 from kuma.core.utils import MemcacheLock, chord_flow, chunked
 from kuma.search.models import Index
 
+from . import kumascript
+from .constants import (DOCUMENT_RESPONSE_GENERATION_CACHE_KEY_TMPL,
+                        MACRO_CALLERS_RENDERED_CACHE_KEY_TMPL,
+                        MOVE_CHUNK_SIZE, TEMPLATE_TITLE_PREFIX,
+                        TREE_CHUNK_SIZE)
 from .events import context_dict
 from .exceptions import PageMoveError, StaleDocumentsRenderingInProgress
-from .models import Document, DocumentSpamAttempt, Revision, RevisionIP
+from .jobs import (DocumentCodeSampleJob, DocumentZoneStackJob,
+                   DocumentZoneURLRemapsJob)
+from .models import (Document, DocumentMacro, DocumentSpamAttempt,
+                     DocumentZone, Revision, RevisionIP)
 from .search import WikiDocumentType
 from .templatetags.jinja_helpers import absolutify
 from .utils import tidy_content
+from .zones import url_remaps
 
 
 log = logging.getLogger('kuma.wiki.tasks')
@@ -73,14 +83,85 @@ def render_document_chunk(pks, cache_control='no-cache', base_url=None,
     logger.info(u'Starting to render document chunk: %s' %
                 ','.join([str(pk) for pk in pks]))
     base_url = base_url or settings.SITE_URL
-    for pk in pks:
+    concurrency = config.KUMA_DOCUMENT_RENDER_CONCURRENCY
+    if config.KUMASCRIPT_TIMEOUT and (settings.KUMASCRIPT_BATCH_URL or
+                                      concurrency > 1):
+        # Fetch the renderings of several documents at once, in batches
+        # and/or concurrent kumascript requests
+        results = render_document_batch(pks, cache_control, base_url,
+                                        force=force, concurrency=concurrency)
+    else:
         # calling the task without delay here since we want to localize
         # the processing of the chunk in one process
-        result = render_document(pk, cache_control, base_url, force=force)
+        results = ((pk, render_document(pk, cache_control, base_url,
+                                        force=force))
+                   for pk in pks)
+    for pk, result in results:
         if result:
             logger.error(u'Error while rendering document %s with error: %s' %
                          (pk, result))
-    logger.info(u'Finished rendering of document chunk')
+    logger.info(u'Finished rendering of document chunk (render cache: '
+                u'%(hits)s hits, %(misses)s misses)' %
+                kumascript.render_cache_stats())
+
+
+def render_document_batch(pks, cache_control, base_url, force=False,
+                          concurrency=1):
+    """
+    Render documents with batched and/or concurrent kumascript requests,
+    returning a list of document pks along with their rendering errors.
+
+    Only the kumascript requests run concurrently, the documents are all
+    saved from this thread, one at a time. A failure to render one document
+    doesn't stop the others from being rendered.
+    """
+    documents = Document.objects.in_bulk(pks)
+    started = []
+    results = []
+    for pk in pks:
+        document = documents.get(pk)
+        if document is None:
+            continue
+        if force:
+            document.render_started_at = None
+        try:
+            document.start_rendering()
+        except Exception as e:
+            subject = 'Exception while rendering document %s' % pk
+            mail_admins(subject=subject, message=e)
+            results.append((pk, document.rendered_errors))
+        else:
+            started.append(document)
+
+    rendered = kumascript.get_many(started, cache_control, base_url,
+                                   concurrency=concurrency)
+    for document, (rendered_html, errors) in zip(started, rendered):
+        try:
+            document.finish_rendering(rendered_html, errors)
+        except Exception as e:
+            subject = 'Exception while rendering document %s' % document.pk
+            mail_admins(subject=subject, message=e)
+        results.append((document.pk, document.rendered_errors))
+    return results
+
+
+@transaction_task
+def render_macro_callers(template_pk, revision_pk):
+    """
+    Render again the documents calling the macro of a template, once per
+    revision of the template, in the order given by the macro index.
+    """
+    cache_key = MACRO_CALLERS_RENDERED_CACHE_KEY_TMPL % revision_pk
+    if not memcache.add(cache_key, True, timeout=60 * 60 * 24 * 7):
+        # The callers were already rendered with this revision.
+        return
+
+    template = Document.objects.get(pk=template_pk)
+    macro_name = template.slug[len(TEMPLATE_TITLE_PREFIX):]
+    pks = DocumentMacro.objects.callers(macro_name)
+    log.info(u'Rendering %s documents calling %s' % (len(pks), macro_name))
+    for chunk in chunked(pks, 5):
+        render_document_chunk.delay(chunk)
 
 
 @task(throws=(StaleDocumentsRenderingInProgress,))
@@ -120,7 +201,10 @@ def render_stale_documents(log=None):
     stale_pks = stale_docs.values_list('pk', flat=True)
 
     pre_task = acquire_render_lock.si()
-    render_tasks = [render_document_chunk.si(pks)
+    # Not asking for no-cache, so documents unchanged since their last
+    # rendering, along with the templates they call, don't need kumascript
+    # unless their rendering outlived their render_max_age.
+    render_tasks = [render_document_chunk.si(pks, 'max-age=0')
                     for pks in chunked(stale_pks, 5)]
     post_task = release_render_lock.si()
 
@@ -140,6 +224,112 @@ def build_json_data_for_document(pk, stale):
         Document.objects.filter(pk=document.parent.pk).update(json=parent_json)
 
 
+@task
+def update_zone_tree(pk, zone_changed=False):
+    """
+    Materialize again the zone subnav of a document and of the documents
+    below it, after a change to its zone or to its local subnav. The zone
+    stacks cached below it are reset as well when its zone changed.
+
+    The tree is loaded without content and walked down from the document,
+    carrying the subnav each document inherits from the zones above it.
+    """
+    try:
+        document = Document.objects.get(pk=pk)
+    except Document.DoesNotExist:
+        return
+    subnav = document.build_zone_subnav_html()
+    if subnav != document.zone_subnav_html:
+        Document.objects.filter(pk=pk).update(zone_subnav_html=subnav)
+        document.purge_response_cache()
+
+    zones = DocumentZone.objects.filter(document__locale=document.locale)
+    zone_pks = set(zones.values_list('document_id', flat=True))
+    local = document.get_zone_subnav_local_html()
+    if document.pk in zone_pks and local:
+        inherited = local
+    else:
+        inherited = document.build_inherited_zone_subnav_html()
+
+    # Group the documents by the subnav to store for them. Their subnav is
+    # left to be built again when it's unknown, that is when the local
+    # subnav of a document, or of a zone above it, wasn't built yet.
+    children = document.get_descendant_children(
+        fields=['zone_subnav_local_html'])
+    by_subnav = defaultdict(list)
+    parents = [(document.pk, inherited)]
+    while parents:
+        parent_pk, inherited = parents.pop()
+        for child in children.get(parent_pk, []):
+            local = child.zone_subnav_local_html
+            if not local:
+                by_subnav[None if local is None else inherited].append(child)
+            if child.pk in zone_pks and local != u'':
+                # The zone's own subnav, known or not, is inherited below it.
+                parents.append((child.pk, local))
+            else:
+                parents.append((child.pk, inherited))
+
+    for subnav, docs in by_subnav.items():
+        for chunk in chunked(docs, TREE_CHUNK_SIZE):
+            (Document.objects.filter(pk__in=[doc.pk for doc in chunk])
+                             .update(zone_subnav_html=subnav))
+            memcache.delete_many([
+                DOCUMENT_RESPONSE_GENERATION_CACHE_KEY_TMPL %
+                Document.natural_key_hash((document.locale, doc.slug))
+                for doc in chunk])
+
+    if zone_changed:
+        job = DocumentZoneStackJob()
+        pks = [child.pk for kids in children.values() for child in kids]
+        for chunk in chunked(pks, TREE_CHUNK_SIZE):
+            job.cache.delete_many([job.key(child_pk) for child_pk in chunk])
+
+
+@task
+def update_moved_documents(pks):
+    """
+    Catch up with documents moved in bulk, and with the redirects left
+    behind, on what saving them and their new revisions would have done,
+    besides the title index and the contributors updated by the move: drop
+    their cached responses, zone stacks and code samples, refresh the zone
+    URL remaps if a zone moved, and tidy the new revisions. The moved
+    documents are then rendered again, which rebuilds their JSON, as is the
+    JSON of the redirects.
+    """
+    documents = list(Document.objects.filter(pk__in=pks)
+                                     .only('id', 'locale', 'slug',
+                                           'is_redirect', 'current_revision')
+                                     .order_by('pk'))
+    if not documents:
+        return
+    locale = documents[0].locale
+
+    memcache.delete_many([document.response_generation_cache_key
+                          for document in documents])
+    stack_job = DocumentZoneStackJob()
+    stack_job.cache.delete_many([stack_job.key(document.pk)
+                                 for document in documents])
+    generations = [DocumentCodeSampleJob(generation_args=[document.pk])
+                   .generation_key for document in documents]
+    generations[0].cache.delete_many([generation.key()
+                                      for generation in generations])
+    if DocumentZone.objects.filter(document__in=pks).exists():
+        DocumentZoneURLRemapsJob().invalidate(locale)
+        url_remaps.invalidate(locale)
+
+    moved_pks = []
+    for document in documents:
+        if document.current_revision_id:
+            tidy_revision_content.delay(document.current_revision_id)
+        if document.is_redirect:
+            build_json_data_for_document.delay(document.pk, stale=False)
+        else:
+            moved_pks.append(document.pk)
+    for chunk in chunked(moved_pks, 5):
+        render_document_chunk.delay(list(chunk), 'max-age=0')
+
+
 @task
 def move_page(locale, slug, new_slug, email):
     transaction.set_autocommit(False)
@@ -170,8 +360,13 @@ def move_page(locale, slug, new_slug, email):
         transaction.set_autocommit(True)
         return
 
+    def progress(moved, total):
+        log.info('Page move of %s/%s to %s: %s of %s documents moved' %
+                 (locale, slug, new_slug, moved, total))
+
     try:
-        doc._move_tree(new_slug, user=user)
+        moved_pks = doc._bulk_move_tree(new_slug, user=user,
+                                        progress=progress)
     except PageMoveError as e:
         transaction.rollback()
         message = """
@@ -212,9 +407,10 @@ def move_page(locale, slug, new_slug, email):
     transaction.commit()
     transaction.set_autocommit(True)
 
-    # Now that we know the move succeeded, re-render the whole tree.
-    for moved_doc in [doc] + doc.get_descendants():
-        moved_doc.schedule_rendering('max-age=0')
+    # Now that we know the move succeeded, catch up with the moved tree and
+    # the redirects left behind, and re-render the whole tree.
+    for pks in chunked(moved_pks, MOVE_CHUNK_SIZE):
+        update_moved_documents.delay(pks)
 
     subject = 'Page move completed: ' + slug + ' (' + locale + ')'
 
@@ -388,7 +584,7 @@ def build_sitemaps():
 
 
 @task
-def index_documents(ids, index_pk, reraise=False):
+def index_documents(ids, index_pk, reraise=False, thread_count=1):
     """
     Index a list of documents into the provided index.
 
@@ -396,6 +592,7 @@ def index_documents(ids, index_pk, reraise=False):
     :arg index_pk: The `Index` pk of the index to index into.
     :arg reraise: False if you want errors to be swallowed and True
         if you want errors to be thrown.
+    :arg thread_count: How many bulk indexing requests to send at once.
 
     .. Note::
 
@@ -404,13 +601,11 @@ def index_documents(ids, index_pk, reraise=False):
        task into chunks.
 
     """
-    from kuma.wiki.models import Document
-
     cls = WikiDocumentType
     es = cls.get_connection('indexing')
     index = Index.objects.get(pk=index_pk)
 
-    objects = Document.objects.filter(id__in=ids)
+    objects = cls.get_indexing_queryset(ids)
     documents = []
     for obj in objects:
         try:
@@ -422,7 +617,7 @@ def index_documents(ids, index_pk, reraise=False):
 
     if documents:
         cls.bulk_index(documents, id_field='id', es=es,
-                       index=index.prefixed_name)
+                       index=index.prefixed_name, thread_count=thread_count)
 
 
 @task
@@ -16,8 +16,9 @@ from . import document, normalize_html, revision
 
 from ..constants import ALLOWED_ATTRIBUTES, ALLOWED_TAGS
 from ..content import (SECTION_TAGS, CodeSyntaxFilter, H2TOCFilter,
-                       H3TOCFilter, SectionIDFilter, SectionTOCFilter,
-                       get_content_sections, get_seo_description)
+                       H3TOCFilter, LinkAnnotationFilter, SectionIDFilter,
+                       SectionTOCFilter, get_content_sections,
+                       get_seo_description)
 from ..models import Document
 from ..templatetags.jinja_helpers import bugize_text
 
@@ -410,6 +411,16 @@ class ContentSectionToolTests(UserTestCase):
         for original, slugified in headers:
             ok_(slugified == section_filter.slugify(original))
 
+    def test_section_ids_many_headers(self):
+        doc_src = '<h2>Same</h2><p>test</p>' * 500
+        result = pq(kuma.wiki.content
+                    .parse(doc_src)
+                    .injectSectionIDs()
+                    .serialize())
+        ids = [element.attrib['id'] for element in result.find('h2')]
+        eq_(['Same'] + ['Same_%s' % i for i in range(2, 501)], ids)
+        eq_(500, len(result.find('p')))
+
     @pytest.mark.toc
     def test_generate_toc(self):
         doc_src = """
@@ -898,6 +909,40 @@ class ContentSectionToolTests(UserTestCase):
                                             .serialize())
             self.assertHTMLEqual(normalize_html(expected_line), normalize_html(result_line))
 
+    def test_link_annotation_streaming(self):
+        """Links are annotated without walking the whole content first"""
+        parsed = kuma.wiki.content.parse(
+            u'<a href="/en-US/docs/Missing">Missing</a><p>After</p>')
+        walked = []
+
+        def source():
+            for token in parsed.clone().stream:
+                walked.append(token)
+                yield token
+
+        stream = iter(LinkAnnotationFilter(
+            source(), u'https://testserver',
+            links_source=parsed.clone().stream))
+        token = next(stream)
+        eq_(1, len(walked))
+        eq_([u'new'], [value for (namespace, name), value
+                       in token['data'].items() if name == 'class'])
+
+    def test_link_annotation_changed_links(self):
+        """Links changed by an earlier filter are still annotated"""
+        doc_src = u'<a href="/en-US/docs/Missing">Missing</a>'
+        result = (kuma.wiki.content.parse(doc_src)
+                                   .absolutizeAddresses(
+                                       base_url=u'https://example.com',
+                                       tag_attributes={'a': 'href'})
+                                   .annotateLinks(
+                                       base_url=u'https://testserver')
+                                   .serialize())
+        self.assertHTMLEqual(
+            u'<a class="external" '
+            u'href="https://example.com/en-US/docs/Missing">Missing</a>',
+            result)
+
     def test_editor_safety_filter(self):
         """Markup that's hazardous for editing should be stripped"""
         doc_src = """
@@ -983,6 +1028,101 @@ class ContentSectionToolTests(UserTestCase):
                   .serialize())
         eq_(normalize_html(expected), normalize_html(result))
 
+    def test_clone_shares_parse(self):
+        doc_src = """
+            <h2 id="s1">Head 1</h2>
+            <p>test</p>
+            <h2 id="s2">Head 2</h2>
+            <p>test 2</p>
+        """
+        parsed = kuma.wiki.content.parse(doc_src)
+        clone = parsed.clone()
+        ok_(clone.doc is parsed.doc)
+
+        # Filtering one stream leaves the tree intact for the others.
+        eq_(normalize_html('<p>test 2</p>'),
+            normalize_html(clone.extractSection('s2', ignore_heading=True)
+                                .serialize()))
+        eq_(normalize_html(doc_src),
+            normalize_html(parsed.clone().serialize()))
+        eq_(normalize_html(doc_src), normalize_html(parsed.serialize()))
+
+    def test_build_cached_fields(self):
+        doc_src = """
+            <h2 id="Summary">Summary</h2>
+            <p>The <strong>Document Object Model</strong> is an API.</p>
+            <h3 id="Quick_Links">Quick Links</h3>
+            <p>Foo, yay</p>
+            <h3 id="Subnav">Subnav</h3>
+            <p>Bar, yay</p>
+            <h2>Second</h2>
+            <p>Another section</p>
+        """
+        fields = kuma.wiki.content.build_cached_fields(
+            doc_src, 'https://example.com', locale='en-US',
+            toc_filter=H2TOCFilter,
+            fields=('quick_links_html', 'zone_subnav_local_html',
+                    'toc_html', 'summary_html', 'summary_text'))
+
+        eq_(normalize_html('<p>Foo, yay</p>'),
+            normalize_html(fields['quick_links_html']))
+        eq_(normalize_html('<p>Bar, yay</p>'),
+            normalize_html(fields['zone_subnav_local_html']))
+        eq_(kuma.wiki.content.parse(doc_src)
+                             .injectSectionIDs()
+                             .filter(H2TOCFilter)
+                             .serialize(),
+            fields['toc_html'])
+        eq_(get_seo_description(doc_src, 'en-US', False),
+            fields['summary_html'])
+        eq_('The Document Object Model is an API.', fields['summary_text'])
+        ok_('body_html' not in fields)
+
+    def test_build_cached_fields_parses_once(self):
+        doc_src = """
+            <h2>Head 1</h2>
+            <p>test</p>
+        """
+        with mock.patch('kuma.wiki.content.ContentSectionTool.parse',
+                        autospec=True,
+                        side_effect=kuma.wiki.content.ContentSectionTool.parse
+                        ) as mock_parse:
+            fields = kuma.wiki.content.build_cached_fields(
+                doc_src, 'https://example.com', toc_filter=H2TOCFilter,
+                fields=('toc_html', 'summary_html', 'summary_text'))
+        eq_(1, mock_parse.call_count)
+        ok_('Head 1' in fields['toc_html'])
+        eq_('test', fields['summary_text'])
+
+    def test_build_section_fragments(self):
+        doc_src = """
+            <h2 id="s1">Head 1</h2>
+            <p>test 1</p>
+            <h2>Head 2</h2>
+            <div class="noinclude"><p>not included</p></div>
+            <p>test 2</p>
+        """
+        fragments = kuma.wiki.content.build_section_fragments(doc_src)
+        eq_(set(['', 's1', 'Head_2']), set(fragments))
+
+        def raw_section(section_id):
+            return (kuma.wiki.content.parse(doc_src)
+                                     .injectSectionIDs()
+                                     .filterEditorSafety()
+                                     .extractSection(section_id)
+                                     .serialize())
+
+        eq_(raw_section('Head_2'), fragments['Head_2']['html'])
+        eq_(kuma.wiki.content.filter_out_noinclude(raw_section('Head_2')),
+            fragments['Head_2']['include_html'])
+        ok_('not included' not in fragments['Head_2']['include_html'])
+        # Headings without IDs aren't sections of the unfiltered source.
+        eq_('', fragments['Head_2']['source_html'])
+        eq_(kuma.wiki.content.parse(doc_src).extractSection('s1').serialize(),
+            fragments['s1']['source_html'])
+        eq_(doc_src, fragments['']['source_html'])
+        ok_('id="Head_2"' in fragments['']['html'])
+
 
 class AllowedHTMLTests(KumaTestCase):
     simple_tags = (
@@ -1088,6 +1228,21 @@ class ExtractorTests(UserTestCase):
         result = doc.extract.html_attributes()
         eq_(sorted(expected), sorted(result))
 
+    def test_search_fields_extraction(self):
+        rev = revision(is_approved=True, save=True, content="""
+            <p class="foobar barfoo" lang="farb">Test &amp; <em>more</em></p>
+            <div id="frazzy"><img class="bazquux" src="/a.png"></div>
+        """)
+        rev.document.render()
+        doc = Document.objects.get(pk=rev.document.pk)
+        result = doc.extract.search_fields()
+        eq_(sorted(['foobar', 'barfoo', 'bazquux']),
+            sorted(result['css_classnames']))
+        eq_(sorted(doc.extract.html_attributes()),
+            sorted(result['html_attributes']))
+        eq_(normalize_html('Test &amp; more'),
+            normalize_html(result['content']))
+
     def test_kumascript_macro_extraction(self):
         expected = ('foobar', 'barfoo', 'bazquux', 'banana')
         rev = revision(is_approved=True, save=True, content="""
@@ -1,10 +1,8 @@
-from datetime import timedelta
-
 from kuma.core.tests import eq_, ok_
-from kuma.users.tests import UserTestCase, user
+from kuma.users.tests import UserTestCase
 
 from . import revision
-from ..jobs import DocumentZoneStackJob, DocumentContributorsJob
+from ..jobs import DocumentZoneStackJob
 from ..models import Document, DocumentZone
 
 
@@ -59,83 +57,67 @@ class DocumentZoneTests(UserTestCase):
         eq_(zone_stack[0], middle_zone)
         eq_(zone_stack[1], root_zone)
 
+    def test_zone_subnav_materialized(self):
+        """Ensure the subnav of a zone is materialized below it"""
+        root_rev = revision(title='ZoneRoot', slug='ZoneRoot',
+                            content='<p>Root</p>'
+                                    '<h3 id="Subnav">Subnav</h3>'
+                                    '<p>Zone nav</p>',
+                            is_approved=True, save=True)
+        root_doc = root_rev.document
+        sub_rev = revision(title='SubPage', slug='ZoneRoot/SubPage',
+                           content='<p>Sub</p>',
+                           is_approved=True, save=True)
+        sub_doc = sub_rev.document
+        sub_doc.parent_topic = root_doc
+        for doc in (root_doc, sub_doc):
+            doc.regenerate_cache_with_fields()
+            doc.save()
+
+        zone = DocumentZone.objects.create(document=root_doc)
+        sub_doc = Document.objects.get(pk=sub_doc.pk)
+        ok_('Zone nav' in sub_doc.zone_subnav_html)
+        with self.assertNumQueries(0):
+            eq_(sub_doc.zone_subnav_html, sub_doc.get_zone_subnav_html())
+        zone_stack = self.get_zone_stack(sub_doc)
+        eq_([zone], zone_stack)
+        eq_(root_doc.slug, zone_stack[0].document.slug)
+
+        # A change to the subnav of the zone is propagated below it.
+        root_doc.zone_subnav_local_html = '<p>New nav</p>'
+        root_doc.save()
+        eq_('<p>New nav</p>',
+            Document.objects.get(pk=sub_doc.pk).zone_subnav_html)
+
+        # Saving the zone document with the same subnav propagates nothing.
+        Document.objects.filter(pk=sub_doc.pk).update(zone_subnav_html='')
+        root_doc.save()
+        eq_('', Document.objects.get(pk=sub_doc.pk).zone_subnav_html)
+
+        zone.delete()
+        eq_('', Document.objects.get(pk=sub_doc.pk).zone_subnav_html)
+        eq_([], self.get_zone_stack(sub_doc))
+
+    def test_zone_subnav_unknown(self):
+        """Ensure the subnav is left to be built when it's unknown"""
+        root_rev = revision(title='ZoneRoot', slug='ZoneRoot',
+                            content='<h3 id="Subnav">Subnav</h3>'
+                                    '<p>Zone nav</p>',
+                            is_approved=True, save=True)
+        root_doc = root_rev.document
+        sub_rev = revision(title='SubPage', slug='ZoneRoot/SubPage',
+                           content='<p>Sub</p>',
+                           is_approved=True, save=True)
+        sub_doc = sub_rev.document
+        sub_doc.parent_topic = root_doc
+        sub_doc.save()
+        eq_(None, sub_doc.zone_subnav_local_html)
+
+        DocumentZone.objects.create(document=root_doc)
+        sub_doc = Document.objects.get(pk=sub_doc.pk)
+        eq_(None, sub_doc.zone_subnav_html)
+        ok_('Zone nav' in sub_doc.get_zone_subnav_html())
+
     def get_zone_stack(self, doc):
         return DocumentZoneStackJob().get(doc.pk)
 
-
-class DocumentContributorsTests(UserTestCase):
-
-    def test_contributors(self):
-        contrib = user(save=True)
-        rev = revision(creator=contrib, save=True)
-        job = DocumentContributorsJob()
-        # setting this to true to be able to test this
-        job.fetch_on_miss = True
-        eq_(contrib.pk, job.get(rev.document.pk)[0]['id'])
-
-    def test_contributors_ordering(self):
-        contrib_1 = user(save=True)
-        contrib_2 = user(save=True)
-        contrib_3 = user(save=True)
-        rev_1 = revision(creator=contrib_1, save=True)
-        rev_2 = revision(creator=contrib_2,
-                         document=rev_1.document,
-                         # live in the future to make sure we handle the lack
-                         # of microseconds support in Django 1.7 nicely
-                         created=rev_1.created + timedelta(seconds=1),
-                         save=True)
-        ok_(rev_1.created < rev_2.created)
-        job = DocumentContributorsJob()
-        job_user_pks = [contributor['id']
-                        for contributor in job.fetch(rev_1.document.pk)]
-        # the user with the more recent revision first
-        recent_contributors_pks = [contrib_2.pk, contrib_1.pk]
-        eq_(job_user_pks, recent_contributors_pks)
-
-        # a third revision should now show up again and
-        # the job's cache is invalidated
-        rev_3 = revision(creator=contrib_3,
-                         document=rev_1.document,
-                         created=rev_2.created + timedelta(seconds=1),
-                         save=True)
-        ok_(rev_2.created < rev_3.created)
-        job_user_pks = [contributor['id']
-                        for contributor in job.fetch(rev_1.document.pk)]
-        # The new revision shows up
-        eq_(job_user_pks, [contrib_3.pk] + recent_contributors_pks)
-
-    def test_contributors_inactive_or_banned(self):
-        contrib_1 = user(save=True)
-        contrib_2 = user(is_active=False, save=True)
-        contrib_3 = user(save=True)
-        contrib_3_ban = contrib_3.bans.create(by=contrib_1, reason='because reasons')
-        revision_2 = revision(creator=contrib_1, save=True)
-
-        revision(creator=contrib_2, document=revision_2.document, save=True)
-        revision(creator=contrib_3, document=revision_2.document, save=True)
-
-        job = DocumentContributorsJob()
-        # setting this to true to be able to test this
-        job.fetch_on_miss = True
-
-        contributors = job.get(revision_2.document.pk)
-        contrib_ids = [contrib['id'] for contrib in contributors]
-        self.assertIn(contrib_1.id, contrib_ids)
-        self.assertNotIn(contrib_2.id, contrib_ids)
-        self.assertNotIn(contrib_3.id, contrib_ids)
-
-        # delete the ban again
-        contrib_3_ban.delete()
-        # reloading the document from db to prevent cache
-        doc = Document.objects.get(pk=revision_2.document.pk)
-        # user not in contributors because job invalidation hasn't happened
-        contrib_ids = [contrib['id']
-                       for contrib in job.get(revision_2.document.pk)]
-        self.assertNotIn(contrib_3.id, contrib_ids)
-
-        # trigger the invalidation manually by saving the document
-        doc.save()
-        doc = Document.objects.get(pk=revision_2.document.pk)
-        contrib_ids = [contrib['id']
-                       for contrib in job.get(revision_2.document.pk)]
-        self.assertIn(contrib_3.id, contrib_ids)
@@ -1,12 +1,83 @@
 # -*- coding: utf-8 -*-
 import base64
 import json
+import threading
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
 
 import mock
+from constance.test import override_config
+from django.test import RequestFactory
+from django.test.utils import override_settings
 
 from kuma.core.tests import eq_, ok_
+from kuma.users.tests import UserTestCase
 from kuma.wiki import kumascript
-from . import WikiTestCase, document
+from . import WikiTestCase, document, revision
+
+
+class StubKumascriptHandler(BaseHTTPRequestHandler):
+    """
+    A keep-alive stand-in for kumascript, echoing back posted content, and
+    the sources of documents posted to its batch endpoint.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.request_paths.append(self.path)
+        self.respond(200, u'<p>Rendered %s</p>' % self.path)
+
+    def do_POST(self):
+        self.server.request_paths.append(self.path)
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        if self.path != '/batch':
+            self.respond(200, body)
+        elif not self.server.batch_enabled:
+            self.respond(404, 'Not found')
+        else:
+            documents = [{'status': 200, 'headers': {}, 'body': doc['source']}
+                         for doc in json.loads(body)['documents']]
+            self.respond(200, json.dumps({'documents': documents}),
+                         'application/json')
+
+    def respond(self, status, body, content_type='text/html; charset=utf-8'):
+        if isinstance(body, unicode):
+            body = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubKumascriptServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class StubKumascriptMixin(object):
+    """Run a stand-in kumascript service for the duration of each test"""
+
+    def setUp(self):
+        super(StubKumascriptMixin, self).setUp()
+        self.server = StubKumascriptServer(('127.0.0.1', 0),
+                                           StubKumascriptHandler)
+        self.server.request_paths = []
+        self.server.batch_enabled = True
+        self.server_thread = threading.Thread(target=self.server.serve_forever)
+        self.server_thread.daemon = True
+        self.server_thread.start()
+        self.server_url = 'http://127.0.0.1:%s' % self.server.server_port
+        self.url_template = self.server_url + '/docs/{path}'
+        kumascript.reset_session()
+
+    def tearDown(self):
+        kumascript.reset_session()
+        self.server.shutdown()
+        self.server.server_close()
+        super(StubKumascriptMixin, self).tearDown()
 
 
 class KumascriptClientTests(WikiTestCase):
@@ -60,3 +131,201 @@ class KumascriptClientTests(WikiTestCase):
         kumascript.get(doc, 'no-cache', 'https://testserver')
         ok_(not mock_format_slug.called,
             "format slug should not have been called")
+
+
+@override_config(KUMASCRIPT_TIMEOUT=5.0)
+class KumascriptSessionTests(StubKumascriptMixin, WikiTestCase):
+
+    def test_post_reuses_connection(self):
+        request = RequestFactory().get('/')
+        with override_settings(KUMASCRIPT_URL_TEMPLATE=self.url_template):
+            for i in range(3):
+                body, errors = kumascript.post(request, u'<p>Hello %s</p>' % i)
+                eq_(u'<p>Hello %s</p>' % i, body)
+                eq_([], errors)
+
+        stats = kumascript.session_stats()
+        eq_(3, stats['requests'])
+        eq_(1, stats['connections'])
+        eq_(2, stats['pool_hits'])
+        ok_(stats['latency'] > 0)
+        ok_(stats['average_latency'] > 0)
+
+    def test_session_stats_reset(self):
+        request = RequestFactory().get('/')
+        with override_settings(KUMASCRIPT_URL_TEMPLATE=self.url_template):
+            kumascript.post(request, u'<p>Hello</p>')
+        kumascript.reset_session()
+        stats = kumascript.session_stats()
+        eq_(0, stats['requests'])
+        eq_(0, stats['latency'])
+
+    @override_settings(KUMASCRIPT_POOL_SIZE=3, KUMASCRIPT_CONNECT_RETRIES=2)
+    def test_session_configuration(self):
+        session = kumascript.get_session()
+        ok_(session is kumascript.get_session())
+        adapter = session.get_adapter(self.url_template)
+        eq_(3, adapter._pool_maxsize)
+        eq_(2, adapter.max_retries.connect)
+        eq_(0, adapter.max_retries.read)
+
+
+@override_config(KUMASCRIPT_TIMEOUT=5.0)
+class KumascriptBatchTests(StubKumascriptMixin, UserTestCase):
+
+    def setUp(self):
+        super(KumascriptBatchTests, self).setUp()
+        self.documents = [
+            revision(content=u'<p>Document %s</p>' % i, is_approved=True,
+                     save=True).document
+            for i in range(3)
+        ]
+
+    def test_get_many(self):
+        with override_settings(KUMASCRIPT_URL_TEMPLATE=self.url_template,
+                               KUMASCRIPT_BATCH_URL=self.server_url + '/batch'):
+            results = kumascript.get_many(self.documents, 'no-cache',
+                                          'https://testserver')
+        eq_(['/batch'], self.server.request_paths)
+        eq_([(u'<p>Document %s</p>' % i, []) for i in range(3)], results)
+
+    def test_get_many_concurrently(self):
+        with override_settings(KUMASCRIPT_URL_TEMPLATE=self.url_template,
+                               KUMASCRIPT_BATCH_URL=self.server_url + '/batch',
+                               KUMASCRIPT_BATCH_SIZE=2):
+            results = kumascript.get_many(self.documents, 'no-cache',
+                                          'https://testserver', concurrency=2)
+        eq_(2, len(self.server.request_paths))
+        # The lone document of the last batch gets a GET request of its own.
+        ok_('/batch' in self.server.request_paths)
+        eq_(u'<p>Document 0</p>', results[0][0])
+        eq_(u'<p>Document 1</p>', results[1][0])
+        doc = self.documents[2]
+        eq_(u'<p>Rendered /docs/%s/%s</p>' % (doc.locale, doc.slug),
+            results[2][0])
+
+    def test_get_many_without_batch_support(self):
+        self.server.batch_enabled = False
+        with override_settings(KUMASCRIPT_URL_TEMPLATE=self.url_template,
+                               KUMASCRIPT_BATCH_URL=self.server_url + '/batch'):
+            results = kumascript.get_many(self.documents, 'no-cache',
+                                          'https://testserver')
+        eq_(4, len(self.server.request_paths))
+        eq_('/batch', self.server.request_paths[0])
+        for doc, (body, errors) in zip(self.documents, results):
+            path = '/docs/%s/%s' % (doc.locale, doc.slug)
+            eq_(u'<p>Rendered %s</p>' % path, body)
+
+    def test_get_many_without_batch_url(self):
+        with override_settings(KUMASCRIPT_URL_TEMPLATE=self.url_template,
+                               KUMASCRIPT_BATCH_URL=''):
+            results = kumascript.get_many(self.documents, 'no-cache',
+                                          'https://testserver')
+        eq_(3, len(self.server.request_paths))
+        ok_('/batch' not in self.server.request_paths)
+        eq_(3, len(results))
+
+    def test_get_many_failure(self):
+        self.server.shutdown()
+        self.server.server_close()
+        with override_settings(KUMASCRIPT_URL_TEMPLATE=self.url_template,
+                               KUMASCRIPT_BATCH_URL=self.server_url + '/batch'):
+            results = kumascript.get_many(self.documents, 'no-cache',
+                                          'https://testserver')
+        eq_(3, len(results))
+        for body, errors in results:
+            eq_(None, body)
+            eq_('UnknownError', errors[0]['args'][0])
+
+
+@override_config(KUMASCRIPT_TIMEOUT=5.0, KUMASCRIPT_RENDER_CACHE_TIMEOUT=600)
+class KumascriptRenderCacheTests(StubKumascriptMixin, UserTestCase):
+
+    def setUp(self):
+        super(KumascriptRenderCacheTests, self).setUp()
+        self.template = revision(
+            document=document(title='Template:SomeMacro',
+                              slug='Template:SomeMacro', save=True),
+            content=u'<%= "Hello" %>', is_approved=True,
+            save=True).document
+        self.doc = revision(content=u'<p>{{ SomeMacro() }}</p>',
+                            is_approved=True, save=True).document
+
+    def get(self, cache_control='max-age=0'):
+        with override_settings(KUMASCRIPT_URL_TEMPLATE=self.url_template):
+            return kumascript.get(self.doc, cache_control,
+                                  'https://testserver')
+
+    def test_unchanged_document(self):
+        before = kumascript.render_cache_stats()
+        first = self.get()
+        second = self.get()
+        eq_(first, second)
+        eq_(1, len(self.server.request_paths))
+        stats = kumascript.render_cache_stats()
+        eq_(1, stats['hits'] - before['hits'])
+        eq_(1, stats['misses'] - before['misses'])
+
+    def test_rendered_document(self):
+        """Saving a rendering doesn't change the cache key of the next one"""
+        with override_settings(KUMASCRIPT_URL_TEMPLATE=self.url_template):
+            self.doc.render('max-age=0', 'https://testserver')
+            self.doc.render('max-age=0', 'https://testserver')
+        eq_(1, len(self.server.request_paths))
+
+    def test_render_max_age(self):
+        eq_(600, kumascript.render_cache_timeout(self.doc))
+        self.doc.render_max_age = 60
+        eq_(60, kumascript.render_cache_timeout(self.doc))
+
+    def test_edited_document(self):
+        self.get()
+        revision(document=self.doc, content=u'<p>{{ SomeMacro() }}!</p>',
+                 is_approved=True, save=True)
+        self.get()
+        eq_(2, len(self.server.request_paths))
+
+    def test_edited_template(self):
+        self.get()
+        revision(document=self.template, content=u'<%= "Hi" %>',
+                 is_approved=True, save=True)
+        self.get()
+        eq_(2, len(self.server.request_paths))
+
+    def test_retagged_document(self):
+        self.get()
+        self.doc.tags.add(u'CSS')
+        self.get()
+        eq_(2, len(self.server.request_paths))
+
+    def test_edited_unrelated_template(self):
+        self.get()
+        revision(document=document(title='Template:OtherMacro',
+                                   slug='Template:OtherMacro', save=True),
+                 is_approved=True, save=True)
+        self.get()
+        eq_(1, len(self.server.request_paths))
+
+    def test_no_cache(self):
+        self.get()
+        self.get(cache_control='no-cache')
+        eq_(2, len(self.server.request_paths))
+
+    def test_failed_rendering(self):
+        self.server.shutdown()
+        self.server.server_close()
+        body, errors = self.get()
+        eq_(None, body)
+        render_key, rendering = kumascript.get_cached_rendering(self.doc,
+                                                                'max-age=0')
+        eq_(None, rendering)
+
+    def test_get_many(self):
+        with override_settings(KUMASCRIPT_URL_TEMPLATE=self.url_template,
+                               KUMASCRIPT_BATCH_URL=''):
+            first = kumascript.get_many([self.doc, self.template],
+                                        'max-age=0', 'https://testserver')
+            second = kumascript.get_many([self.doc, self.template],
+                                         'max-age=0', 'https://testserver')
+        eq_(first, second)
+        eq_(2, len(self.server.request_paths))
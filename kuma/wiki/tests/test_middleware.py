@@ -1,13 +1,16 @@
 # -*- coding: utf-8 -*-
+import mock
 from django.test import RequestFactory
 
 from kuma.core.cache import memcache
-from kuma.core.tests import eq_
+from kuma.core.tests import KumaTestCase, eq_, ok_
 from kuma.users.tests import UserTestCase
 
 from . import revision
+from ..jobs import DocumentZoneURLRemapsJob
 from ..middleware import DocumentZoneMiddleware
 from ..models import DocumentZone
+from ..zones import ZoneURLRemaps, url_remaps
 
 from . import WikiTestCase
 
@@ -18,6 +21,7 @@ class DocumentZoneMiddlewareTestCase(UserTestCase, WikiTestCase):
         super(DocumentZoneMiddlewareTestCase, self).setUp()
         self.rf = RequestFactory()
         memcache.clear()
+        url_remaps.clear()
 
         self.zone_root = 'ExtraWiki'
         self.zone_root_content = 'This is the Zone Root'
@@ -116,6 +120,21 @@ class DocumentZoneMiddlewareTestCase(UserTestCase, WikiTestCase):
         response = self.client.get(url, follow=False)
         eq_(200, response.status_code)
 
+    def test_remaps_from_memory(self):
+        """Ensure a warm process remaps paths without memcache"""
+        middleware = DocumentZoneMiddleware()
+        request = self.rf.get('/%s/Middle' % self.zone_root)
+        request.LANGUAGE_CODE = 'en-US'
+        middleware.process_request(request)
+        eq_('/docs/%s' % self.middle_doc.slug, request.path_info)
+
+        with mock.patch.object(DocumentZoneURLRemapsJob, 'get') as get:
+            request = self.rf.get('/%s/Middle/SubPage' % self.zone_root)
+            request.LANGUAGE_CODE = 'en-US'
+            middleware.process_request(request)
+            eq_('/docs/%s' % self.sub_doc.slug, request.path_info)
+            ok_(not get.called)
+
     def test_no_redirect(self):
         middleware = DocumentZoneMiddleware()
         for endpoint in ['$subscribe', '$files']:
@@ -150,3 +169,24 @@ class DocumentZoneMiddlewareTestCase(UserTestCase, WikiTestCase):
         url = '/en-US/docs/%s' % non_zone_doc.slug
         response = self.client.get(url, follow=False)
         eq_(200, response.status_code)
+
+
+class ZoneURLRemapsTests(KumaTestCase):
+
+    def test_remap(self):
+        remaps = ZoneURLRemaps([('/docs/Mozilla', '/Moz'),
+                                ('/docs/Mozilla/Firefox', '/Firefox'),
+                                ('/docs/Other', '/Other/')])
+        # The deepest zone wins.
+        eq_((True, '/Firefox/Releases'),
+            remaps.remap('/docs/Mozilla/Firefox/Releases'))
+        eq_((True, '/Moz/Firefox_OS'), remaps.remap('/docs/Mozilla/Firefox_OS'))
+        eq_((True, '/Moz/'), remaps.remap('/docs/Mozilla/'))
+        eq_((False, '/docs/Mozilla/Firefox/Releases'),
+            remaps.remap('/Firefox/Releases'))
+        eq_((False, '/docs/Other/Page'), remaps.remap('/Other/Page'))
+        eq_((False, '/docs/Other'), remaps.remap('/Other'))
+        # Paths only match whole path segments.
+        eq_(None, remaps.remap('/docs/Mozillas'))
+        eq_(None, remaps.remap('/Firefox_OS'))
+        eq_(None, remaps.remap('/docs/Unzoned'))
@@ -12,21 +12,26 @@ from waffle.models import Switch
 
 from django.conf import settings
 from django.core.exceptions import ValidationError
+from django.db import IntegrityError, connection
+from django.test.utils import CaptureQueriesContext
 
 from kuma.core.exceptions import ProgrammingError
 from kuma.core.tests import KumaTestCase, eq_, get_user, ok_
 from kuma.attachments.models import Attachment, AttachmentRevision
-from kuma.users.tests import UserTestCase
+from kuma.users.tests import UserTestCase, user
 
 from . import (create_document_tree, create_template_test_users,
                create_topical_parents_docs, document, normalize_html,
                revision)
 from .. import tasks
-from ..constants import REDIRECT_CONTENT, TEMPLATE_TITLE_PREFIX
+from ..constants import (DOCUMENT_CONTENT_FIELDS, REDIRECT_CONTENT,
+                         TEMPLATE_TITLE_PREFIX)
+from ..content import CACHED_FIELDS
 from ..events import EditDocumentInTreeEvent
 from ..exceptions import (DocumentRenderedContentNotAvailable,
                           DocumentRenderingInProgress, PageMoveError)
-from ..models import Document, Revision, RevisionIP, TaggedDocument
+from ..models import (Document, DocumentContributor, DocumentMacro, Revision,
+                      RevisionIP, TaggedDocument)
 from ..templatetags.jinja_helpers import absolutify
 from ..utils import tidy_content
 from ..signals import render_done
@@ -222,6 +227,48 @@ class DocumentTests(UserTestCase):
         d3.save()
         ok_(d3.parents == [d1, d2])
 
+    def test_topical_parents_without_content(self):
+        d1, d2 = create_topical_parents_docs()
+        d3 = document(title='Smell accessibility', parent_topic=d2,
+                      save=True)
+        d3 = Document.objects.get(pk=d3.pk)
+        with self.assertNumQueries(2):
+            parents = d3.parents
+        eq_([d1, d2], parents)
+        for parent in parents:
+            ok_(DOCUMENT_CONTENT_FIELDS[0] in parent.get_deferred_fields())
+        # The parents are cached along the way.
+        with self.assertNumQueries(0):
+            eq_([d1, d2], d3.parents)
+            eq_(d2, d3.parent_topic)
+
+    def test_defer_content(self):
+        doc = revision(content='<p>Some content</p>', is_approved=True,
+                       save=True).document
+        html = Document.objects.get(pk=doc.pk).html
+        doc = Document.objects.defer_content().get(pk=doc.pk)
+        eq_(set(DOCUMENT_CONTENT_FIELDS), doc.get_deferred_fields())
+        # Reading one content field loads all of them.
+        with self.assertNumQueries(1):
+            eq_(html, doc.html)
+            doc.rendered_html
+            doc.summary_text
+
+        # Saving loads the rest of the content first, and sends the signals
+        # for Document rather than for a deferred proxy model.
+        doc = Document.objects.defer_content().get(pk=doc.pk)
+        doc.title = u'Retitled'
+        with mock.patch('kuma.wiki.titles.document_saved') as document_saved:
+            doc.save()
+        eq_(Document, type(doc))
+        eq_([mock.call(doc)], document_saved.call_args_list)
+        doc = Document.objects.get(pk=doc.pk)
+        eq_(u'Retitled', doc.title)
+        eq_(html, doc.html)
+
+        doc = Document.objects.defer_content('summary_text').get(pk=doc.pk)
+        ok_('summary_text' not in doc.get_deferred_fields())
+
     @pytest.mark.redirect
     def test_redirect_url_allows_site_url(self):
         href = "%s/en-US/Mozilla" % settings.SITE_URL
@@ -1170,6 +1217,53 @@ class PageMoveTests(UserTestCase):
 
         ok_([c1, gc1, c2, gc2, gc3, ggc1] == top.get_descendants())
 
+    def test_get_descendants_queries(self):
+        """The whole tree is loaded in a constant number of queries, with
+        the children whose slugs don't follow their parent's."""
+        top = document(title='Top', slug='Top', save=True)
+        children = []
+        for i in range(3):
+            child = document(title='Child %s' % i, slug='Top/Child_%s' % i,
+                             parent_topic=top, save=True)
+            children.append(child)
+            for j in range(3):
+                document(title='Child %s.%s' % (i, j),
+                         slug='Top/Child_%s/Child_%s' % (i, j),
+                         parent_topic=child, save=True)
+        outlier = document(title='Outlier', slug='Elsewhere',
+                           parent_topic=children[0], save=True)
+        outlier_child = document(title='Outlier child',
+                                 slug='Elsewhere/Child',
+                                 parent_topic=outlier, save=True)
+        # Sharing the slug prefix doesn't make a document a descendant.
+        document(title='Orphan', slug='Top/Orphan/Child', save=True)
+
+        with self.assertNumQueries(5):
+            descendants = top.get_descendants()
+        eq_(15, len(descendants))
+        eq_(children[0], descendants[0])
+        ok_(descendants.index(outlier) < descendants.index(outlier_child))
+        ok_(descendants.index(outlier_child) < descendants.index(children[1]))
+        # The descendants returned are loaded whole.
+        eq_(set(), descendants[0].get_deferred_fields())
+
+        eq_(3, len(top.get_descendants(1)))
+        eq_(12, len(top.get_descendants(2)))
+        eq_([outlier_child], outlier.get_descendants())
+
+    def test_get_descendant_children_fields(self):
+        """The tree can be loaded with only a few of the document fields"""
+        top = document(title='Top', slug='Top', save=True)
+        child = document(title='Child', slug='Top/Child', parent_topic=top,
+                         save=True)
+        with self.assertNumQueries(2):
+            children = top.get_descendant_children(fields=['title'])
+        eq_([child], children[top.pk])
+        eq_('Child', children[top.pk][0].title)
+        deferred = children[top.pk][0].get_deferred_fields()
+        ok_('html' in deferred)
+        ok_('title' not in deferred)
+
     @pytest.mark.move
     def test_circular_dependency(self):
         """Make sure we can detect potential circular dependencies in
@@ -1245,7 +1339,7 @@ class PageMoveTests(UserTestCase):
                  save=True)
         # Now we do a simple move: inserting a prefix that needs to be
         # inherited by the whole tree.
-        top_doc._move_tree('new-prefix/first-level/parent')
+        top_doc._bulk_move_tree('new-prefix/first-level/parent')
 
         # And for each document verify three things:
         #
@@ -1374,7 +1468,7 @@ class PageMoveTests(UserTestCase):
                      save=True)
 
             doc = rev.document
-            doc._move_tree('new-top/page-move-tags')
+            doc._bulk_move_tree('new-top/page-move-tags')
 
             moved_doc = Document.objects.get(pk=doc.id)
             new_rev = moved_doc.current_revision
@@ -1421,7 +1515,7 @@ class PageMoveTests(UserTestCase):
         daughter_doc.save()
 
         # move grandma under grandpa
-        grandma_doc._move_tree('grandpa/grandma')
+        grandma_doc._bulk_move_tree('grandpa/grandma')
 
         # assert the parent_topics are correctly rooted at grandpa
         # note we have to refetch these to see any DB changes.
@@ -1441,7 +1535,7 @@ class PageMoveTests(UserTestCase):
         doc = rev.document
 
         try:
-            doc._move_tree('slug-that-doesnt-exist/doc1')
+            doc._bulk_move_tree('slug-that-doesnt-exist/doc1')
             ok_(False, "Moving page under non-existing doc should error.")
         except Exception:
             pass
@@ -1474,8 +1568,8 @@ class PageMoveTests(UserTestCase):
         # move page to new slug
         new_title = page_to_move_title + ' Moved'
 
-        page_to_move_doc._move_tree(page_moved_slug, user=None,
-                                    title=new_title)
+        page_to_move_doc._bulk_move_tree(page_moved_slug, user=None,
+                                         title=new_title)
 
         page_to_move_doc = Document.objects.get(slug=page_to_move_slug)
         page_moved_doc = Document.objects.get(slug=page_moved_slug)
@@ -1526,7 +1620,7 @@ class PageMoveTests(UserTestCase):
         grandchild_doc.parent_topic = child_doc
         grandchild_doc.save()
 
-        child_doc._move_tree(moved_child_slug)
+        child_doc._bulk_move_tree(moved_child_slug)
 
         redirected_child = Document.objects.get(slug=child_slug)
         Document.objects.get(slug=moved_child_slug)
@@ -1568,7 +1662,7 @@ class PageMoveTests(UserTestCase):
         original_child_id = special_child.id
 
         # First move, to new slug.
-        special_root._move_tree(new_root_slug)
+        special_root._bulk_move_tree(new_root_slug)
 
         # Appropriate redirects were left behind.
         root_redirect = Document.objects.get(locale=special_root.locale,
@@ -1589,7 +1683,7 @@ class PageMoveTests(UserTestCase):
         eq_(original_child_id, moved_child.id)
 
         # Second move, back to original slug.
-        moved_root._move_tree(root_slug)
+        moved_root._bulk_move_tree(root_slug)
 
         # Once again we left redirects behind.
         root_second_redirect = Document.objects.get(locale=special_root.locale,
@@ -1617,9 +1711,9 @@ class PageMoveTests(UserTestCase):
 
     def test_fail_message(self):
         """
-        When page move fails in moving one of the children, it
-        generates an informative exception message explaining which
-        child document failed.
+        When page move would overwrite a page with one of the children,
+        it generates an informative exception message explaining which
+        page is in the way.
 
         """
         top = revision(title='Test page-move error messaging',
@@ -1644,28 +1738,103 @@ class PageMoveTests(UserTestCase):
         grandchild_doc.parent_topic = child_doc
         grandchild_doc.save()
 
-        revision(title='Conflict page for page-move error handling',
-                 slug='test-move-error-messaging/moved/grandchild',
-                 is_approved=True,
-                 save=True)
-        # TODO: Someday when we're on Python 2.7, we can use
-        # assertRaisesRegexp. Until then, we have to manually catch
-        # and inspect the exception.
-        try:
-            child_doc._move_tree('test-move-error-messaging/moved')
-        except PageMoveError as e:
-            err_strings = [
-                'with id %s' % grandchild_doc.id,
-                'https://developer.mozilla.org/%s/docs/%s' % (grandchild_doc.locale,
-                                                              grandchild_doc.slug),
-                "Exception type: <type 'exceptions.Exception'>",
-                'Exception message: Requested move would overwrite a non-redirect page.',
-                'in _move_tree',
-                'in _move_conflicts',
-                'raise Exception("Requested move would overwrite a non-redirect page.")',
-            ]
-            for s in err_strings:
-                ok_(s in e.args[0])
+        conflict = revision(title='Conflict page for page-move error handling',
+                            slug='test-move-error-messaging/moved/grandchild',
+                            is_approved=True,
+                            save=True).document
+        with self.assertRaises(PageMoveError) as context:
+            child_doc._bulk_move_tree('test-move-error-messaging/moved')
+        err_strings = [
+            'Requested move would overwrite 1 non-redirect page(s)',
+            'https://developer.mozilla.org/%s/docs/%s (id %s)' % (
+                conflict.locale, conflict.slug, conflict.id),
+        ]
+        for s in err_strings:
+            ok_(s in context.exception.args[0])
+
+    @pytest.mark.move
+    def test_bulk_move_tree(self):
+        """A large tree is moved with a bounded number of queries, leaving
+        redirects behind."""
+        user = get_user()
+        root_rev = revision(title='Bulk move root', slug='Bulk_Move',
+                            is_approved=True, save=True)
+        root_rev.review_tags.set('technical')
+        root = root_rev.document
+
+        # 1 root, 39 children and 39 * 50 grandchildren: 2,000 pages.
+        Document.objects.bulk_create(
+            document(title='Child %s' % i, slug='Bulk_Move/Child_%s' % i,
+                     parent_topic=root)
+            for i in range(39))
+        children = list(Document.objects.filter(
+            slug__startswith='Bulk_Move/', parent_topic=root))
+        Document.objects.bulk_create(
+            document(title='Grandchild %s' % j,
+                     slug='%s/Grandchild_%s' % (child.slug, j),
+                     parent_topic=child)
+            for child in children for j in range(50))
+        pages = list(Document.objects.filter(slug__startswith='Bulk_Move/'))
+        Revision.objects.bulk_create(
+            revision(document=page, title=page.title, slug=page.slug,
+                     creator=user, is_approved=True)
+            for page in pages)
+        for rev in Revision.objects.filter(document__in=pages):
+            Document.objects.filter(pk=rev.document_id).update(
+                current_revision=rev)
+        eq_(1999, len(pages))
+
+        progress = []
+        with CaptureQueriesContext(connection) as queries:
+            root._bulk_move_tree('Bulk_Moved', user=user,
+                                 progress=lambda *args: progress.append(args))
+        ok_(len(queries) < 100)
+        eq_((2000, 2000), progress[-1])
+
+        moved = Document.objects.filter(slug__startswith='Bulk_Moved')
+        eq_(2000, moved.count())
+        eq_(0, moved.filter(is_redirect=True).count())
+        redirects = Document.objects.filter(slug__startswith='Bulk_Move/')
+        eq_(1999, redirects.filter(is_redirect=True).count())
+
+        moved_root = Document.objects.get(pk=root.pk)
+        eq_('Bulk_Moved', moved_root.current_revision.slug)
+        ok_(root_rev.pk != moved_root.current_revision.pk)
+        eq_(['technical'],
+            [str(tag) for tag in moved_root.current_revision.review_tags.all()])
+        redirect = Document.objects.get(slug='Bulk_Move')
+        ok_(redirect.is_redirect)
+        ok_('Bulk_Moved' in redirect.get_redirect_url())
+        ok_('Bulk_Moved' in redirect.current_revision.content)
+
+        grandchild = Document.objects.get(
+            slug='Bulk_Moved/Child_7/Grandchild_42')
+        eq_(grandchild.slug, grandchild.current_revision.slug)
+        eq_('Bulk_Moved/Child_7', grandchild.parent_topic.slug)
+        ok_(grandchild.slug in Document.objects.get(
+            slug='Bulk_Move/Child_7/Grandchild_42').get_redirect_url())
+
+    @pytest.mark.move
+    def test_bulk_move_tree_conflicts(self):
+        """Nothing is moved if any page of the tree would be overwritten."""
+        top = revision(title='Bulk move conflicts', slug='Bulk_Conflicts',
+                       is_approved=True, save=True).document
+        child = revision(title='Child', slug='Bulk_Conflicts/Child',
+                         is_approved=True, save=True).document
+        child.parent_topic = top
+        child.save()
+        conflict = revision(title='Conflict', slug='Bulk_Moved/Child',
+                            is_approved=True, save=True).document
+        revision(title='Bulk moved', slug='Bulk_Moved',
+                 content='REDIRECT <a class="redirect" href="/foo">Foo</a>',
+                 is_approved=True, save=True)
+
+        with self.assertRaises(PageMoveError) as context:
+            top._bulk_move_tree('Bulk_Moved')
+        ok_('id %s' % conflict.pk in context.exception.args[0])
+        eq_('Bulk_Conflicts', Document.objects.get(pk=top.pk).slug)
+        eq_('Bulk_Conflicts/Child', Document.objects.get(pk=child.pk).slug)
+        ok_(Document.objects.get(slug='Bulk_Moved').is_redirect)
 
 
 class DocumentParsingTests(UserTestCase):
@@ -1736,6 +1905,32 @@ class DocumentParsingTests(UserTestCase):
         eq_(normalize_html(subnav),
             normalize_html(d.get_zone_subnav_local_html()))
 
+    def test_regenerate_cache_with_fields(self):
+        src = """
+            <h2 id="Summary">Summary</h2>
+            <p>A <strong>fine</strong> summary</p>
+            <h3 id="Quick_Links">Quick Links</h3>
+            <p>Foo, yay</p>
+            <h2>Second</h2>
+            <p>Another section</p>
+        """
+        r = revision(title='Document with sections',
+                     slug='document-with-sections',
+                     content=src, toc_depth=1,
+                     is_approved=True, save=True)
+        d = r.document
+
+        expected = {}
+        for field_name in CACHED_FIELDS:
+            expected[field_name] = getattr(d, 'get_%s' % field_name)(
+                force_fresh=True)
+            setattr(d, field_name, None)
+
+        d.regenerate_cache_with_fields()
+        for field_name in CACHED_FIELDS:
+            eq_(expected[field_name], getattr(d, field_name))
+        eq_('A fine summary', d.summary_text)
+
     def test_bug_982174(self):
         """Ensure build_json_data uses rendered HTML when available to extract
         sections generated by KumaScript (bug 982174)"""
@@ -1780,6 +1975,49 @@ class DocumentParsingTests(UserTestCase):
         eq_(expected_sections, json_data['sections'])
 
 
+class DocumentMacroTests(UserTestCase):
+
+    def macro_names(self, doc):
+        return sorted(doc.macros.values_list('name', flat=True))
+
+    def test_index_on_save(self):
+        doc = revision(content=u'<p>{{ SomeMacro }} {{otherMacro("x")}}</p>',
+                       is_approved=True, save=True).document
+        eq_(['othermacro', 'somemacro'], self.macro_names(doc))
+
+        revision(document=doc, content=u'<p>{{ otherMacro }} {{ New }}</p>',
+                 is_approved=True, save=True)
+        eq_(['new', 'othermacro'], self.macro_names(doc))
+
+    def test_templates_not_indexed(self):
+        template = revision(
+            document=document(title='Template:Test', slug='Template:Test',
+                              save=True),
+            content=u'<%= "{{ NotAMacro }}" %>', is_approved=True,
+            save=True).document
+        eq_([], self.macro_names(template))
+
+    def test_callers(self):
+        content = u'<p>{{ SomeMacro }}</p>'
+        de_doc = revision(document=document(locale='de', save=True),
+                          content=content, is_approved=True,
+                          save=True).document
+        old_doc = revision(content=content, is_approved=True,
+                           save=True).document
+        new_doc = revision(content=content, is_approved=True,
+                           save=True).document
+        Document.objects.filter(pk=old_doc.pk).update(
+            modified=datetime.now() - timedelta(days=1))
+        revision(content=u'<p>{{ OtherMacro }}</p>', is_approved=True,
+                 save=True)
+        deleted_doc = revision(content=content, is_approved=True,
+                               save=True).document
+        deleted_doc.delete()
+
+        eq_([new_doc.pk, old_doc.pk, de_doc.pk],
+            DocumentMacro.objects.callers('SomeMacro'))
+
+
 class RevisionIPTests(UserTestCase):
     def test_delete_older_than_default_30_days(self):
         old_date = date.today() - timedelta(days=31)
@@ -1868,3 +2106,138 @@ class AttachmentTests(UserTestCase):
         eq_(attachments.count(), 2)
         eq_(attachments[0].file, attachment)
         eq_(attachments[1].file, attachment2)
+
+
+class DocumentContributorTests(UserTestCase):
+
+    def contributor_pks(self, doc):
+        return [contributor['id'] for contributor in doc.contributors]
+
+    def test_contributors(self):
+        contrib = user(save=True)
+        rev = revision(creator=contrib, save=True)
+        contributors = rev.document.contributors
+        eq_(len(contributors), 1)
+        eq_(contrib.pk, contributors[0]['id'])
+        eq_(contrib.username, contributors[0]['username'])
+        ok_(contributors[0]['gravatar_34'])
+
+    def test_contributors_ordering(self):
+        contrib_1 = user(save=True)
+        contrib_2 = user(save=True)
+        contrib_3 = user(save=True)
+        rev_1 = revision(creator=contrib_1, save=True)
+        rev_2 = revision(creator=contrib_2,
+                         document=rev_1.document,
+                         # live in the future to make sure we handle the lack
+                         # of microseconds support in Django 1.7 nicely
+                         created=rev_1.created + timedelta(seconds=1),
+                         save=True)
+        ok_(rev_1.created < rev_2.created)
+        # the user with the more recent revision first
+        eq_(self.contributor_pks(rev_1.document), [contrib_2.pk, contrib_1.pk])
+
+        # a new revision shows up right away
+        revision(creator=contrib_3, document=rev_1.document,
+                 created=rev_2.created + timedelta(seconds=1), save=True)
+        eq_(self.contributor_pks(rev_1.document),
+            [contrib_3.pk, contrib_2.pk, contrib_1.pk])
+
+        # and another one by an earlier contributor moves them up
+        revision(creator=contrib_1, document=rev_1.document,
+                 created=rev_2.created + timedelta(seconds=2), save=True)
+        eq_(self.contributor_pks(rev_1.document),
+            [contrib_1.pk, contrib_3.pk, contrib_2.pk])
+        contribution = DocumentContributor.objects.get(
+            document=rev_1.document, user=contrib_1)
+        eq_(contribution.revisions, 2)
+
+    def test_contributors_inactive_or_banned(self):
+        contrib_1 = user(save=True)
+        contrib_2 = user(is_active=False, save=True)
+        contrib_3 = user(save=True)
+        contrib_3_ban = contrib_3.bans.create(by=contrib_1,
+                                              reason='because reasons')
+        revision_2 = revision(creator=contrib_1, save=True)
+        doc = revision_2.document
+        revision(creator=contrib_2, document=doc, save=True)
+        revision(creator=contrib_3, document=doc, save=True)
+
+        contrib_ids = self.contributor_pks(doc)
+        self.assertIn(contrib_1.id, contrib_ids)
+        self.assertNotIn(contrib_2.id, contrib_ids)
+        self.assertNotIn(contrib_3.id, contrib_ids)
+
+        # lifting the ban shows the user again right away
+        contrib_3_ban.delete()
+        self.assertIn(contrib_3.id, self.contributor_pks(doc))
+
+    def test_revision_delete(self):
+        contrib_1 = user(save=True)
+        contrib_2 = user(save=True)
+        rev_1 = revision(creator=contrib_1, save=True)
+        doc = rev_1.document
+        rev_2 = revision(creator=contrib_2, document=doc,
+                         created=rev_1.created + timedelta(seconds=1),
+                         save=True)
+        rev_3 = revision(creator=contrib_1, document=doc,
+                         created=rev_1.created + timedelta(seconds=2),
+                         save=True)
+        eq_(self.contributor_pks(doc), [contrib_1.pk, contrib_2.pk])
+
+        # the contributions are counted again without the deleted revision
+        rev_3.delete()
+        eq_(self.contributor_pks(doc), [contrib_2.pk, contrib_1.pk])
+        contribution = DocumentContributor.objects.get(document=doc,
+                                                       user=contrib_1)
+        eq_(contribution.revisions, 1)
+        eq_(contribution.last_contributed, rev_1.created)
+
+        # and the last revision of a user removes them
+        rev_2.delete()
+        eq_(self.contributor_pks(doc), [contrib_1.pk])
+
+    def test_concurrent_contribution(self):
+        contrib = user(save=True)
+        rev = revision(creator=contrib, save=True)
+        doc = rev.document
+        DocumentContributor.objects.filter(document=doc).delete()
+        created = (rev.created + timedelta(seconds=1)).replace(microsecond=0)
+
+        def create_concurrently(items):
+            DocumentContributor.objects.create(document=doc, user=contrib,
+                                               last_contributed=rev.created,
+                                               revisions=1)
+            raise IntegrityError
+
+        # a contribution created meanwhile is counted again instead
+        with mock.patch.object(DocumentContributor.objects, 'bulk_create',
+                               side_effect=create_concurrently):
+            DocumentContributor.objects.add_revisions([doc.pk], contrib.pk,
+                                                      created)
+        contribution = DocumentContributor.objects.get(document=doc,
+                                                       user=contrib)
+        eq_(contribution.revisions, 2)
+        eq_(contribution.last_contributed, created)
+
+    def test_moved_tree(self):
+        contrib_1 = user(save=True)
+        contrib_2 = user(save=True)
+        root = revision(title='Moved', slug='Moved', creator=contrib_1,
+                        is_approved=True, save=True).document
+        child = revision(title='Child', slug='Moved/Child',
+                         creator=contrib_2, is_approved=True,
+                         save=True).document
+        child.parent_topic = root
+        child.save()
+
+        # the revisions created by the move count as contributions
+        root._bulk_move_tree('Moved_Again', user=contrib_2)
+        eq_(set(self.contributor_pks(root)), set([contrib_1.pk, contrib_2.pk]))
+        eq_(self.contributor_pks(child), [contrib_2.pk])
+        eq_(DocumentContributor.objects.get(document=child,
+                                            user=contrib_2).revisions, 2)
+        for slug in ('Moved', 'Moved/Child'):
+            redirect = Document.objects.get(locale=root.locale, slug=slug)
+            ok_(redirect.is_redirect)
+            eq_(self.contributor_pks(redirect), [contrib_2.pk])
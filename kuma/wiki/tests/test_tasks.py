@@ -1,19 +1,24 @@
 from __future__ import with_statement
 
 from datetime import datetime
+import json
 import os
 
+import mock
+from constance.test import override_config
 from django.conf import settings
+from django.test.utils import override_settings
 
 from kuma.core.cache import memcache
-from kuma.core.tests import ok_
+from kuma.core.tests import eq_, ok_
 from kuma.users.models import User
 from kuma.users.tests import UserTestCase, user
 
 from . import document, revision
 from ..models import Document, DocumentSpamAttempt
 from ..tasks import (build_sitemaps, delete_old_documentspamattempt_data,
-                     update_community_stats)
+                     render_document_chunk, render_macro_callers,
+                     update_community_stats, update_moved_documents)
 
 
 class UpdateCommunityStatsTests(UserTestCase):
@@ -114,3 +119,124 @@ class DeleteOldDocumentSpamAttemptData(UserTestCase):
         assert old_unreviewed_dsa.data is None
         assert old_unreviewed_dsa.review == (
             DocumentSpamAttempt.REVIEW_UNAVAILABLE)
+
+
+class RenderDocumentChunkTests(UserTestCase):
+
+    @override_config(KUMASCRIPT_TIMEOUT=1.0)
+    @override_settings(KUMASCRIPT_BATCH_URL='http://localhost:9080/batch')
+    @mock.patch('kuma.wiki.kumascript.get_many')
+    def test_render_document_chunk_batches(self, mock_get_many):
+        mock_get_many.side_effect = lambda docs, *args, **kwargs: [
+            (u'<p>Rendered %s</p>' % doc.pk, None) for doc in docs]
+        pks = [revision(is_approved=True, save=True).document.pk
+               for i in range(3)]
+
+        render_document_chunk(pks)
+
+        eq_(1, mock_get_many.call_count)
+        for pk in pks:
+            doc = Document.objects.get(pk=pk)
+            eq_(u'<p>Rendered %s</p>' % pk, doc.rendered_html)
+            ok_(doc.last_rendered_at)
+            eq_(None, doc.rendered_errors)
+
+    @override_config(KUMASCRIPT_TIMEOUT=1.0)
+    @override_settings(KUMASCRIPT_BATCH_URL='')
+    @mock.patch('kuma.wiki.kumascript.get_many')
+    @mock.patch('kuma.wiki.kumascript.get')
+    def test_render_document_chunk_without_batches(self, mock_get,
+                                                   mock_get_many):
+        mock_get.return_value = (u'<p>Rendered</p>', None)
+        pks = [revision(is_approved=True, save=True).document.pk
+               for i in range(3)]
+
+        render_document_chunk(pks)
+
+        eq_(3, mock_get.call_count)
+        ok_(not mock_get_many.called)
+
+    @override_config(KUMASCRIPT_TIMEOUT=1.0,
+                     KUMA_DOCUMENT_RENDER_CONCURRENCY=3)
+    @override_settings(KUMASCRIPT_BATCH_URL='')
+    @mock.patch('kuma.wiki.kumascript.get_many')
+    def test_render_document_chunk_concurrently(self, mock_get_many):
+        errors = [{'level': 'error', 'message': 'Failed', 'args': []}]
+        mock_get_many.side_effect = lambda docs, *args, **kwargs: [
+            (None, errors) if i == 1 else (u'<p>Rendered %s</p>' % doc.pk, [])
+            for i, doc in enumerate(docs)]
+        pks = [revision(is_approved=True, save=True).document.pk
+               for i in range(3)]
+
+        render_document_chunk(pks)
+
+        eq_(1, mock_get_many.call_count)
+        eq_(3, mock_get_many.call_args[1]['concurrency'])
+        # One failed rendering doesn't keep the others from being saved.
+        for i, pk in enumerate(pks):
+            doc = Document.objects.get(pk=pk)
+            ok_(doc.last_rendered_at)
+            if i == 1:
+                eq_(errors, json.loads(doc.rendered_errors))
+            else:
+                eq_(u'<p>Rendered %s</p>' % pk, doc.rendered_html)
+                eq_(None, doc.rendered_errors)
+
+
+class RenderMacroCallersTests(UserTestCase):
+
+    def setUp(self):
+        super(RenderMacroCallersTests, self).setUp()
+        self.template = revision(
+            document=document(title='Template:SomeMacro',
+                              slug='Template:SomeMacro', save=True),
+            content=u'<%= "Hello" %>', is_approved=True,
+            save=True).document
+        self.caller = revision(content=u'<p>{{ SomeMacro }}</p>',
+                               is_approved=True, save=True).document
+        revision(content=u'<p>{{ OtherMacro }}</p>', is_approved=True,
+                 save=True)
+
+    @mock.patch('kuma.wiki.tasks.render_document_chunk.delay')
+    def test_render_callers_on_template_edit(self, mock_chunk_delay):
+        revision(document=self.template, content=u'<%= "Hi" %>',
+                 is_approved=True, save=True)
+        mock_chunk_delay.assert_called_once_with((self.caller.pk,))
+
+    @mock.patch('kuma.wiki.tasks.render_document_chunk.delay')
+    def test_render_callers_once_per_revision(self, mock_chunk_delay):
+        revision_pk = self.template.current_revision_id
+        render_macro_callers(self.template.pk, revision_pk)
+        ok_(not mock_chunk_delay.called)
+
+        memcache.clear()
+        render_macro_callers(self.template.pk, revision_pk)
+        render_macro_callers(self.template.pk, revision_pk)
+        mock_chunk_delay.assert_called_once_with((self.caller.pk,))
+
+
+class UpdateMovedDocumentsTests(UserTestCase):
+
+    @mock.patch('kuma.wiki.tasks.render_document_chunk.delay')
+    def test_catch_up_with_moved_documents(self, mock_render_chunk):
+        top = revision(title='Top', slug='Move_Top', is_approved=True,
+                       save=True).document
+        child = revision(title='Child', slug='Move_Top/Child',
+                         is_approved=True, save=True).document
+        child.parent_topic = top
+        child.save()
+        pks = top._bulk_move_tree('Move_Moved')
+        eq_(4, len(pks))
+        redirect = Document.objects.get(slug='Move_Top/Child')
+        memcache.set(redirect.response_generation_cache_key, 'stale')
+
+        update_moved_documents(pks)
+        redirect = Document.objects.get(slug='Move_Top/Child')
+        ok_(redirect.is_redirect)
+        eq_('Move_Top/Child', json.loads(redirect.json)['slug'])
+        ok_(redirect.current_revision.tidied_content)
+        eq_(None, memcache.get(redirect.response_generation_cache_key))
+        # Only the moved documents are rendered again, which rebuilds
+        # their JSON.
+        eq_([mock.call([top.pk, child.pk], 'max-age=0')],
+            mock_render_chunk.call_args_list)
@@ -44,8 +44,11 @@ from ..events import EditDocumentEvent, EditDocumentInTreeEvent
 from ..forms import MIDAIR_COLLISION
 from ..models import (Document, DocumentDeletionLog, DocumentTag, DocumentZone,
                       Revision, RevisionAkismetSubmission, RevisionIP)
+from ..signals import render_done
 from ..templatetags.jinja_helpers import get_compare_url
-from ..views.document import _get_seo_parent_title
+from ..titles import locale_changed, slugs, titles
+from ..views.document import (_get_doc_and_fallback_reason,
+                              _get_seo_parent_title)
 
 
 class RedirectTests(UserTestCase, WikiTestCase):
@@ -340,17 +343,13 @@ class ViewTests(UserTestCase, WikiTestCase):
         eq_(resp.content, 'Foo bar <a href="http://example.com">baz</a>')
 
     @mock.patch('waffle.flag_is_active', return_value=True)
-    @mock.patch('kuma.wiki.jobs.DocumentContributorsJob.get', return_value=[
-        {'id': 1, 'username': 'ringo', 'email': 'ringo@apple.co.uk'},
-        {'id': 2, 'username': 'john', 'email': 'lennon@apple.co.uk'},
-    ])
-    def test_footer_contributors(self, get_contributors, flag_is_active):
-        get_contributors.return_value = [
-            {'id': 1, 'username': 'ringo', 'email': 'ringo@apple.co.uk'},
-            {'id': 2, 'username': 'john', 'email': 'lennon@apple.co.uk'},
-        ]
-        flag_is_active.return_value = True
-        rev = revision(is_approved=True, save=True, content='some content')
+    def test_footer_contributors(self, flag_is_active):
+        ringo = user(username='ringo', email='ringo@apple.co.uk', save=True)
+        john = user(username='john', email='lennon@apple.co.uk', save=True)
+        rev = revision(is_approved=True, creator=ringo, save=True,
+                       content='some content')
+        revision(is_approved=True, creator=john, document=rev.document,
+                 save=True, content='more content')
         resp = self.client.get(rev.document.get_absolute_url())
         page = pq(resp.content)
         contributors = (page.find(":contains('Contributors to this page')")
@@ -619,6 +618,92 @@ class ConditionalGetTests(UserTestCase, WikiTestCase):
         assert 'Reason for Deletion' in response.content
 
 
+@override_settings(DOCUMENT_RESPONSE_CACHE_TIMEOUT=300)
+class DocumentResponseCacheTests(UserTestCase, WikiTestCase):
+    """Tests for the responses cached for anonymous users"""
+    localizing_client = True
+
+    def setUp(self):
+        super(DocumentResponseCacheTests, self).setUp()
+        rev = revision(title='Cached', content='<p>Cached</p>',
+                       is_approved=True, save=True)
+        self.doc = rev.document
+        self.url = reverse('wiki.document', args=[self.doc.slug],
+                           locale=settings.WIKI_DEFAULT_LANGUAGE)
+
+    def get(self, url=None, **kwargs):
+        """Request the document, counting the documents looked up"""
+        with mock.patch('kuma.wiki.views.document._get_doc_and_fallback_'
+                        'reason', wraps=_get_doc_and_fallback_reason) as get:
+            response = self.client.get(url or self.url, follow=False,
+                                       **kwargs)
+        eq_(200, response.status_code)
+        return response, get.call_count
+
+    def test_anonymous_hits(self):
+        response, lookups = self.get()
+        eq_(1, lookups)
+        response, lookups = self.get()
+        eq_(0, lookups)
+        ok_('Cached' in response.content)
+        ok_(response.has_header('last-modified'))
+        eq_(self.doc.calculate_etag(), response['etag'])
+
+        # The other query parameters are cached separately
+        response, lookups = self.get(self.url + '?summary')
+        eq_(1, lookups)
+        response, lookups = self.get(self.url + '?summary')
+        eq_(0, lookups)
+
+        # Conditional requests are still answered by the last-modified
+        last_modified = response['last-modified']
+        response = self.client.get(self.url, follow=False,
+                                   HTTP_IF_MODIFIED_SINCE=last_modified)
+        eq_(304, response.status_code)
+
+    def test_purged_on_save(self):
+        self.get()
+        # Changes without saving the document aren't seen yet
+        Document.objects.filter(pk=self.doc.pk).update(title='Changed')
+        response, lookups = self.get()
+        eq_(0, lookups)
+        ok_('Changed' not in response.content)
+
+        doc = Document.objects.get(pk=self.doc.pk)
+        doc.save()
+        response, lookups = self.get()
+        eq_(1, lookups)
+        ok_('Changed' in response.content)
+
+    def test_purged_on_render_done(self):
+        self.get()
+        render_done.send(sender=Document, instance=self.doc)
+        response, lookups = self.get()
+        eq_(1, lookups)
+
+    def test_not_cached(self):
+        # Without a cached last modification
+        cache.delete(self.doc.last_modified_cache_key)
+        response, lookups = self.get()
+        eq_(1, lookups)
+        cache.delete(self.doc.last_modified_cache_key)
+        response, lookups = self.get()
+        eq_(1, lookups)
+
+        # For users
+        self.client.login(username='admin', password='testpass')
+        self.get()
+        response, lookups = self.get()
+        eq_(1, lookups)
+        self.client.logout()
+
+        # For users with messages pending
+        self.get()
+        self.client.cookies['messages'] = 'pending'
+        response, lookups = self.get()
+        eq_(1, lookups)
+
+
 class ReadOnlyTests(UserTestCase, WikiTestCase):
     """Tests readonly scenarios"""
     fixtures = UserTestCase.fixtures + ['wiki/documents.json']
@@ -846,7 +931,8 @@ class KumascriptIntegrationTests(UserTestCase, WikiTestCase):
         eq_(mock_requests.request_history[1].headers['Cache-Control'],
             'no-cache')
 
-    @override_config(KUMASCRIPT_TIMEOUT=1.0, KUMASCRIPT_MAX_AGE=1234)
+    @override_config(KUMASCRIPT_TIMEOUT=1.0, KUMASCRIPT_MAX_AGE=1234,
+                     KUMASCRIPT_RENDER_CACHE_TIMEOUT=0)
     @requests_mock.mock()
     def test_conditional_get(self, mock_requests):
         """
@@ -2521,7 +2607,7 @@ class DocumentEditingTests(UserTestCase, WikiTestCase):
         doc = document(slug='move-me', save=True)
         rev = revision(document=doc, save=True)
         prev_rev_id = rev.id
-        doc._move_tree('moved-doc')
+        doc._bulk_move_tree('moved-doc')
         self.client.login(username='admin', password='testpass')
 
         resp = self.client.post(reverse('wiki.revert_document',
@@ -3179,6 +3265,39 @@ class SectionEditingResourceTests(UserTestCase, WikiTestCase):
         eq_(normalize_html(expected),
             normalize_html(resp.content.decode('utf-8')))
 
+    def test_raw_section_fragments(self):
+        """Raw sections are served from the fragments extracted once."""
+        rev = revision(is_approved=True, save=True, content="""
+            <h1 id="s1">s1</h1>
+            <p>test</p>
+            <h1 id="s2">s2</h1>
+            <div class="noinclude"><p>not included</p></div>
+            <p>test</p>
+        """)
+        doc = rev.document
+        doc.fill_section_fragments()
+        url = reverse('wiki.document', args=[doc.slug])
+
+        with mock.patch('kuma.wiki.content.ContentSectionTool.parse') as parse:
+            response = self.client.get('%s?raw&section=s2&include' % url)
+            eq_(0, parse.call_count)
+        eq_(normalize_html('<h1 id="s2">s2</h1><p>test</p>'),
+            normalize_html(response.content))
+        eq_(doc.get_section_fragment('s2')['etag'], response['ETag'])
+
+        with mock.patch('kuma.wiki.content.ContentSectionTool.parse') as parse:
+            response = self.client.get('%s?raw&section=s2' % url)
+            eq_(0, parse.call_count)
+        ok_('not included' in response.content)
+
+        # A new revision has its own fragments.
+        revision(document=doc, is_approved=True, save=True, content="""
+            <h1 id="s2">s2</h1>
+            <p>changed</p>
+        """)
+        response = self.client.get('%s?raw&section=s2' % url)
+        ok_('changed' in response.content)
+
     def test_section_edit_toc(self):
         """show_toc is preserved in section editing."""
         self.client.login(username='admin', password='testpass')
@@ -3346,6 +3465,11 @@ class AutosuggestDocumentsTests(WikiTestCase):
     """
     localizing_client = True
 
+    def setUp(self):
+        super(AutosuggestDocumentsTests, self).setUp()
+        # Forget the titles of the documents rolled back after other tests
+        titles.locales.clear()
+
     def test_autosuggest_no_term(self):
         url = reverse('wiki.autosuggest_documents',
                       locale=settings.WIKI_DEFAULT_LANGUAGE)
@@ -3399,6 +3523,69 @@ class AutosuggestDocumentsTests(WikiTestCase):
                     break
             eq_(True, found)
 
+    def test_autosuggest_limit(self):
+        for i in range(25):
+            document(title='Suggested %02d' % i, slug='Suggested_%02d' % i,
+                     save=True)
+        document(title='Suggested elsewhere', slug='Suggested', locale='fr',
+                 save=True)
+
+        url = reverse('wiki.autosuggest_documents',
+                      locale=settings.WIKI_DEFAULT_LANGUAGE)
+        resp = self.client.get(url, {'term': 'suggested',
+                                     'current_locale': 1})
+        eq_(200, resp.status_code)
+        data = json.loads(resp.content)
+        eq_([d['title'] for d in data],
+            ['Suggested %02d' % i for i in range(20)])
+        eq_(data[0], {
+            'id': Document.objects.get(slug='Suggested_00').id,
+            'title': 'Suggested 00',
+            'label': 'Suggested 00 [en-US]',
+            'slug': 'Suggested_00',
+            'locale': 'en-US',
+            'url': '/en-US/docs/Suggested_00',
+        })
+
+        resp = self.client.get(url, {'term': 'elsewhere'})
+        eq_(['fr'], [d['locale'] for d in json.loads(resp.content)])
+
+    def test_autosuggest_bulk_changes(self):
+        doc = document(title='Before', slug='Before', save=True)
+        url = reverse('wiki.autosuggest_documents',
+                      locale=settings.WIKI_DEFAULT_LANGUAGE)
+        resp = self.client.get(url, {'term': 'before'})
+        eq_(1, len(json.loads(resp.content)))
+
+        # Changed without signals, as by another process
+        Document.objects.filter(pk=doc.pk).update(
+            title='After', modified=datetime.datetime.now())
+        locale_changed(doc.locale)
+        resp = self.client.get(url, {'term': 'before'})
+        eq_([], json.loads(resp.content))
+        resp = self.client.get(url, {'term': 'after'})
+        eq_([doc.id], [d['id'] for d in json.loads(resp.content)])
+
+    def test_autosuggest_deleted(self):
+        doc = document(title='Deleted', slug='Deleted', save=True)
+        document(title='Deleted elsewhere', slug='Deleted_Elsewhere',
+                 save=True)
+        url = reverse('wiki.autosuggest_documents',
+                      locale=settings.WIKI_DEFAULT_LANGUAGE)
+        resp = self.client.get(url, {'term': 'deleted'})
+        eq_(2, len(json.loads(resp.content)))
+
+        # Deleted by another process, which this one catches up with
+        # without loading the documents again
+        rebuilt_at = titles.get(doc.locale).rebuilt_at
+        with mock.patch.object(titles, 'document_deleted'), \
+                mock.patch.object(slugs, 'document_deleted'):
+            doc.delete()
+        resp = self.client.get(url, {'term': 'deleted'})
+        eq_(['Deleted elsewhere'],
+            [d['title'] for d in json.loads(resp.content)])
+        eq_(rebuilt_at, titles.get(doc.locale).rebuilt_at)
+
     def test_list_no_redirects(self):
         Document.objects.all().delete()
 
@@ -0,0 +1,343 @@
+"""
+In-memory indexes of the titles, or the slugs, of the documents of each
+locale, to answer autosuggest requests without scanning the documents table.
+
+Every process loads the index of a locale the first time it's searched. The
+process saving or deleting a document updates its own index right away and
+changes a generation in memcache, which makes the other processes catch up
+on their next search with the documents modified since they last did.
+Deleted documents are numbered in memcache, for the other processes to
+remove those deleted since they last caught up.
+"""
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import defaultdict
+from uuid import uuid4
+
+from kuma.core.cache import memcache
+
+from .constants import (AUTOSUGGEST_LIMIT,
+                        TITLE_INDEX_DELETED_CACHE_KEY_TMPL,
+                        TITLE_INDEX_DELETED_COUNT_CACHE_KEY_TMPL,
+                        TITLE_INDEX_GENERATION_CACHE_KEY_TMPL,
+                        TITLE_INDEX_REBUILD_CACHE_KEY_TMPL)
+
+
+def trigrams(text):
+    return set(text[i:i + 3] for i in range(len(text) - 2))
+
+
+def padded_trigrams(text):
+    """The trigrams of a text padded on both ends, so that each of its
+    characters is part of a trigram, however short it is."""
+    return trigrams(u'\0%s\0' % text)
+
+
+def is_suggested(slug, is_template, is_redirect):
+    """Whether a document is suggested, unlike templates, redirects and
+    the talk pages of the former wiki"""
+    return not (is_template or is_redirect or 'talk:' in slug.lower())
+
+
+class LocaleTitles(object):
+    """
+    The titles of the documents of a locale, in the order they're
+    suggested, along with the documents with each trigram in their
+    lowercased title.
+    """
+    #: Seconds after which to catch up with modified documents anyway
+    sync_timeout = 60
+    #: Seconds after which to load all the documents again anyway
+    rebuild_timeout = 60 * 60
+    #: How many documents sharing the rarest trigram of a term to filter,
+    #: beyond which scanning the sorted titles finds the first ones faster
+    candidates_limit = 5000
+    #: How many deleted documents to remove, beyond which loading all the
+    #: documents again is faster
+    deleted_limit = 1000
+
+    def __init__(self, locale):
+        self.locale = locale
+        self.lock = threading.RLock()
+        self.clear()
+        self.generation = self.rebuild = None
+        self.synced_at = self.rebuilt_at = 0
+        # The number of the last deleted document removed
+        self.deleted = 0
+
+    def clear(self):
+        # The sorted (lowercased title, slug length, ID) keys of the documents
+        self.keys = []
+        # The key, title and slug of each document by ID
+        self.documents = {}
+        self.trigrams = defaultdict(set)
+        self.modified = None
+
+    def entry(self, pk, title, slug, is_template, is_redirect):
+        """Return the key, title and slug of a suggested document"""
+        if is_suggested(slug, is_template, is_redirect):
+            return ((title.lower(), len(slug), pk), title, slug)
+
+    def add(self, entry):
+        key = entry[0]
+        pk = key[2]
+        self.remove(pk)
+        self.documents[pk] = entry
+        insort(self.keys, key)
+        for trigram in padded_trigrams(key[0]):
+            self.trigrams[trigram].add(pk)
+
+    def remove(self, pk):
+        entry = self.documents.pop(pk, None)
+        if entry is None:
+            return
+        key = entry[0]
+        del self.keys[bisect_left(self.keys, key)]
+        for trigram in padded_trigrams(key[0]):
+            pks = self.trigrams[trigram]
+            pks.discard(pk)
+            if not pks:
+                del self.trigrams[trigram]
+
+    def update(self, pk, title, slug, is_template, is_redirect,
+               modified=None):
+        entry = self.entry(pk, title, slug, is_template, is_redirect)
+        if entry is None:
+            self.remove(pk)
+        else:
+            self.add(entry)
+        if modified is not None and (self.modified is None or
+                                     modified > self.modified):
+            self.modified = modified
+
+    def rows(self, **filters):
+        from .models import Document
+        return (Document.objects.filter(locale=self.locale, **filters)
+                                .values_list('id', 'title', 'slug',
+                                             'is_template', 'is_redirect',
+                                             'modified'))
+
+    def load(self):
+        """Load the titles of all the documents of the locale."""
+        self.clear()
+        for row in self.rows().iterator():
+            pk, title, slug, is_template, is_redirect, modified = row
+            entry = self.entry(pk, title, slug, is_template, is_redirect)
+            if entry is not None:
+                self.documents[pk] = entry
+                for trigram in padded_trigrams(entry[0][0]):
+                    self.trigrams[trigram].add(pk)
+            if modified is not None and (self.modified is None or
+                                         modified > self.modified):
+                self.modified = modified
+        self.keys = sorted(entry[0] for entry in self.documents.values())
+
+    def catch_up(self):
+        """Update the titles of the documents modified since the last
+        loaded or caught up with."""
+        if self.modified is None:
+            return self.load()
+        for row in self.rows(modified__gte=self.modified):
+            self.update(*row)
+
+    def catch_up_deleted(self, deleted):
+        """
+        Remove the documents deleted since the last loaded or caught up
+        with, up to the given number, and return whether they were all
+        found in memcache.
+        """
+        if not 0 <= deleted - self.deleted <= self.deleted_limit:
+            return False
+        keys = [TITLE_INDEX_DELETED_CACHE_KEY_TMPL % (self.locale, number)
+                for number in range(self.deleted + 1, deleted + 1)]
+        pks = memcache.get_many(keys)
+        if len(pks) < len(keys):
+            return False
+        for pk in pks.values():
+            self.remove(pk)
+        self.deleted = deleted
+        return True
+
+    def sync(self):
+        """
+        Load the titles or catch up with modified and deleted documents,
+        when another process saved or deleted a document or when they're
+        too old.
+        """
+        generation_key = TITLE_INDEX_GENERATION_CACHE_KEY_TMPL % self.locale
+        rebuild_key = TITLE_INDEX_REBUILD_CACHE_KEY_TMPL % self.locale
+        deleted_key = TITLE_INDEX_DELETED_COUNT_CACHE_KEY_TMPL % self.locale
+        # Documents saved while loading change the generation once more.
+        state = memcache.get_many([generation_key, rebuild_key, deleted_key])
+        generation = state.get(generation_key)
+        rebuild = state.get(rebuild_key)
+        deleted = state.get(deleted_key, 0)
+        now = time.time()
+        if (not self.rebuilt_at or rebuild != self.rebuild or
+                self.rebuilt_at + self.rebuild_timeout < now or
+                not self.catch_up_deleted(deleted)):
+            self.load()
+            self.rebuild = rebuild
+            self.rebuilt_at = now
+            self.deleted = deleted
+        elif (generation != self.generation or
+                self.synced_at + self.sync_timeout < now):
+            self.catch_up()
+        else:
+            return
+        self.generation = generation
+        self.synced_at = now
+
+    def search(self, term, limit):
+        """
+        Return the key, title and slug of the first documents, up to the
+        given limit, whose title, or slug, contains the given term.
+        """
+        term = term.lower()
+        if len(term) >= 3:
+            candidates = min((self.trigrams.get(trigram, ())
+                              for trigram in trigrams(term)), key=len)
+        else:
+            # Shorter terms are part of the trigrams of every title
+            # containing them.
+            postings = [pks for trigram, pks in self.trigrams.items()
+                        if term in trigram]
+            if sum(len(pks) for pks in postings) <= self.candidates_limit:
+                candidates = set().union(*postings)
+            else:
+                candidates = None
+        if candidates is not None and len(candidates) <= self.candidates_limit:
+            keys = sorted(key for key in (self.documents[pk][0]
+                                          for pk in candidates)
+                          if term in key[0])
+            return [self.documents[key[2]] for key in keys[:limit]]
+        matches = []
+        for key in self.keys:
+            if term in key[0]:
+                matches.append(self.documents[key[2]])
+                if len(matches) == limit:
+                    break
+        return matches
+
+
+class LocaleSlugs(LocaleTitles):
+    """
+    The slugs of all the documents of a locale, in alphabetical order,
+    along with the documents with each trigram in their lowercased slug.
+    """
+    def entry(self, pk, title, slug, is_template, is_redirect):
+        return ((slug.lower(), len(slug), pk), title, slug)
+
+
+class TitleIndex(object):
+    """
+    The titles, or slugs, of the documents of the locales searched so far
+    by the current process.
+    """
+    def __init__(self, locale_class):
+        self.locale_class = locale_class
+        self.locales = {}
+        self.lock = threading.Lock()
+
+    def get(self, locale):
+        with self.lock:
+            titles = self.locales.get(locale)
+            if titles is None:
+                titles = self.locales[locale] = self.locale_class(locale)
+        return titles
+
+    def search(self, term, locales, limit=AUTOSUGGEST_LIMIT, unique=False):
+        """
+        Return the ID, title, slug and locale of the documents of the given
+        locales whose title, or slug, contains the given term, in order, up
+        to the limit.
+
+        When unique, only the first of the documents of several locales
+        sharing a title, or slug, is returned.
+        """
+        matches = []
+        for locale in locales:
+            titles = self.get(locale)
+            with titles.lock:
+                titles.sync()
+                matches.extend(entry + (locale,)
+                               for entry in titles.search(term, limit))
+        matches.sort()
+        if unique:
+            seen = set()
+            matches = [match for match in matches
+                       if not (match[0][0] in seen or seen.add(match[0][0]))]
+        return [(key[2], title, slug, locale)
+                for key, title, slug, locale in matches[:limit]]
+
+    def document_saved(self, document):
+        titles = self.locales.get(document.locale)
+        if titles is not None:
+            with titles.lock:
+                if document.deleted:
+                    # The document is being restored, keeping its former
+                    # modification time, so only a reload finds it.
+                    titles.rebuilt_at = 0
+                else:
+                    titles.update(document.pk, document.title,
+                                  document.slug, document.is_template,
+                                  document.is_redirect)
+
+    def document_deleted(self, document):
+        titles = self.locales.get(document.locale)
+        if titles is not None:
+            with titles.lock:
+                titles.remove(document.pk)
+
+
+titles = TitleIndex(LocaleTitles)
+slugs = TitleIndex(LocaleSlugs)
+
+
+def document_saved(document):
+    """
+    Update the given document in the indexes of this process and make the
+    other processes catch up.
+    """
+    for index in (titles, slugs):
+        index.document_saved(document)
+    if document.deleted:
+        key_tmpl = TITLE_INDEX_REBUILD_CACHE_KEY_TMPL
+    else:
+        key_tmpl = TITLE_INDEX_GENERATION_CACHE_KEY_TMPL
+    memcache.set(key_tmpl % document.locale, uuid4().hex, timeout=None)
+
+
+def document_deleted(document):
+    """
+    Remove the given document from the indexes of this process, and number
+    it among the deleted documents of its locale for the other processes
+    to remove it as well. They load the locale again if they missed any.
+    """
+    for index in (titles, slugs):
+        index.document_deleted(document)
+    count_key = TITLE_INDEX_DELETED_COUNT_CACHE_KEY_TMPL % document.locale
+    memcache.add(count_key, 0, timeout=None)
+    try:
+        number = memcache.incr(count_key)
+    except ValueError:
+        # The count was evicted meanwhile.
+        memcache.set(TITLE_INDEX_REBUILD_CACHE_KEY_TMPL % document.locale,
+                     uuid4().hex, timeout=None)
+        return
+    # A process which didn't catch up for longer loads the locale again.
+    memcache.set(TITLE_INDEX_DELETED_CACHE_KEY_TMPL %
+                 (document.locale, number),
+                 document.pk, timeout=LocaleTitles.rebuild_timeout)
+    memcache.set(TITLE_INDEX_GENERATION_CACHE_KEY_TMPL % document.locale,
+                 uuid4().hex, timeout=None)
+
+
+def locale_changed(locale):
+    """
+    Make every process catch up with the documents of a locale modified
+    in bulk, without signals.
+    """
+    memcache.set(TITLE_INDEX_GENERATION_CACHE_KEY_TMPL % locale,
+                 uuid4().hex, timeout=None)
@@ -33,7 +33,8 @@ from kuma.search.store import get_search_url_from_referer
 
 from .. import kumascript
 from ..constants import SLUG_CLEANSING_RE
-from ..decorators import (allow_CORS_GET, check_readonly, prevent_indexing,
+from ..decorators import (allow_CORS_GET, cache_anonymous_document,
+                          check_readonly, prevent_indexing,
                           process_document_path)
 from ..events import EditDocumentEvent, EditDocumentInTreeEvent
 from ..forms import TreeMoveForm
@@ -85,10 +86,15 @@ def _get_html_and_errors(request, doc, rendering_params):
     return doc_html, ks_errors, render_raw_fallback
 
 
-def _make_doc_structure(document, level, expand, depth):
+def _make_doc_structure(document, level, expand, depth, children=None):
     if document.is_redirect:
         return None
 
+    if children is None:
+        # Load the whole subtree at once, instead of querying the children
+        # of each document on the way down.
+        children = document.get_descendant_children(depth - level)
+
     if expand:
         result = dict(document.get_json_data())
         result['subpages'] = []
@@ -102,10 +108,11 @@ def _make_doc_structure(document, level, expand, depth):
         }
 
     if level < depth:
-        descendants = document.get_descendants(1)
-        descendants.sort(key=lambda item: item.title)
+        descendants = sorted(children.get(document.pk, []),
+                             key=lambda item: item.title)
         for descendant in descendants:
-            subpage = _make_doc_structure(descendant, level + 1, expand, depth)
+            subpage = _make_doc_structure(descendant, level + 1, expand, depth,
+                                          children)
             if subpage is not None:
                 result['subpages'].append(subpage)
     return result
@@ -139,6 +146,16 @@ def _filter_doc_html(request, doc, doc_html, rendering_params):
             rendering_params['edit_links'] or rendering_params['include']):
         return doc_html
 
+    # ?raw requests without macros, as used for transclusion by kumascript,
+    # are served the sections extracted from the source at render time.
+    if (rendering_params['raw'] and not rendering_params['use_rendered'] and
+            not rendering_params['edit_links']):
+        fragment = doc.get_section_fragment(rendering_params['section'])
+        if fragment is not None:
+            if rendering_params['include']:
+                return fragment['include_html']
+            return fragment['html']
+
     # TODO: One more view-time content parsing instance to refactor
     tool = kuma.wiki.content.parse(doc_html)
 
@@ -150,7 +167,6 @@ def _filter_doc_html(request, doc, doc_html, rendering_params):
         tool.filterEditorSafety()
 
     # If a section ID is specified, extract that section.
-    # TODO: Pre-extract every section on render? Might be over-optimization
     if rendering_params['section']:
         tool.extractSection(rendering_params['section'])
 
@@ -196,8 +212,10 @@ def _default_locale_fallback(request, document_slug, document_locale):
     fallback_reason = None
 
     try:
-        fallback_doc = Document.objects.get(locale=settings.WIKI_DEFAULT_LANGUAGE,
-                                            slug=document_slug)
+        # Only the metadata is needed to redirect to a translation.
+        fallback_doc = (Document.objects.defer_content()
+                                        .get(locale=settings.WIKI_DEFAULT_LANGUAGE,
+                                             slug=document_slug))
 
         # If there's a translation to the requested locale, take it:
         translation = fallback_doc.translated_to(document_locale)
@@ -213,6 +231,10 @@ def _default_locale_fallback(request, document_slug, document_locale):
             # There is no translation
             # and OK to fall back to parent (parent is approved).
             fallback_reason = 'no_translation'
+
+        if redirect_url is None:
+            # The fallback document is shown instead, and may be rendered.
+            fallback_doc = Document.objects.get(pk=fallback_doc.pk)
     except Document.DoesNotExist:
         pass
 
@@ -229,7 +251,10 @@ def _get_doc_and_fallback_reason(document_locale, document_slug):
     fallback_reason = None
 
     try:
-        doc = Document.objects.get(locale=document_locale, slug=document_slug)
+        # Only the metadata is needed to redirect, or to fall back.
+        doc = (Document.objects.defer_content()
+                               .get(locale=document_locale,
+                                    slug=document_slug))
         if (not doc.current_revision and doc.parent and
                 doc.parent.current_revision):
             # This is a translation but its current_revision is None
@@ -528,6 +553,7 @@ def _document_raw(request, doc, doc_html, rendering_params):
 @accepts_auth_key
 @process_document_path
 @condition(last_modified_func=document_last_modified)
+@cache_anonymous_document
 @newrelic.agent.function_trace()
 def document(request, document_slug, document_locale):
     """
@@ -595,7 +621,8 @@ def document(request, document_slug, document_locale):
     # Don't redirect on redirect=no (like Wikipedia), so we can link from a
     # redirected-to-page back to a "Redirected from..." link, so you can edit
     # the redirect.
-    redirect_url = (None if request.GET.get('redirect') == 'no'
+    redirect_url = (None if (request.GET.get('redirect') == 'no' or
+                             not doc.is_redirect)
                     else doc.get_redirect_url())
 
     if redirect_url and redirect_url != doc.get_absolute_url():
@@ -609,6 +636,10 @@ def document(request, document_slug, document_locale):
             }), extra_tags='wiki_redirect')
         return HttpResponsePermanentRedirect(url)
 
+    if doc._deferred:
+        # The document is shown, and may be rendered.
+        doc = Document.objects.get(pk=doc.pk)
+
     # Read some request params to see what we're supposed to do.
     rendering_params = {}
     for param in ('raw', 'summary', 'include', 'edit_links'):
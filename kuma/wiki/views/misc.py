@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 import newrelic.agent
+from django.conf import settings
 from django.contrib import messages
 from django.http import HttpResponseBadRequest, JsonResponse
 from django.shortcuts import render
@@ -9,10 +10,12 @@ from django.views.decorators.http import require_GET
 from smuggler.forms import ImportForm
 
 from kuma.core.decorators import block_user_agents, superuser_required
+from kuma.core.urlresolvers import reverse
 
 from ..constants import ALLOWED_TAGS, REDIRECT_CONTENT
 from ..decorators import allow_CORS_GET
 from ..models import Document, EditorToolbar
+from ..titles import titles
 
 
 def ckeditor_config(request):
@@ -54,28 +57,25 @@ def autosuggest_documents(request):
                                         'title. For a full document '
                                         'index, see the main page.'))
 
-    # Retrieve all documents that aren't redirects or templates
-    docs = (Document.objects.extra(select={'length': 'Length(slug)'})
-                            .filter(title__icontains=partial_title,
-                                    is_template=0,
-                                    is_redirect=0)
-                            .exclude(slug__icontains='Talk:')  # Remove old talk pages
-                            .order_by('title', 'length'))
-
     # All locales are assumed, unless a specific locale is requested or banned
+    locales = list(settings.MDN_LANGUAGES)
     if locale:
-        docs = docs.filter(locale=locale)
+        locales = [code for code in locales if code == locale]
     if current_locale:
-        docs = docs.filter(locale=request.LANGUAGE_CODE)
+        locales = [code for code in locales if code == request.LANGUAGE_CODE]
     if exclude_current_locale:
-        docs = docs.exclude(locale=request.LANGUAGE_CODE)
-
-    # Generates a list of acceptable docs
-    docs_list = []
-    for doc in docs:
-        data = doc.get_json_data()
-        data['label'] += ' [' + doc.locale + ']'
-        docs_list.append(data)
+        locales = [code for code in locales if code != request.LANGUAGE_CODE]
+
+    # The closest titles of documents that aren't redirects or templates
+    matches = titles.search(partial_title, locales)
+    docs_list = [{
+        'id': pk,
+        'title': title,
+        'label': u'%s [%s]' % (title, doc_locale),
+        'slug': slug,
+        'locale': doc_locale,
+        'url': reverse('wiki.document', locale=doc_locale, args=[slug]),
+    } for pk, title, slug, doc_locale in matches]
 
     return JsonResponse(docs_list, safe=False)
 
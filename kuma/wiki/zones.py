@@ -0,0 +1,107 @@
+"""
+The URL remaps of the document zones with a URL root, compiled into tries of
+path segments kept in process memory, to remap the path of every request in
+as many steps as the path has segments.
+
+Each process compiles the remaps of a locale the first time it's requested,
+from the list cached by DocumentZoneURLRemapsJob. The process saving a zone
+drops its compiled remaps right away, the others check the cached list
+again after a timeout.
+"""
+import time
+
+from .jobs import DocumentZoneURLRemapsJob
+
+
+class ZoneURLRemaps(object):
+    """
+    The remaps of the zones of a locale, as a trie of the path segments of
+    the wiki paths of the zone documents and one of their URL roots.
+
+    Each node of a trie is a dict of its children by path segment, holding
+    under the None key the length of the path ending there along with its
+    remap.
+    """
+    def __init__(self, remaps):
+        self.remaps = remaps
+        self.originals = {}
+        self.roots = {}
+        for original, root in remaps:
+            original, root = original.rstrip('/'), root.rstrip('/')
+            if original and root:
+                self.insert(self.originals, original, (original, root))
+                self.insert(self.roots, root, (original, root))
+
+    @staticmethod
+    def insert(trie, path, remap):
+        node = trie
+        for segment in path.split('/')[1:]:
+            node = node.setdefault(segment, {})
+        # The first of the zones sharing a path wins, as it used to.
+        node.setdefault(None, (len(path), remap))
+
+    @staticmethod
+    def match(trie, segments):
+        """Return the length and the remap of the longest path of the trie
+        which the given path segments start with, if any"""
+        match = None
+        node = trie
+        for segment in segments:
+            node = node.get(segment)
+            if node is None:
+                break
+            match = node.get(None, match)
+        return match
+
+    def remap(self, path):
+        """
+        Return whether to redirect a request for the given path, along with
+        the path to redirect to, or to handle it as a request for, or None
+        when the path isn't remapped:
+
+        * the wiki path of a document in a zone, or below, is redirected to
+          the same path below the URL root of the zone
+        * a path below the URL root of a zone is handled as a request for
+          the same path below the wiki path of the zone document
+        """
+        segments = path.split('/')[1:]
+        match = self.match(self.originals, segments)
+        if match is not None:
+            length, (original, root) = match
+            return True, root + path[length:]
+        match = self.match(self.roots, segments)
+        if match is not None:
+            length, (original, root) = match
+            return False, original + path[length:]
+        return None
+
+
+class ZoneURLRemapsCache(object):
+    """The compiled remaps of the locales requested so far by the current
+    process."""
+    #: Seconds after which to check the cached list of remaps again
+    sync_timeout = 60
+
+    def __init__(self):
+        self.locales = {}
+
+    def get(self, locale):
+        now = time.time()
+        entry = self.locales.get(locale)
+        if entry is None or entry[1] + self.sync_timeout < now:
+            remaps = DocumentZoneURLRemapsJob().get(locale)
+            if entry is None or entry[0].remaps != remaps:
+                compiled = ZoneURLRemaps(remaps)
+            else:
+                compiled = entry[0]
+            entry = self.locales[locale] = (compiled, now)
+        return entry[0]
+
+    def invalidate(self, locale):
+        self.locales.pop(locale, None)
+
+    def clear(self):
+        self.locales.clear()
+
+
+url_remaps = ZoneURLRemapsCache()
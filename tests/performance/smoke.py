@@ -1,4 +1,5 @@
 import os
+import uuid
 
 from locust import HttpLocust, TaskSet, task
 
@@ -54,3 +55,36 @@ class SmokeBehavior(TaskSet):
 
 class SmokeLocust(HttpLocust):
     task_set = SmokeBehavior
+
+
+class DocumentCacheBehavior(TaskSet):
+    """
+    Anonymous views of the same documents, either served from the document
+    response cache or, with a query parameter never requested before,
+    rendered by the view. Locust reports their median and 99th percentile
+    response times side by side, as "cached" and "uncached".
+    """
+    documents = (
+        '/en-US/docs/Web/JavaScript',
+        '/en-US/docs/Web/JavaScript/Reference/Global_Objects/Array/forEach',
+        '/en-US/docs/Web/Guide/CSS/Media_queries',
+    )
+
+    def on_start(self):
+        locust_host = os.environ.get('LOCUST_HOST', 'developer.allizom.org')
+        self.client.headers['Host'] = locust_host
+
+    @task
+    def cached(self):
+        for url in self.documents:
+            self.client.get(url, name='%s (cached)' % url)
+
+    @task
+    def uncached(self):
+        for url in self.documents:
+            self.client.get(url, params={'uncached': uuid.uuid4().hex},
+                            name='%s (uncached)' % url)
+
+
+class DocumentCacheLocust(HttpLocust):
+    task_set = DocumentCacheBehavior